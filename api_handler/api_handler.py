@@ -1,12 +1,90 @@
+import asyncio
 import json
-from api_handler.base_handler import BaseHandler
-from processor.processor import extract_pro_con
-from processor.restaurant_processor import extract_pro_con_restaurant
-from service.const import AVAILABLE_SERVICE_KEYS_LIST
+from api_handler.base_handler import BaseHandler, BatchHandler, StreamingHandler
+from api_handler.job_manager import get_job, submit_job
+from api_handler.utils import (PipelineOverloadedError, get_num_batch_pipelines, get_product_key, get_restaurant_key,
+                               run_in_cache_executor, run_single_flight)
+from processor.comparator import compare_pro_con
+from processor.model_loader import get_models_status, models_ready
+from processor.processor import extract_pro_con, get_cached_pro_con, get_cached_pro_con_batch
+from processor.restaurant_processor import (extract_pro_con_restaurant, get_cached_pro_con_restaurant,
+                                            get_cached_pro_con_restaurant_batch)
+from service.const import (AVAILABLE_SERVICE_KEYS_LIST, CANDIDATE_PROD_LABELS, CANDIDATE_RESTAURANT_LABELS,
+                           MAX_BATCH_SIZE, MAX_COMPARE_SIZE)
+from service.metrics import ADMISSION_DECISIONS, render_metrics
+
+
+async def run_cold_pipeline(key: tuple, func, pipeline_semaphore: asyncio.Semaphore = None, **kwargs):
+    """
+    Runs a cold pipeline through the single flight, subject to admission control.
+    :param key: single-flight key of the request.
+    :param func: the blocking pipeline function to run.
+    :param pipeline_semaphore: the pipeline slots of the batch of the request, if any,
+    acquired before admission so that the items of a batch wait instead of being shed.
+    :param kwargs: keyword arguments for the pipeline function.
+    :return: the pro-con data
+    """
+    if pipeline_semaphore is None:
+        return await run_single_flight(key, func, **kwargs)
+    async with pipeline_semaphore:
+        return await run_single_flight(key, func, **kwargs)
+
+
+async def get_product_pro_con(product_url: str, cached_map: dict = None,
+                              pipeline_semaphore: asyncio.Semaphore = None):
+    """
+    Returns the pro-con data of a product, running the pro-con
+    service if it is not cached.
+    Cached products are always served, while cold ones are subject to
+    admission control and raise PipelineOverloadedError when shed.
+    :param product_url: the url of the product.
+    :param cached_map: map from product name to the cached pro-con data of a batch.
+    If None, look the product up in MongoDB.
+    :param pipeline_semaphore: the pipeline slots of the batch, if any.
+    :return: the product pro-con data
+    """
+    product_key = get_product_key(product_url)
+    if cached_map is None:
+        pro_con_data = await run_in_cache_executor(get_cached_pro_con, url=product_url)
+    else:
+        pro_con_data = cached_map.get(product_key[1])
+    if pro_con_data is not None:
+        ADMISSION_DECISIONS.inc(pipeline=product_key[0], decision="cached")
+        return pro_con_data
+    # The leader looks the cache up again, a pipeline that completed since the lookup above is not run twice
+    return await run_cold_pipeline(product_key, extract_pro_con, pipeline_semaphore, url=product_url)
+
+
+async def get_restaurant_pro_con(restaurant_name: str, city: str, max_num_reviews: int, cached_map: dict = None,
+                                 pipeline_semaphore: asyncio.Semaphore = None):
+    """
+    Returns the pro-con data of a restaurant, running the pro-con
+    service if it is not cached.
+    Cached restaurants are always served, while cold ones are subject to
+    admission control and raise PipelineOverloadedError when shed.
+    :param restaurant_name: the name of the restaurant.
+    :param city: the city of the restaurant.
+    :param max_num_reviews: maximum number of reviews to consider.
+    :param cached_map: map from (name, city) to the cached pro-con data of a batch.
+    If None, look the restaurant up in MongoDB.
+    :param pipeline_semaphore: the pipeline slots of the batch, if any.
+    :return: the restaurant pro-con data
+    """
+    restaurant_key = get_restaurant_key(name=restaurant_name, city=city)
+    if cached_map is None:
+        pro_con_data = await run_in_cache_executor(get_cached_pro_con_restaurant, name=restaurant_name, city=city)
+    else:
+        pro_con_data = cached_map.get((restaurant_name, city))
+    if pro_con_data is not None:
+        ADMISSION_DECISIONS.inc(pipeline=restaurant_key[0], decision="cached")
+        return pro_con_data
+    # The leader looks the cache up again, a pipeline that completed since the lookup above is not run twice
+    return await run_cold_pipeline(restaurant_key, extract_pro_con_restaurant, pipeline_semaphore,
+                                   name=restaurant_name, city=city, max_num_reviews=max_num_reviews)
 
 
 class ProConHandler(BaseHandler):
-    def post(self):
+    async def post(self):
 
         req_body = json.loads(self.request.body)
         try:
@@ -20,8 +98,12 @@ class ProConHandler(BaseHandler):
             self.reply_client(status_code=400, data={})
             return
 
-        # Run pro-con service
-        pro_con_data = extract_pro_con(url=product_url)
+        # Run pro-con service, sharing the result with concurrent requests for the same product
+        try:
+            pro_con_data = await get_product_pro_con(product_url)
+        except PipelineOverloadedError:
+            self.reply_overloaded()
+            return
         if not pro_con_data:
             self.reply_client(status_code=400, data={})
             return
@@ -31,7 +113,7 @@ class ProConHandler(BaseHandler):
 
 
 class ProConRestaurantHandler(BaseHandler):
-    def post(self):
+    async def post(self):
 
         req_body = json.loads(self.request.body)
         try:
@@ -47,11 +129,266 @@ class ProConRestaurantHandler(BaseHandler):
             self.reply_client(status_code=400, data={})
             return
 
-        # Run pro-con service for restaurants
-        pro_con_data = extract_pro_con_restaurant(name=restaurant_name, city=city, max_num_reviews=max_num_reviews)
+        # Run pro-con service for restaurants, sharing the result with concurrent requests for the same restaurant
+        try:
+            pro_con_data = await get_restaurant_pro_con(restaurant_name, city, max_num_reviews)
+        except PipelineOverloadedError:
+            self.reply_overloaded()
+            return
         if not pro_con_data:
             self.reply_client(status_code=400, data={})
             return
 
         # Reply back to client
         self.reply_client(status_code=200, data=pro_con_data)
+
+
+class ProConJobHandler(BaseHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            product_url = req_body["url"]
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Enqueue the pro-con job, cached products complete right away
+        cached_data = await run_in_cache_executor(get_cached_pro_con, url=product_url)
+        try:
+            job = submit_job(get_product_key(product_url), extract_pro_con, cached_result=cached_data,
+                             url=product_url)
+        except PipelineOverloadedError:
+            self.reply_overloaded()
+            return
+
+        # Reply back to client with the job id
+        self.reply_client(status_code=202, data=job.to_dict())
+
+
+class ProConRestaurantJobHandler(BaseHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            restaurant_name = req_body["restaurant_name"]
+            city = req_body["city"]
+            max_num_reviews = req_body["max_num_reviews"]
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Enqueue the pro-con job for restaurants, cached restaurants complete right away
+        cached_data = await run_in_cache_executor(get_cached_pro_con_restaurant, name=restaurant_name, city=city)
+        try:
+            job = submit_job(get_restaurant_key(name=restaurant_name, city=city), extract_pro_con_restaurant,
+                             cached_result=cached_data, name=restaurant_name, city=city,
+                             max_num_reviews=max_num_reviews)
+        except PipelineOverloadedError:
+            self.reply_overloaded()
+            return
+
+        # Reply back to client with the job id
+        self.reply_client(status_code=202, data=job.to_dict())
+
+
+class JobStatusHandler(BaseHandler):
+    def initialize(self, pipeline: str):
+        self.pipeline = pipeline
+
+    def get(self, job_id: str):
+
+        key = self.get_argument("key", default="", strip=True)
+        if key not in AVAILABLE_SERVICE_KEYS_LIST:
+            self.reply_client(status_code=400, data={})
+            return
+
+        job = get_job(job_id)
+        if job is None or job.pipeline != self.pipeline:
+            self.reply_client(status_code=404, data={})
+            return
+
+        # Reply back to client with status, stage and (when done) result of the job
+        self.reply_client(status_code=200, data=job.to_dict())
+
+
+class ProConStreamHandler(StreamingHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            product_url = req_body["url"]
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Run pro-con service streaming each stage as soon as it completes
+        cached_data = await run_in_cache_executor(get_cached_pro_con, url=product_url)
+        await self.stream_pipeline(get_product_key(product_url), cached_data, extract_pro_con, url=product_url)
+
+
+class ProConRestaurantStreamHandler(StreamingHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            restaurant_name = req_body["restaurant_name"]
+            city = req_body["city"]
+            max_num_reviews = req_body["max_num_reviews"]
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Run pro-con service for restaurants streaming each stage as soon as it completes
+        cached_data = await run_in_cache_executor(get_cached_pro_con_restaurant, name=restaurant_name, city=city)
+        await self.stream_pipeline(get_restaurant_key(name=restaurant_name, city=city), cached_data,
+                                   extract_pro_con_restaurant, name=restaurant_name, city=city,
+                                   max_num_reviews=max_num_reviews)
+
+
+class ProConBatchHandler(BatchHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            product_url_list = [str(product_url) for product_url in req_body["urls"]]
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST or len(product_url_list) > MAX_BATCH_SIZE:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Fetch all the cached products at once, then run pro-con service for the others
+        # The cold items share a few pipeline slots, waiting for them instead of being shed
+        cached_map = await run_in_cache_executor(get_cached_pro_con_batch, urls=product_url_list)
+        pipeline_semaphore = asyncio.Semaphore(get_num_batch_pipelines())
+        item_list = list()
+        for index, product_url in enumerate(product_url_list):
+            item = {"index": index, "url": product_url}
+            item_list.append((item, get_product_pro_con(product_url, cached_map, pipeline_semaphore)))
+
+        # Stream the results back to the client as they complete
+        await self.stream_items(item_list)
+
+
+class ProConRestaurantBatchHandler(BatchHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            restaurant_list = [(restaurant["restaurant_name"], restaurant["city"], restaurant["max_num_reviews"])
+                               for restaurant in req_body["restaurants"]]
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST or len(restaurant_list) > MAX_BATCH_SIZE:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Fetch all the cached restaurants at once, then run pro-con service for the others
+        name_city_list = [(restaurant_name, city) for restaurant_name, city, _ in restaurant_list]
+        # The cold items share a few pipeline slots, waiting for them instead of being shed
+        cached_map = await run_in_cache_executor(get_cached_pro_con_restaurant_batch, name_city_list=name_city_list)
+        pipeline_semaphore = asyncio.Semaphore(get_num_batch_pipelines())
+        item_list = list()
+        for index, (restaurant_name, city, max_num_reviews) in enumerate(restaurant_list):
+            item = {"index": index, "restaurant_name": restaurant_name, "city": city}
+            item_list.append((item, get_restaurant_pro_con(restaurant_name, city, max_num_reviews, cached_map,
+                                                           pipeline_semaphore)))
+
+        # Stream the results back to the client as they complete
+        await self.stream_items(item_list)
+
+
+class CompareHandler(BaseHandler):
+    async def post(self):
+
+        req_body = json.loads(self.request.body)
+        try:
+            key = self.get_argument("key", default="", strip=True)
+            if "urls" in req_body:
+                product_url_list = [str(product_url) for product_url in req_body["urls"]]
+                num_items = len(product_url_list)
+            else:
+                restaurant_list = [(restaurant["restaurant_name"], restaurant["city"],
+                                    restaurant["max_num_reviews"]) for restaurant in req_body["restaurants"]]
+                num_items = len(restaurant_list)
+        except:
+            self.reply_client(status_code=400, data={})
+            return
+
+        if key not in AVAILABLE_SERVICE_KEYS_LIST or num_items < 2 or num_items > MAX_COMPARE_SIZE:
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Fetch all the cached items at once, then run pro-con service concurrently for the others
+        try:
+            if "urls" in req_body:
+                labels = CANDIDATE_PROD_LABELS
+                cached_map = await run_in_cache_executor(get_cached_pro_con_batch, urls=product_url_list)
+                pro_con_data_list = await asyncio.gather(*[get_product_pro_con(product_url, cached_map)
+                                                           for product_url in product_url_list])
+            else:
+                labels = CANDIDATE_RESTAURANT_LABELS
+                name_city_list = [(restaurant_name, city) for restaurant_name, city, _ in restaurant_list]
+                cached_map = await run_in_cache_executor(get_cached_pro_con_restaurant_batch,
+                                                         name_city_list=name_city_list)
+                pro_con_data_list = await asyncio.gather(*[get_restaurant_pro_con(restaurant_name, city,
+                                                                                  max_num_reviews, cached_map)
+                                                           for restaurant_name, city, max_num_reviews in
+                                                           restaurant_list])
+        except PipelineOverloadedError:
+            self.reply_overloaded()
+            return
+        if not all(pro_con_data_list):
+            self.reply_client(status_code=400, data={})
+            return
+
+        # Reply back to client with the side-by-side comparison
+        comparison_data = compare_pro_con(pro_con_data_list, labels)
+        self.reply_client(status_code=200, data=comparison_data)
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        # Export the metrics of this process in the Prometheus text format
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render_metrics())
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        # Liveness: the IOLoop is serving requests
+        self.reply_client(status_code=200, data={"status": "ok"})
+
+
+class ReadinessHandler(BaseHandler):
+    def get(self):
+        # Readiness: the models needed by the configured backend are loaded
+        self.set_status(200 if models_ready() else 503)
+        self.write(get_models_status())
@@ -1,11 +1,26 @@
+import asyncio
+import json
 import logging
+import tornado.iostream
 import tornado.web
+from api_handler.utils import PipelineOverloadedError, admit_cold_pipeline, glb_in_flight_map, run_single_flight
+from service.const import PIPELINE_RETRY_AFTER
+from service.metrics import ADMISSION_DECISIONS, HTTP_REQUESTS_IN_FLIGHT
+
+# Pipeline stages streamed to the client, in order of completion
+STREAM_STAGES = ["meta", "summary", "sentiment_map", "pro_con_map", "category_map", "gen_pro_con_map"]
 
 
 class BaseHandler(tornado.web.RequestHandler):
     def data_received(self, chunk: bytes):
         pass
 
+    def prepare(self):
+        HTTP_REQUESTS_IN_FLIGHT.inc(handler=type(self).__name__)
+
+    def on_finish(self):
+        HTTP_REQUESTS_IN_FLIGHT.dec(handler=type(self).__name__)
+
     def set_default_headers(self):
         # TODO limit origin to load balancer IP
         self.set_header("Access-Control-Allow-Origin", "*")
@@ -13,8 +28,142 @@ class BaseHandler(tornado.web.RequestHandler):
         self.set_header('Access-Control-Allow-Methods', '*')
 
     def reply_client(self, status_code: int, data: dict):
-        if status_code != 200:
+        if status_code < 200 or status_code >= 300:
             logging.error(f"BaseHandler::reply_client - error {status_code}")
             self.send_error(status_code)
         else:
+            self.set_status(status_code)
             self.write(data)
+
+    def reply_overloaded(self):
+        # Shed the request with a fast 503, send_error would clear the Retry-After header
+        logging.warning(f"BaseHandler::reply_overloaded - shedding {type(self).__name__} request")
+        self.set_status(503)
+        self.set_header("Retry-After", str(PIPELINE_RETRY_AFTER))
+        self.finish()
+
+
+class StreamingHandler(BaseHandler):
+    """
+    Handler streaming the output of each pipeline stage
+    to the client as Server-Sent Events.
+    """
+    def write_event(self, event: str, data):
+        self.write(f"event: {event}\ndata: {json.dumps(data)}\n\n")
+
+    def write_cached_events(self, data: dict):
+        # Cached data is complete, stream it stage by stage anyway
+        summary = {key: value for key, value in data.items() if key not in STREAM_STAGES}
+        for stage in STREAM_STAGES:
+            self.write_event(stage, summary if stage == "summary" else data.get(stage))
+
+    async def stream_pipeline(self, key: tuple, cached_data, func, **kwargs):
+        """
+        Streams one event per completed stage of the pipeline, followed by
+        a final "done" event with the full result (or an "error" event).
+        Concurrent requests with the same key share a single pipeline run.
+        Cold pipelines are subject to admission control: if the service is
+        overloaded, a 503 is sent before streaming anything.
+        :param key: single-flight key of the request, the first element is the pipeline name.
+        :param cached_data: the cached pro-con data, or None if not cached.
+        :param func: the blocking pipeline function to run, it must accept the on_stage callback.
+        :param kwargs: keyword arguments for the pipeline function.
+        """
+        # Only the leader of a single flight is subject to admission control
+        if cached_data is None and key not in glb_in_flight_map:
+            try:
+                admit_cold_pipeline(key[0])
+            except PipelineOverloadedError:
+                self.reply_overloaded()
+                return
+        elif cached_data is not None:
+            ADMISSION_DECISIONS.inc(pipeline=key[0], decision="cached")
+
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        try:
+            if cached_data is not None:
+                self.write_cached_events(cached_data)
+                self.write_event("done", cached_data)
+                self.finish()
+                return
+
+            # Stage outputs are forwarded on the IOLoop by the single flight, a stream joining
+            # a pipeline in flight first gets the stages already completed
+            stage_queue = asyncio.Queue()
+
+            def on_stage(stage: str, data):
+                stage_queue.put_nowait((stage, data))
+
+            pipeline_future = asyncio.ensure_future(run_single_flight(key, func, on_stage=on_stage,
+                                                                      use_admission_control=False, **kwargs))
+            pipeline_future.add_done_callback(lambda _: stage_queue.put_nowait(None))
+            while True:
+                stage_data = await stage_queue.get()
+                if stage_data is None:
+                    break
+                stage, data = stage_data
+                if stage == "cache":
+                    self.write_cached_events(data)
+                else:
+                    self.write_event(stage, data)
+                await self.flush()
+
+            try:
+                pro_con_data = pipeline_future.result()
+            except Exception as e:
+                logging.exception(e)
+                pro_con_data = {}
+
+            if pro_con_data:
+                self.write_event("done", pro_con_data)
+            else:
+                self.write_event("error", {})
+            self.finish()
+        except tornado.iostream.StreamClosedError:
+            # The client went away, the pipeline still completes and caches its result
+            logging.info("StreamingHandler::stream_pipeline - client disconnected")
+
+
+class BatchHandler(BaseHandler):
+    """
+    Handler streaming the per-item results of a batch request
+    to the client as newline-delimited JSON, in order of completion.
+    """
+    async def run_item(self, item: dict, pro_con_awaitable) -> dict:
+        try:
+            pro_con_data = await pro_con_awaitable
+        except PipelineOverloadedError as e:
+            item["status"] = 503
+            item["error"] = str(e)
+            return item
+        except Exception as e:
+            logging.exception(e)
+            item["status"] = 500
+            item["error"] = str(e)
+            return item
+
+        if pro_con_data:
+            item["status"] = 200
+            item["data"] = pro_con_data
+        else:
+            item["status"] = 400
+            item["error"] = "No pro-con data found"
+        return item
+
+    async def stream_items(self, item_list: list):
+        """
+        Awaits the items of the batch concurrently and streams
+        one JSON line per item as soon as it completes.
+        :param item_list: list of (item description, awaitable returning the item pro-con data).
+        """
+        self.set_header("Content-Type", "application/x-ndjson")
+        item_futures = [self.run_item(item, pro_con_awaitable) for item, pro_con_awaitable in item_list]
+        try:
+            for item_future in asyncio.as_completed(item_futures):
+                item = await item_future
+                self.write(json.dumps(item) + "\n")
+                await self.flush()
+            self.finish()
+        except tornado.iostream.StreamClosedError:
+            logging.info("BatchHandler::stream_items - client disconnected")
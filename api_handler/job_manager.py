@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+import uuid
+from api_handler.utils import PipelineOverloadedError, glb_in_flight_map, run_single_flight
+from service.const import *
+from service.metrics import ADMISSION_DECISIONS
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+
+class Job:
+    """
+    An analysis job, i.e., a pro-con pipeline run in the background
+    whose status and result are polled by the client.
+    """
+    def __init__(self, pipeline: str):
+        self.job_id = uuid.uuid4().hex
+        self.pipeline = pipeline
+        self.status = JOB_STATUS_QUEUED
+        self.stage = ""
+        self.result = None
+        self.error = ""
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def set_stage(self, stage: str, data):
+        # Called (on the IOLoop thread) whenever a stage of the pipeline run for the job completes
+        self.stage = stage
+
+    def complete(self, result: dict):
+        if result:
+            self.status = JOB_STATUS_DONE
+            self.result = result
+        else:
+            self.status = JOB_STATUS_FAILED
+            self.error = "No pro-con data found"
+        self.finished_at = time.time()
+
+    def fail(self, error: str):
+        self.status = JOB_STATUS_FAILED
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        job_data = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+        }
+        if self.status == JOB_STATUS_DONE:
+            job_data["result"] = self.result
+        if self.status == JOB_STATUS_FAILED:
+            job_data["error"] = self.error
+        return job_data
+
+
+# Jobs of this process by id.
+# Note: jobs are only accessed from the IOLoop thread, hence no locking
+glb_job_map = dict()
+glb_job_queue = None
+
+
+async def job_worker(job_queue: asyncio.Queue):
+    """
+    Each of the MAX_CONCURRENT_JOBS workers drains the job queue, running one job at a time.
+    :param job_queue: the queue of (job, key, pipeline function, kwargs) to run.
+    """
+    while True:
+        job, key, func, kwargs = await job_queue.get()
+        job.status = JOB_STATUS_RUNNING
+        try:
+            # Jobs are already bounded by the job queue, wait for a pipeline slot.
+            # Jobs joining a pipeline in flight get its stages too, and are counted as joined by the single flight
+            if key not in glb_in_flight_map:
+                ADMISSION_DECISIONS.inc(pipeline=key[0], decision="admitted")
+            result = await run_single_flight(key, func, on_stage=job.set_stage, use_admission_control=False,
+                                             **kwargs)
+            job.complete(result)
+        except Exception as e:
+            logging.exception(e)
+            job.fail(str(e))
+        finally:
+            job_queue.task_done()
+
+
+def get_job_queue() -> asyncio.Queue:
+    """
+    Returns the job queue, starting the pool of job workers draining it on first use.
+    :return: the job queue
+    """
+    global glb_job_queue
+    if glb_job_queue is None:
+        glb_job_queue = asyncio.Queue()
+        for _ in range(MAX_CONCURRENT_JOBS):
+            asyncio.ensure_future(job_worker(glb_job_queue))
+    return glb_job_queue
+
+
+def evict_expired_jobs():
+    now = time.time()
+    expired_job_ids = [job_id for job_id, job in glb_job_map.items()
+                       if job.finished_at is not None and now - job.finished_at > JOB_RESULT_TTL]
+    for job_id in expired_job_ids:
+        del glb_job_map[job_id]
+
+
+def submit_job(key: tuple, func, cached_result: dict = None, **kwargs) -> Job:
+    """
+    Creates a new job for the given pipeline.
+    If the result is already cached, the job completes inline,
+    otherwise it is queued for the job workers.
+    Raises PipelineOverloadedError if the job queue is full.
+    :param key: single-flight key of the request, the first element is the pipeline name.
+    :param func: the blocking pipeline function to run.
+    :param cached_result: the result fetched from the cache, if any.
+    :param kwargs: keyword arguments for the pipeline function.
+    :return: the created job
+    """
+    evict_expired_jobs()
+    if cached_result is None and get_job_queue().qsize() >= MAX_PIPELINE_QUEUE_LENGTH:
+        ADMISSION_DECISIONS.inc(pipeline=key[0], decision="shed")
+        raise PipelineOverloadedError(f"{MAX_PIPELINE_QUEUE_LENGTH} {key[0]} jobs already queued")
+
+    job = Job(pipeline=key[0])
+    glb_job_map[job.job_id] = job
+    if cached_result is not None:
+        ADMISSION_DECISIONS.inc(pipeline=key[0], decision="cached")
+        job.set_stage("cache", cached_result)
+        job.complete(cached_result)
+    else:
+        # The worker picking the job up counts it as admitted or joined
+        ADMISSION_DECISIONS.inc(pipeline=key[0], decision="queued")
+        get_job_queue().put_nowait((job, key, func, kwargs))
+    return job
+
+
+def get_job(job_id: str):
+    return glb_job_map.get(job_id)
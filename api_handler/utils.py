@@ -0,0 +1,217 @@
+import asyncio
+import copy
+import logging
+import tornado.ioloop
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from processor.utils import get_product_name_from_url
+from service.const import *
+from service.metrics import ADMISSION_DECISIONS, PIPELINE_QUEUE_DEPTH, PIPELINES_IN_FLIGHT, SINGLE_FLIGHT_REQUESTS
+
+
+class PipelineOverloadedError(Exception):
+    """
+    Raised when a cold pipeline is shed because too many are already queued.
+    """
+    pass
+
+
+# Bounded executor running the blocking pro-con pipelines (scraping, HF/OpenAI calls, MongoDB)
+# so that the IOLoop stays responsive and concurrent requests overlap their network waits
+glb_pipeline_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PIPELINES, thread_name_prefix="pro_con")
+
+# Separate executor for the MongoDB cache lookups, so that cached requests never wait behind cold pipelines
+glb_cache_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CACHE_LOOKUPS, thread_name_prefix="cache")
+
+# Pipelines currently running, keyed by canonical product/restaurant key.
+# Only accessed from the IOLoop thread, hence no locking
+glb_in_flight_map = dict()
+
+# Stages completed so far and stage listeners of the pipelines in flight, keyed as glb_in_flight_map.
+# Only accessed from the IOLoop thread, hence no locking
+glb_stage_history_map = dict()
+glb_stage_listener_map = dict()
+
+# Number of cold pipelines submitted to the pipeline executor, either running or queued
+glb_num_cold_pipelines = 0
+
+
+async def run_in_pipeline_executor(func, *args, **kwargs):
+    """
+    Runs the given blocking function on the pipeline executor
+    and waits for its result without blocking the IOLoop.
+    :param func: the blocking function to run.
+    :param args: positional arguments for the function.
+    :param kwargs: keyword arguments for the function.
+    :return: the value returned by the function
+    """
+    return await tornado.ioloop.IOLoop.current().run_in_executor(glb_pipeline_executor,
+                                                                  partial(func, *args, **kwargs))
+
+
+async def run_in_cache_executor(func, *args, **kwargs):
+    """
+    Runs the given blocking cache lookup on the cache executor
+    and waits for its result without blocking the IOLoop.
+    :param func: the blocking function to run.
+    :param args: positional arguments for the function.
+    :param kwargs: keyword arguments for the function.
+    :return: the value returned by the function
+    """
+    return await tornado.ioloop.IOLoop.current().run_in_executor(glb_cache_executor, partial(func, *args, **kwargs))
+
+
+def admit_cold_pipeline(pipeline: str):
+    """
+    Admission control for cold pipelines: raises if the queue
+    in front of the pipeline executor is full.
+    :param pipeline: the name of the pipeline.
+    """
+    num_queued = max(0, glb_num_cold_pipelines - MAX_CONCURRENT_PIPELINES)
+    if num_queued >= MAX_PIPELINE_QUEUE_LENGTH:
+        ADMISSION_DECISIONS.inc(pipeline=pipeline, decision="shed")
+        raise PipelineOverloadedError(f"{num_queued} {pipeline} pipelines already queued")
+    ADMISSION_DECISIONS.inc(pipeline=pipeline, decision="admitted")
+
+
+def get_num_batch_pipelines() -> int:
+    """
+    Number of cold pipelines a batch request runs at once, its other cold items wait for one of them
+    to complete instead of being shed: the free pipeline slots (running or queued), at most
+    MAX_CONCURRENT_PIPELINES so that the queue keeps room for the other requests, at least one.
+    :return: the number of pipelines
+    """
+    num_free_slots = MAX_CONCURRENT_PIPELINES + MAX_PIPELINE_QUEUE_LENGTH - glb_num_cold_pipelines
+    return max(1, min(MAX_CONCURRENT_PIPELINES, num_free_slots))
+
+
+def submit_cold_pipeline(func, *args, **kwargs) -> asyncio.Future:
+    """
+    Submits the given blocking pipeline to the pipeline executor,
+    keeping track of the number of running/queued cold pipelines.
+    :param func: the blocking pipeline function to run.
+    :param args: positional arguments for the function.
+    :param kwargs: keyword arguments for the function.
+    :return: the future of the value returned by the function
+    """
+    global glb_num_cold_pipelines
+    glb_num_cold_pipelines += 1
+    PIPELINE_QUEUE_DEPTH.set(max(0, glb_num_cold_pipelines - MAX_CONCURRENT_PIPELINES))
+
+    def on_done(_):
+        global glb_num_cold_pipelines
+        glb_num_cold_pipelines -= 1
+        PIPELINE_QUEUE_DEPTH.set(max(0, glb_num_cold_pipelines - MAX_CONCURRENT_PIPELINES))
+
+    future = asyncio.ensure_future(run_in_pipeline_executor(func, *args, **kwargs))
+    future.add_done_callback(on_done)
+    return future
+
+
+def notify_stage_listeners(key: tuple, stage: str, data):
+    """
+    Forwards a completed stage of the pipeline in flight for the given key to all its listeners.
+    Runs on the IOLoop thread.
+    :param key: canonical key of the pipeline.
+    :param stage: the name of the completed stage.
+    :param data: the output of the stage.
+    """
+    stage_history = glb_stage_history_map.get(key)
+    if stage_history is None:
+        return
+    stage_history.append((stage, data))
+    for on_stage in list(glb_stage_listener_map[key]):
+        try:
+            on_stage(stage, data)
+        except Exception as e:
+            logging.exception(e)
+
+
+def add_stage_listener(key: tuple, on_stage):
+    """
+    Registers a stage listener of the pipeline in flight for the given key,
+    replaying the stages already completed.
+    :param key: canonical key of the pipeline.
+    :param on_stage: callable invoked (on the IOLoop thread) with the name and output of each completed stage.
+    """
+    for stage, data in glb_stage_history_map[key]:
+        on_stage(stage, data)
+    glb_stage_listener_map[key].append(on_stage)
+
+
+async def run_single_flight(key: tuple, func, *args, on_stage=None, use_admission_control: bool = True, **kwargs):
+    """
+    Runs the given blocking pipeline on the pipeline executor, coalescing
+    concurrent calls with the same key: the first caller (leader) runs the
+    pipeline while the following ones (followers) await the leader's result.
+    Followers are always admitted, leaders are subject to admission control.
+    The stages completed by the leader's pipeline are forwarded to the
+    on_stage callbacks of the leader and of all the followers.
+    :param key: canonical key of the request, the first element is the pipeline name.
+    :param func: the blocking pipeline function to run, it must accept the on_stage callback.
+    :param args: positional arguments for the function.
+    :param on_stage: optional callable invoked (on the IOLoop thread) with the name and output
+    of each completed stage, the stages completed before a follower joins are replayed.
+    :param use_admission_control: if True, raise PipelineOverloadedError instead
+    of queueing a new pipeline when the queue is full.
+    :param kwargs: keyword arguments for the function.
+    :return: a private copy of the value returned by the function
+    """
+    future = glb_in_flight_map.get(key)
+    if future is None:
+        if use_admission_control:
+            admit_cold_pipeline(key[0])
+        SINGLE_FLIGHT_REQUESTS.inc(pipeline=key[0], role="leader")
+        PIPELINES_IN_FLIGHT.inc(pipeline=key[0])
+        glb_stage_history_map[key] = list()
+        glb_stage_listener_map[key] = list()
+
+        # Stages complete on the executor thread, hop to the IOLoop to notify the listeners.
+        # The callbacks run in order, so all the stages are notified before the future completes
+        io_loop = tornado.ioloop.IOLoop.current()
+
+        def on_pipeline_stage(stage: str, data):
+            io_loop.add_callback(notify_stage_listeners, key, stage, data)
+
+        future = submit_cold_pipeline(func, *args, on_stage=on_pipeline_stage, **kwargs)
+        glb_in_flight_map[key] = future
+
+        def on_done(_):
+            glb_in_flight_map.pop(key, None)
+            glb_stage_history_map.pop(key, None)
+            glb_stage_listener_map.pop(key, None)
+            PIPELINES_IN_FLIGHT.dec(pipeline=key[0])
+
+        future.add_done_callback(on_done)
+    else:
+        SINGLE_FLIGHT_REQUESTS.inc(pipeline=key[0], role="follower")
+        ADMISSION_DECISIONS.inc(pipeline=key[0], decision="joined")
+        logging.info(f"run_single_flight - joining in-flight pipeline for {key}")
+
+    if on_stage is not None:
+        add_stage_listener(key, on_stage)
+
+    # Shield the shared future so that a cancelled caller does not cancel the others
+    result = await asyncio.shield(future)
+    return copy.deepcopy(result)
+
+
+def get_product_key(url: str) -> tuple:
+    """
+    Returns the single-flight key of an Amazon product, i.e.,
+    the same product name used to cache it on MongoDB.
+    :param url: the url of the product.
+    :return: the product key
+    """
+    return "pro_con", get_product_name_from_url(url)
+
+
+def get_restaurant_key(name: str, city: str) -> tuple:
+    """
+    Returns the single-flight key of a restaurant, i.e.,
+    the same name/city pair used to cache it on MongoDB.
+    :param name: the name of the restaurant.
+    :param city: the city of the restaurant.
+    :return: the restaurant key
+    """
+    return "pro_con_restaurant", name, city
@@ -3,6 +3,9 @@ from processor.language_models import pin_hugging_face_models
 from server.server_runner import run_server
 
 SERVER_PORT = 8001
+# Number of server worker processes sharing the port and the loaded models,
+# 0 starts one worker per CPU core
+SERVER_NUM_PROCESSES = 1
 
 # Set logger
 root = logging.getLogger()
@@ -14,7 +17,7 @@ def procon_service():
     pin_hugging_face_models()
 
     # Forward call to the server runner
-    run_server(SERVER_PORT)
+    run_server(SERVER_PORT, SERVER_NUM_PROCESSES)
 
 
 if __name__ == '__main__':
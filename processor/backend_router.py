@@ -0,0 +1,299 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from processor.hf_api import UnavailableOutput, run_hf_coroutine, submit_hf_coroutine
+from service.const import *
+from service.metrics import ROUTER_BACKEND_LATENCY, ROUTER_CIRCUIT_OPEN, ROUTER_DECISIONS
+
+REMOTE_BACKEND = "huggingface"
+LOCAL_BACKEND = "local"
+
+
+def is_valid_output_list(output_list, input_list: list) -> bool:
+    # One result per input. Inputs rejected by the model get an empty result and are run locally, they do not
+    # fail the batch, while inputs failed by server or network errors do
+    return isinstance(output_list, list) and len(output_list) == len(input_list) and \
+        not any(isinstance(output, UnavailableOutput) for output in output_list)
+
+
+class BackendStats:
+    """
+    Rolling latency and error rate over the latest window_size batches run by a backend for a task.
+    """
+
+    def __init__(self, window_size: int = ROUTER_WINDOW_SIZE):
+        self._sample_list = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._sample_list.append((latency, ok))
+
+    def clear(self):
+        with self._lock:
+            self._sample_list.clear()
+
+    def num_samples(self) -> int:
+        with self._lock:
+            return len(self._sample_list)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._sample_list:
+                return 0.0
+            return sum(1 for _, ok in self._sample_list if not ok) / len(self._sample_list)
+
+    def latency_percentile(self, perc: float):
+        """
+        Latency percentile of the successful batches.
+        :param perc: the percentile, in [0-100].
+        :return: the latency (in sec.), or None if no batch succeeded
+        """
+        with self._lock:
+            latency_list = sorted(latency for latency, ok in self._sample_list if ok)
+        if not latency_list:
+            return None
+        return latency_list[max(0, math.ceil(perc / 100 * len(latency_list)) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Circuit of the HuggingFace API for a task. Closed, the inferences go to the API. It opens when the
+    error rate of the API exceeds ROUTER_ERROR_RATE_THRESHOLD and the inferences fail over to the local model
+    for ROUTER_CIRCUIT_OPEN_TIME sec. Then it is half-open: a single probe batch goes to the API,
+    closing the circuit if it succeeds and opening it again otherwise.
+    """
+
+    def __init__(self, task: str, stats: BackendStats, open_time: float = ROUTER_CIRCUIT_OPEN_TIME):
+        self.task = task
+        self.stats = stats
+        self.open_time = open_time
+        self.state = "closed"
+        self._open_time = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        Whether the next batch can go to the API.
+        :return: True if the circuit is closed or the batch is the probe of a half-open circuit
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._open_time >= self.open_time:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == "half_open":
+                if ok:
+                    # The errors before the circuit opened are not representative anymore
+                    self.state = "closed"
+                    self.stats.clear()
+                else:
+                    self._open()
+            elif self.state == "closed" and not ok and self.stats.num_samples() >= ROUTER_MIN_SAMPLES \
+                    and self.stats.error_rate() >= ROUTER_ERROR_RATE_THRESHOLD:
+                self._open()
+            ROUTER_CIRCUIT_OPEN.set(int(self.state != "closed"), task=self.task)
+
+    def _open(self):
+        logging.warning(f"Opening the HuggingFace API circuit of {self.task}")
+        self.state = "open"
+        self._open_time = time.monotonic()
+
+
+class BackendRouter:
+    """
+    Routes the batches of model inferences between the HuggingFace API and the local models
+    by the rolling latency and error rate of each backend for each task.
+    The batches go to the API unless its circuit is open. If a batch takes longer than the p95 latency
+    of the API, it is hedged (at most max_hedges batches at once): the local model runs it too and the first
+    successful result is used. The inputs failed by the API are run by the local model.
+    The API calls run on the loop of the async HuggingFace client. The local model of each task runs one batch
+    at a time (each batch uses all the inference threads), be it a failover, a hedge or a fallback.
+    """
+
+    def __init__(self, use_hedging: bool = USE_HEDGED_REQUESTS, hedge_min_delay: float = ROUTER_HEDGE_MIN_DELAY,
+                 max_hedges: int = ROUTER_MAX_CONCURRENT_HEDGES):
+        self.use_hedging = use_hedging
+        self.hedge_min_delay = hedge_min_delay
+        self.max_hedges = max_hedges
+        self._stats_map = dict()
+        self._circuit_map = dict()
+        self._local_executor_map = dict()
+        self._executor_pid = None
+        self._hedge_semaphore = None
+        self._lock = threading.Lock()
+
+    def get_stats(self, backend: str, task: str) -> BackendStats:
+        with self._lock:
+            if (backend, task) not in self._stats_map:
+                self._stats_map[(backend, task)] = BackendStats()
+            return self._stats_map[(backend, task)]
+
+    def get_circuit(self, task: str) -> CircuitBreaker:
+        stats = self.get_stats(REMOTE_BACKEND, task)
+        with self._lock:
+            if task not in self._circuit_map:
+                self._circuit_map[task] = CircuitBreaker(task, stats)
+            return self._circuit_map[task]
+
+    def get_local_executor(self, task: str) -> ThreadPoolExecutor:
+        # Threads do not survive fork, each server worker makes its own executors and caps its own hedges
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._local_executor_map = dict()
+                self._hedge_semaphore = threading.BoundedSemaphore(self.max_hedges)
+                self._executor_pid = os.getpid()
+            if task not in self._local_executor_map:
+                self._local_executor_map[task] = ThreadPoolExecutor(max_workers=1,
+                                                                    thread_name_prefix=f"router-{task}")
+            return self._local_executor_map[task]
+
+    def run_local(self, task: str, local_func, input_list: list, *params) -> list:
+        """
+        Runs a batch on the local model of the task, after the batches already queued for it.
+        :return: the outputs
+        """
+        return self.get_local_executor(task).submit(self.run_backend, LOCAL_BACKEND, task, local_func, input_list,
+                                                    *params).result()[0]
+
+    def record_batch(self, backend: str, task: str, latency: float, ok: bool):
+        self.get_stats(backend, task).record(latency, ok)
+        if backend == REMOTE_BACKEND:
+            self.get_circuit(task).record(ok)
+
+    def run_backend(self, backend: str, task: str, batch_func, input_list: list, *params) -> tuple:
+        """
+        Runs a batch on a backend, recording its latency and outcome.
+        Only the failures of the batch count as errors (an exception, malformed outputs or inputs failed by
+        server or network errors), not the inputs rejected by the model.
+        :return: a pair (outputs, whether the batch succeeded)
+        """
+        start_time = time.perf_counter()
+        try:
+            output_list = batch_func(input_list, *params)
+        except Exception:
+            self.record_batch(backend, task, time.perf_counter() - start_time, False)
+            raise
+        latency = time.perf_counter() - start_time
+        ok = is_valid_output_list(output_list, input_list)
+        ROUTER_BACKEND_LATENCY.observe(latency, backend=backend, task=task)
+        self.record_batch(backend, task, latency, ok)
+        return output_list, ok
+
+    async def run_remote_backend(self, task: str, remote_func, input_list: list, *params) -> tuple:
+        """
+        Runs a batch on the HuggingFace API with the async client, as run_backend does.
+        The HuggingFace batch functions do not raise, failed inputs get an empty result.
+        A cancelled call, e.g., of a batch whose hedge won, is not recorded.
+        :return: a pair (outputs, whether the batch succeeded)
+        """
+        start_time = time.perf_counter()
+        try:
+            output_list = await remote_func(input_list, *params)
+        except Exception:
+            self.record_batch(REMOTE_BACKEND, task, time.perf_counter() - start_time, False)
+            raise
+        latency = time.perf_counter() - start_time
+        ok = is_valid_output_list(output_list, input_list)
+        ROUTER_BACKEND_LATENCY.observe(latency, backend=REMOTE_BACKEND, task=task)
+        self.record_batch(REMOTE_BACKEND, task, latency, ok)
+        return output_list, ok
+
+    def run_hedged(self, task: str, remote_func, local_func, input_list: list, *params) -> list:
+        """
+        Runs a batch on the HuggingFace API, and on the local model too if the API takes longer than its p95 latency.
+        :return: the first successful outputs, or the outputs of the API if both backends fail
+        """
+        # The API call starts on the HuggingFace loop right away, there is no queue in front of it
+        remote_future = submit_hf_coroutine(self.run_remote_backend(task, remote_func, input_list, *params))
+        remote_stats = self.get_stats(REMOTE_BACKEND, task)
+        p95_latency = remote_stats.latency_percentile(95)
+        # No hedging until the latency of the API is known
+        if remote_stats.num_samples() < ROUTER_MIN_SAMPLES or p95_latency is None:
+            ROUTER_DECISIONS.inc(task=task, decision="remote")
+            return remote_future.result()[0]
+        try:
+            output_list, _ = remote_future.result(timeout=max(self.hedge_min_delay, p95_latency))
+            ROUTER_DECISIONS.inc(task=task, decision="remote")
+            return output_list
+        except FutureTimeoutError:
+            pass
+
+        # Cap the hedges waiting for or running on the local models, beyond that wait for the API
+        executor = self.get_local_executor(task)
+        if not self._hedge_semaphore.acquire(blocking=False):
+            ROUTER_DECISIONS.inc(task=task, decision="hedge_skipped")
+            return remote_future.result()[0]
+        local_future = executor.submit(self.run_backend, LOCAL_BACKEND, task, local_func, input_list, *params)
+        local_future.add_done_callback(lambda _: self._hedge_semaphore.release())
+        pending_future_set = {remote_future, local_future}
+        while pending_future_set:
+            done_future_set, pending_future_set = wait(pending_future_set, return_when=FIRST_COMPLETED)
+            for future in done_future_set:
+                if future.exception() is None and future.result()[1]:
+                    if future is remote_future:
+                        # Drop the hedge if it is still queued
+                        local_future.cancel()
+                    else:
+                        # Stop the API call and its retries
+                        remote_future.cancel()
+                    decision = "hedge_remote" if future is remote_future else "hedge_local"
+                    ROUTER_DECISIONS.inc(task=task, decision=decision)
+                    return future.result()[0]
+        # Both backends failed, the failed inputs are retried locally
+        ROUTER_DECISIONS.inc(task=task, decision="hedge_failed")
+        return remote_future.result()[0]
+
+    def run(self, task: str, remote_func, local_func, input_list: list, *params, local_available: bool = True) -> list:
+        """
+        Runs a batch of inferences on the HuggingFace API or on the local model.
+        :param task: the task, e.g., "sentiment".
+        :param remote_func: the async function running a list of inputs on the HuggingFace API.
+        :param local_func: the function running a list of inputs on the local model.
+        :param input_list: the model inputs.
+        :param params: the other arguments of the batch functions.
+        :param local_available: whether the local model is loaded, otherwise the batch goes to the API.
+        :return: the outputs, aligned with input_list
+        """
+        if not local_available:
+            ROUTER_DECISIONS.inc(task=task, decision="remote_only")
+            return run_hf_coroutine(remote_func(input_list, *params))
+        if not self.get_circuit(task).allow_request():
+            ROUTER_DECISIONS.inc(task=task, decision="failover")
+            return self.run_local(task, local_func, input_list, *params)
+
+        if self.use_hedging:
+            output_list = self.run_hedged(task, remote_func, local_func, input_list, *params)
+        else:
+            ROUTER_DECISIONS.inc(task=task, decision="remote")
+            output_list = run_hf_coroutine(self.run_remote_backend(task, remote_func, input_list, *params))[0]
+
+        # Run the inputs failed by the API on the local model
+        if not isinstance(output_list, list) or len(output_list) != len(input_list):
+            output_list = [dict()] * len(input_list)
+        failed_idx_list = [idx for idx, output in enumerate(output_list) if not output]
+        if failed_idx_list:
+            ROUTER_DECISIONS.inc(task=task, decision="fallback")
+            try:
+                local_output_list = self.get_local_executor(task).submit(
+                    local_func, [input_list[idx] for idx in failed_idx_list], *params).result()
+                output_list = list(output_list)
+                for idx, output in zip(failed_idx_list, local_output_list):
+                    output_list[idx] = output
+            except Exception as e:
+                logging.error(f"Local fallback of {task} failed: {e}")
+        return output_list
@@ -0,0 +1,84 @@
+from service.const import *
+
+
+def compare_category_maps(pro_con_data_list: list, labels: list = CANDIDATE_PROD_LABELS) -> dict:
+    """
+    Aligns the category maps of the given products/restaurants.
+    :param pro_con_data_list: the list of pro-con MetaData to compare.
+    :param labels: the candidate category labels, used to order the categories.
+    :return: a map from category to the aligned percentages (None if the item has no entry
+    for the category), number of entries, delta from the best percentage and index of the best item
+    """
+    categories = list(labels)
+    for pro_con_data in pro_con_data_list:
+        for cat in pro_con_data.get("category_map", dict()):
+            if cat not in categories:
+                categories.append(cat)
+
+    category_comparison_map = dict()
+    for cat in categories:
+        perc_list = list()
+        num_entries_list = list()
+        for pro_con_data in pro_con_data_list:
+            cat_value = pro_con_data.get("category_map", dict()).get(cat, dict())
+            num_entries = cat_value.get("num_entries", 0)
+            num_entries_list.append(num_entries)
+            perc_list.append(cat_value.get("perc", 0) if num_entries > 0 else None)
+
+        valid_perc_list = [perc for perc in perc_list if perc is not None]
+        best_perc = max(valid_perc_list) if valid_perc_list else None
+        category_comparison_map[cat] = {
+            "perc": perc_list,
+            "num_entries": num_entries_list,
+            "delta": [perc - best_perc if perc is not None else None for perc in perc_list],
+            "best": perc_list.index(best_perc) if best_perc is not None else None
+        }
+    return category_comparison_map
+
+
+def compare_pro_con_maps(pro_con_data_list: list) -> dict:
+    """
+    Aligns the pros and cons of the given products/restaurants.
+    :param pro_con_data_list: the list of pro-con MetaData to compare.
+    :return: a map from pro-con aspect to the aligned number of pros, number of cons,
+    and their delta (pros minus cons)
+    """
+    aspects = list()
+    for pro_con_data in pro_con_data_list:
+        pro_con_map = pro_con_data.get("pro_con_map", dict())
+        for label in ['pos', 'neg']:
+            for aspect in pro_con_map.get(label, dict()):
+                if aspect not in aspects:
+                    aspects.append(aspect)
+
+    aspect_comparison_map = dict()
+    for aspect in aspects:
+        pos_list = list()
+        neg_list = list()
+        for pro_con_data in pro_con_data_list:
+            pro_con_map = pro_con_data.get("pro_con_map", dict())
+            pos_list.append(len(pro_con_map.get('pos', dict()).get(aspect, list())))
+            neg_list.append(len(pro_con_map.get('neg', dict()).get(aspect, list())))
+        aspect_comparison_map[aspect] = {
+            "pos": pos_list,
+            "neg": neg_list,
+            "delta": [num_pos - num_neg for num_pos, num_neg in zip(pos_list, neg_list)]
+        }
+    return aspect_comparison_map
+
+
+def compare_pro_con(pro_con_data_list: list, labels: list = CANDIDATE_PROD_LABELS) -> dict:
+    """
+    Compares side-by-side the pro-con analysis of many products/restaurants.
+    All the lists in the comparison are aligned with the input list.
+    :param pro_con_data_list: the list of pro-con MetaData to compare.
+    :param labels: the candidate category labels.
+    :return: the comparison map
+    """
+    comparison_data = dict()
+    comparison_data['meta'] = [pro_con_data.get("meta", dict()) for pro_con_data in pro_con_data_list]
+    comparison_data['sentiment_map'] = [pro_con_data.get("sentiment_map", dict())
+                                        for pro_con_data in pro_con_data_list]
+    comparison_data['category_map'] = compare_category_maps(pro_con_data_list, labels)
+    comparison_data['pro_con_map'] = compare_pro_con_maps(pro_con_data_list)
+    return comparison_data
@@ -0,0 +1,57 @@
+import numpy as np
+from service.const import *
+
+
+def textrank_scores(embedding_matrix: np.ndarray, damping: float = TEXTRANK_DAMPING,
+                    max_num_iter: int = TEXTRANK_MAX_NUM_ITER, tolerance: float = 1e-6) -> np.ndarray:
+    """
+    Scores the sentences with TextRank: PageRank over the graph of the sentences
+    weighted by the cosine similarity of their embeddings.
+    :param embedding_matrix: the normalized embeddings of the sentences, one row per sentence.
+    :param damping: the damping factor of PageRank.
+    :param max_num_iter: the max number of power iterations.
+    :param tolerance: the L1 change of the scores under which the iterations stop.
+    :return: the scores of the sentences
+    """
+    num_sentences = embedding_matrix.shape[0]
+    similarity_matrix = np.clip(embedding_matrix @ embedding_matrix.T, 0.0, None)
+    np.fill_diagonal(similarity_matrix, 0.0)
+
+    # Row-stochastic transition matrix, sentences similar to no other one jump uniformly
+    row_sum_list = similarity_matrix.sum(axis=1, keepdims=True)
+    transition_matrix = np.where(row_sum_list > 0, similarity_matrix / np.where(row_sum_list > 0, row_sum_list, 1.0),
+                                 1.0 / num_sentences)
+
+    score_array = np.full(num_sentences, 1.0 / num_sentences)
+    for _ in range(max_num_iter):
+        new_score_array = (1.0 - damping) / num_sentences + damping * (transition_matrix.T @ score_array)
+        if np.abs(new_score_array - score_array).sum() < tolerance:
+            return new_score_array
+        score_array = new_score_array
+    return score_array
+
+
+def centroid_scores(embedding_matrix: np.ndarray) -> np.ndarray:
+    """
+    Scores the sentences by the cosine similarity of their embedding with the centroid of the text.
+    :param embedding_matrix: the normalized embeddings of the sentences, one row per sentence.
+    :return: the scores of the sentences
+    """
+    centroid = embedding_matrix.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    if norm == 0:
+        return np.zeros(embedding_matrix.shape[0])
+    return embedding_matrix @ (centroid / norm)
+
+
+def select_sentences(sentence_list: list, score_array: np.ndarray, num_sentences: int) -> str:
+    """
+    Keeps the best scored sentences, in their original order.
+    :param sentence_list: the sentences of the text.
+    :param score_array: the scores of the sentences.
+    :param num_sentences: the number of sentences to keep.
+    :return: the extractive summary
+    """
+    # Stable sort so that ties keep the earlier sentences
+    top_idx_list = sorted(np.argsort(-score_array, kind="stable")[:num_sentences])
+    return " ".join(sentence_list[idx] for idx in top_idx_list)
@@ -1,6 +1,125 @@
+import asyncio
+import logging
+import os
+import random
+import threading
 import requests
-import time
 from service.const import *
+from service.metrics import EXTERNAL_CALL_LATENCY, EXTERNAL_CALL_RETRIES, EXTERNAL_CALLS
+
+# Event loop of the process running the async HuggingFace client, on its own thread, made after fork.
+# The blocking callers (pipeline, micro-batch and router threads) submit their requests to it,
+# so that the concurrent requests and the backoffs between retries do not hold a thread each
+glb_hf_loop = None
+glb_hf_loop_pid = None
+glb_hf_lock = threading.Lock()
+# Async HTTP session (keep-alive connection pool) and caps on the concurrent requests per model endpoint,
+# only accessed from the HuggingFace loop
+glb_async_hf_session = None
+glb_async_hf_model_semaphore_map = dict()
+
+
+class UnavailableOutput(dict):
+    """
+    Empty result of an input whose request failed on a server or network error, as opposed to
+    an input rejected by the model. Falsy and equal to an empty dictionary as any failed result.
+    """
+    pass
+
+
+def get_hf_loop() -> asyncio.AbstractEventLoop:
+    global glb_hf_loop, glb_hf_loop_pid, glb_async_hf_session
+    with glb_hf_lock:
+        if glb_hf_loop is None or glb_hf_loop_pid != os.getpid():
+            # Threads do not survive fork, each server worker starts its own loop and session
+            glb_hf_loop = asyncio.new_event_loop()
+            glb_hf_loop_pid = os.getpid()
+            glb_async_hf_session = None
+            glb_async_hf_model_semaphore_map.clear()
+            threading.Thread(target=glb_hf_loop.run_forever, name="hf_client", daemon=True).start()
+        return glb_hf_loop
+
+
+def submit_hf_coroutine(coroutine):
+    """
+    Runs the given coroutine of the async HuggingFace client on the HuggingFace loop.
+    Must not be called from the HuggingFace loop itself.
+    :param coroutine: the coroutine to run.
+    :return: the concurrent.futures.Future of its result
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_hf_loop())
+
+
+def run_hf_coroutine(coroutine):
+    """
+    Runs the given coroutine of the async HuggingFace client on the HuggingFace loop and waits for its result.
+    :param coroutine: the coroutine to run.
+    :return: the value returned by the coroutine
+    """
+    return submit_hf_coroutine(coroutine).result()
+
+
+def get_async_hf_session():
+    global glb_async_hf_session
+    import aiohttp
+    if glb_async_hf_session is None or glb_async_hf_session.closed:
+        connector = aiohttp.TCPConnector(limit=HF_MAX_CONNECTIONS, keepalive_timeout=HF_KEEPALIVE_TIMEOUT)
+        glb_async_hf_session = aiohttp.ClientSession(connector=connector,
+                                                     timeout=aiohttp.ClientTimeout(total=HF_REQUEST_TIMEOUT))
+    return glb_async_hf_session
+
+
+def get_async_hf_model_semaphore(model_id: str) -> asyncio.Semaphore:
+    if model_id not in glb_async_hf_model_semaphore_map:
+        glb_async_hf_model_semaphore_map[model_id] = asyncio.Semaphore(HF_MAX_CONCURRENT_REQUESTS_PER_MODEL)
+    return glb_async_hf_model_semaphore_map[model_id]
+
+
+async def close_async_hf_session():
+    global glb_async_hf_session
+    if glb_async_hf_session is not None and not glb_async_hf_session.closed:
+        await glb_async_hf_session.close()
+    glb_async_hf_session = None
+
+
+def close_hf_client(timeout: float = 5.0):
+    """
+    Closes the connections of the async HuggingFace client and stops its loop, e.g., on shutdown.
+    :param timeout: max time (in sec.) to wait for the connections to close.
+    """
+    global glb_hf_loop
+    with glb_hf_lock:
+        loop = glb_hf_loop if glb_hf_loop_pid == os.getpid() else None
+        glb_hf_loop = None
+    if loop is None or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_async_hf_session(), loop).result(timeout=timeout)
+    except Exception as e:
+        logging.error(f"Cannot close the HuggingFace client: {e!r}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def get_retry_delay(status_code: int, response_json, num_retries: int):
+    """
+    Time to wait before retrying a failed HuggingFace request.
+    Client errors (4xx) are not retried except for 408 and 429, a model still loading (503)
+    is retried after its estimated loading time, the other errors (5xx, timeouts, connection errors)
+    with exponential backoff and full jitter.
+    :param status_code: the status code of the response, 0 if the request failed without response.
+    :param response_json: the body of the response, if any.
+    :param num_retries: the number of retries so far, the request is retried up to
+    REQUEST_CTR_LIMIT + 1 times (as the former fixed-delay loop).
+    :return: the delay (in sec.), or None if the request should not be retried
+    """
+    if num_retries > REQUEST_CTR_LIMIT:
+        return None
+    if 400 <= status_code < 500 and status_code not in (408, 429):
+        return None
+    if status_code == 503 and isinstance(response_json, dict) and "estimated_time" in response_json:
+        estimated_time = float(response_json["estimated_time"])
+        return min(estimated_time, REQUEST_SLEEP_TIME) + random.uniform(0, REQUEST_BACKOFF_BASE)
+    return random.uniform(0, min(REQUEST_SLEEP_TIME, REQUEST_BACKOFF_BASE * 2 ** num_retries))
 
 
 def pin_hf_models(pinned_models_map: str):
@@ -12,18 +131,120 @@ def pin_hf_models(pinned_models_map: str):
     return response
 
 
-def hf_query(payload, api_url, headers):
-    ctr = 0
+async def async_hf_query_with_status(payload, api_url, headers) -> tuple:
+    """
+    Queries the HuggingFace Inference API over pooled keep-alive connections,
+    with at most HF_MAX_CONCURRENT_REQUESTS_PER_MODEL concurrent requests per model
+    and retries as given by get_retry_delay. Runs on the HuggingFace loop.
+    :return: a pair (JSON output of the model or empty dictionary on error,
+    status code or 0 if the last request failed without response)
+    """
+    import aiohttp
+    model_id = api_url.split('/models/')[-1]
+    session = get_async_hf_session()
+    num_retries = 0
     while True:
-        response = requests.post(api_url, headers=headers, json=payload)
-        status_code = response.status_code
-        if status_code == 200:
-            return response.json()
-        else:
-            if ctr > REQUEST_CTR_LIMIT:
-                return {}
-            ctr += 1
-            time.sleep(REQUEST_SLEEP_TIME)
+        status_code = 0
+        response_json = None
+        async with get_async_hf_model_semaphore(model_id):
+            try:
+                with EXTERNAL_CALL_LATENCY.time(service="huggingface", endpoint=model_id):
+                    async with session.post(api_url, headers=headers, json=payload) as response:
+                        status_code = response.status
+                        try:
+                            response_json = await response.json(content_type=None)
+                        except ValueError:
+                            response_json = None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"HuggingFace request to {model_id} failed: {e!r}")
+        EXTERNAL_CALLS.inc(service="huggingface", endpoint=model_id, outcome=str(status_code or "error"))
+        if status_code == 200 and response_json is not None:
+            return response_json, status_code
+
+        delay = get_retry_delay(status_code, response_json, num_retries)
+        if delay is None:
+            return {}, status_code
+        num_retries += 1
+        EXTERNAL_CALL_RETRIES.inc(service="huggingface", endpoint=model_id)
+        await asyncio.sleep(delay)
+
+
+async def async_hf_query(payload, api_url, headers):
+    """
+    Async HuggingFace query, see async_hf_query_with_status.
+    :return: the JSON output of the model, or empty dictionary on error
+    """
+    return (await async_hf_query_with_status(payload, api_url, headers))[0]
+
+
+def hf_query(payload, api_url, headers):
+    """
+    Blocking HuggingFace query, run by the async client on the HuggingFace loop.
+    :return: the JSON output of the model, or empty dictionary on error
+    """
+    return run_hf_coroutine(async_hf_query(payload, api_url, headers))
+
+
+def get_chunk_list(input_list: list, chunk_size: int) -> list:
+    return [input_list[idx:idx + chunk_size] for idx in range(0, len(input_list), chunk_size)]
+
+
+def is_valid_chunk_output(output, input_chunk: list) -> bool:
+    # One result per input, a failed request gives an empty dictionary
+    return isinstance(output, list) and len(output) == len(input_chunk)
+
+
+def is_input_failure(status_code: int) -> bool:
+    # The model rejected the payload (4xx not retried, or a 200 with the wrong number of results),
+    # possibly because of a single input. Server errors, timeouts and connection errors are not tied to the inputs
+    return status_code == 200 or (400 <= status_code < 500 and status_code not in (408, 429))
+
+
+def get_failed_output(status_code: int) -> dict:
+    return dict() if is_input_failure(status_code) else UnavailableOutput()
+
+
+async def async_hf_query_batch(input_list: list, api_url, headers, chunk_size: int, parameters: dict = None) -> list:
+    """
+    Queries the HuggingFace Inference API with lists of inputs, chunk_size inputs per request, the chunks
+    are sent concurrently. A chunk rejected by the model is retried one input per request, concurrently,
+    to isolate the failed inputs. A chunk failed by the server or the network (after the retries of
+    async_hf_query_with_status) is not split, its inputs fail. Runs on the HuggingFace loop.
+    :param input_list: the model inputs.
+    :param chunk_size: the max number of inputs per request.
+    :param parameters: the parameters of the model, if any.
+    :return: the outputs of the model, aligned with input_list, an empty dictionary for each failed input
+    (an UnavailableOutput if it failed on a server or network error)
+    """
+    async def query_chunk(input_chunk: list) -> list:
+        payload = {"inputs": input_chunk}
+        if parameters is not None:
+            payload["parameters"] = parameters
+        output, status_code = await async_hf_query_with_status(payload=payload, api_url=api_url, headers=headers)
+        if is_valid_chunk_output(output, input_chunk):
+            return output
+        if not is_input_failure(status_code) or len(input_chunk) == 1:
+            return [get_failed_output(status_code) for _ in input_chunk]
+
+        # Isolate the failed inputs, a single-input list gives the same output format
+        input_output_list = await asyncio.gather(*[
+            async_hf_query_with_status(payload=dict(payload, inputs=[model_input]), api_url=api_url, headers=headers)
+            for model_input in input_chunk])
+        return [input_output[0] if is_valid_chunk_output(input_output, [model_input])
+                else get_failed_output(input_status_code)
+                for model_input, (input_output, input_status_code) in zip(input_chunk, input_output_list)]
+
+    output_chunk_list = await asyncio.gather(*[query_chunk(input_chunk)
+                                               for input_chunk in get_chunk_list(input_list, chunk_size)])
+    return [output for output_chunk in output_chunk_list for output in output_chunk]
+
+
+def hf_query_batch(input_list: list, api_url, headers, chunk_size: int, parameters: dict = None) -> list:
+    """
+    Blocking batch HuggingFace query, run by the async client on the HuggingFace loop, see async_hf_query_batch.
+    :return: the outputs of the model, aligned with input_list, an empty dictionary for each failed input
+    """
+    return run_hf_coroutine(async_hf_query_batch(input_list, api_url, headers, chunk_size, parameters))
 
 
 def call_hf_summarizer(text: str):
@@ -48,6 +269,30 @@ def call_hf_extreme_summarizer(text: str):
     return output
 
 
+def call_hf_summarizer_batch(text_list: list):
+    api_url = HF_SUM_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_SUMMARIZER_MAX_INPUTS_PER_REQUEST
+    )
+    return output
+
+
+def call_hf_extreme_summarizer_batch(text_list: list):
+    api_url = HF_EXT_SUM_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_SUMMARIZER_MAX_INPUTS_PER_REQUEST
+    )
+    return output
+
+
 def call_hf_text_classification(text: str):
     api_url = HF_SENT_CLASS_MODEL_URL
     headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
@@ -59,6 +304,18 @@ def call_hf_text_classification(text: str):
     return output
 
 
+def call_hf_text_classification_batch(text_list: list):
+    api_url = HF_SENT_CLASS_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_MAX_INPUTS_PER_REQUEST
+    )
+    return output
+
+
 def call_hf_zero_shot_classification(text: str, labels):
     api_url = HF_ZERO_SHOT_CLASS_MODEL_URL
     headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
@@ -68,3 +325,109 @@ def call_hf_zero_shot_classification(text: str, labels):
         headers=headers
     )
     return output
+
+
+def call_hf_zero_shot_classification_batch(text_list: list, labels):
+    api_url = HF_ZERO_SHOT_CLASS_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_MAX_INPUTS_PER_REQUEST,
+        parameters={"candidate_labels": labels}
+    )
+    return output
+
+
+async def async_call_hf_summarizer(text: str):
+    api_url = HF_SUM_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query(
+        payload={"inputs": text},
+        api_url=api_url,
+        headers=headers
+    )
+    return output
+
+
+async def async_call_hf_extreme_summarizer(text: str):
+    api_url = HF_EXT_SUM_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query(
+        payload={"inputs": text},
+        api_url=api_url,
+        headers=headers
+    )
+    return output
+
+
+async def async_call_hf_summarizer_batch(text_list: list):
+    api_url = HF_SUM_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_SUMMARIZER_MAX_INPUTS_PER_REQUEST
+    )
+    return output
+
+
+async def async_call_hf_extreme_summarizer_batch(text_list: list):
+    api_url = HF_EXT_SUM_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_SUMMARIZER_MAX_INPUTS_PER_REQUEST
+    )
+    return output
+
+
+async def async_call_hf_text_classification(text: str):
+    api_url = HF_SENT_CLASS_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query(
+        payload={"inputs": text},
+        api_url=api_url,
+        headers=headers
+    )
+    return output
+
+
+async def async_call_hf_text_classification_batch(text_list: list):
+    api_url = HF_SENT_CLASS_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_MAX_INPUTS_PER_REQUEST
+    )
+    return output
+
+
+async def async_call_hf_zero_shot_classification(text: str, labels):
+    api_url = HF_ZERO_SHOT_CLASS_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query(
+        payload={"inputs": text, "parameters": {"candidate_labels": labels}},
+        api_url=api_url,
+        headers=headers
+    )
+    return output
+
+
+async def async_call_hf_zero_shot_classification_batch(text_list: list, labels):
+    api_url = HF_ZERO_SHOT_CLASS_MODEL_URL
+    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_TOKEN}"}
+    output = await async_hf_query_batch(
+        input_list=text_list,
+        api_url=api_url,
+        headers=headers,
+        chunk_size=HF_MAX_INPUTS_PER_REQUEST,
+        parameters={"candidate_labels": labels}
+    )
+    return output
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from service.const import *
+from service.metrics import INFERENCE_CACHE_ENTRIES, INFERENCE_CACHE_LOOKUPS
+
+
+def normalize_text(text: str, lowercase: bool = False) -> str:
+    """
+    Normalizes a model input so that trivially different strings share a cache entry.
+    :param text: the model input.
+    :param lowercase: whether to lowercase the text, only safe for uncased models.
+    :return: the normalized text
+    """
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+
+def get_inference_key(model_id: str, task: str, text: str, params: tuple = (), lowercase: bool = False) -> tuple:
+    """
+    Content-addressed key of a model inference.
+    :param model_id: the id of the model.
+    :param task: the task run by the model, e.g., "sentiment".
+    :param text: the model input.
+    :param params: the parameters changing the output, e.g., the candidate labels.
+    :param lowercase: whether the model is uncased.
+    :return: the cache key
+    """
+    text_hash = hashlib.sha1(normalize_text(text, lowercase).encode("utf-8")).hexdigest()
+    return model_id, task, params, text_hash
+
+
+class InferenceCache:
+    """
+    Thread-safe LRU cache of model inference results, bounded by number of entries.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        task = key[1]
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        INFERENCE_CACHE_LOOKUPS.inc(tier="memory", task=task, result="miss" if value is None else "hit")
+        return value
+
+    def put(self, key: tuple, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            num_entries = len(self._entries)
+        INFERENCE_CACHE_ENTRIES.set(num_entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        INFERENCE_CACHE_ENTRIES.set(0)
+
+
+class DiskInferenceCache:
+    """
+    Persistent cache of model inference results in a SQLite database, surviving restarts.
+    Values are stored as zlib-compressed JSON and the least recently used ones are evicted
+    when the total size of the values exceeds max_bytes. The access times of the hits are written
+    in batches of access_batch_size.
+    Entries written with a different INFERENCE_CACHE_VERSION are ignored, overwritten or evicted as least
+    recently used.
+    """
+
+    def __init__(self, path: str, max_bytes: int, version: int = INFERENCE_CACHE_VERSION,
+                 access_batch_size: int = INFERENCE_DISK_CACHE_ACCESS_BATCH_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.access_batch_size = access_batch_size
+        self._conn = None
+        self._conn_pid = None
+        self._num_bytes = 0
+        # Access times of the hits not written yet, by encoded key
+        self._access_time_map = dict()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Each (forked) server worker opens its own connection
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn_pid = os.getpid()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS inference_cache (key TEXT PRIMARY KEY, version INTEGER, "
+                           "value BLOB, size INTEGER, last_access REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS inference_cache_last_access ON inference_cache (last_access)")
+        self._access_time_map.clear()
+        self._num_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM inference_cache").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def encode_key(key: tuple) -> str:
+        return json.dumps(key)
+
+    def get(self, key: tuple):
+        value = None
+        try:
+            with self._lock:
+                conn = self._connect()
+                encoded_key = self.encode_key(key)
+                row = conn.execute("SELECT value FROM inference_cache WHERE key = ? AND version = ?",
+                                   (encoded_key, self.version)).fetchone()
+                if row is not None:
+                    self._access_time_map[encoded_key] = time.time()
+                    if len(self._access_time_map) >= self.access_batch_size:
+                        self.flush_access_times(conn)
+                    value = json.loads(zlib.decompress(row[0]))
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            logging.error("Cannot read the inference cache: " + str(e))
+        INFERENCE_CACHE_LOOKUPS.inc(tier="disk", task=key[1], result="miss" if value is None else "hit")
+        return value
+
+    def put(self, key: tuple, value):
+        encoded_value = zlib.compress(json.dumps(value).encode("utf-8"))
+        try:
+            with self._lock:
+                conn = self._connect()
+                encoded_key = self.encode_key(key)
+                row = conn.execute("SELECT size FROM inference_cache WHERE key = ?", (encoded_key,)).fetchone()
+                conn.execute("INSERT OR REPLACE INTO inference_cache VALUES (?, ?, ?, ?, ?)",
+                             (encoded_key, self.version, encoded_value, len(encoded_value), time.time()))
+                self._num_bytes += len(encoded_value) - (row[0] if row is not None else 0)
+                if self._num_bytes > self.max_bytes:
+                    self.evict(conn)
+        except sqlite3.Error as e:
+            logging.error("Cannot write the inference cache: " + str(e))
+
+    def flush_access_times(self, conn):
+        """
+        Writes the access times of the latest hits in a single transaction.
+        :param conn: the connection to the database.
+        """
+        access_time_list = [(access_time, key) for key, access_time in self._access_time_map.items()]
+        self._access_time_map.clear()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("UPDATE inference_cache SET last_access = ? WHERE key = ?", access_time_list)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def evict(self, conn):
+        """
+        Evicts the least recently used entries down to 90% of max_bytes.
+        :param conn: the connection to the database.
+        """
+        # Entries hit since the last flush are not the least recently used
+        self.flush_access_times(conn)
+        # Recount since other workers may share the database
+        self._num_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM inference_cache").fetchone()[0]
+        num_bytes_to_free = self._num_bytes - int(0.9 * self.max_bytes)
+        if num_bytes_to_free <= 0:
+            return
+        num_bytes_freed = 0
+        key_list = list()
+        for key, size in conn.execute("SELECT key, size FROM inference_cache ORDER BY last_access"):
+            key_list.append((key,))
+            num_bytes_freed += size
+            if num_bytes_freed >= num_bytes_to_free:
+                break
+        conn.executemany("DELETE FROM inference_cache WHERE key = ?", key_list)
+        self._num_bytes -= num_bytes_freed
+
+
+def lookup_inference(key: tuple):
+    """
+    Looks up a model inference in memory, then on disk.
+    :param key: the key of the inference.
+    :return: the cached result, or None
+    """
+    value = glb_inference_cache.get(key)
+    if value is None and glb_disk_inference_cache is not None:
+        value = glb_disk_inference_cache.get(key)
+        if value is not None:
+            glb_inference_cache.put(key, value)
+    return value
+
+
+def store_inference(key: tuple, value):
+    """
+    Stores a model inference in memory and on disk.
+    Empty results, e.g., failed HuggingFace requests, are not cached.
+    :param key: the key of the inference.
+    :param value: the result of the inference.
+    """
+    if not value:
+        return
+    glb_inference_cache.put(key, value)
+    if glb_disk_inference_cache is not None:
+        glb_disk_inference_cache.put(key, value)
+
+
+def cached_inference(key: tuple, func, *args, **kwargs):
+    """
+    Runs a model inference through the cache.
+    :param key: the key of the inference.
+    :param func: the function running the inference.
+    :return: the result of the inference
+    """
+    value = lookup_inference(key)
+    if value is None:
+        value = func(*args, **kwargs)
+        store_inference(key, value)
+    return value
+
+
+def cached_inference_batch(key_list: list, batch_func, input_list: list, *args, **kwargs) -> list:
+    """
+    Runs a batched model inference through the cache, only the inputs missing from the cache are run.
+    :param key_list: the keys of the inferences, aligned with input_list.
+    :param batch_func: the function running the inference on a list of inputs.
+    :param input_list: the model inputs.
+    :return: the results of the inference, aligned with input_list
+    """
+    value_list = [lookup_inference(key) for key in key_list]
+    miss_idx_list = [idx for idx, value in enumerate(value_list) if value is None]
+    if miss_idx_list:
+        miss_value_list = batch_func([input_list[idx] for idx in miss_idx_list], *args, **kwargs)
+        for idx, value in zip(miss_idx_list, miss_value_list):
+            value_list[idx] = value
+            store_inference(key_list[idx], value)
+    return value_list
+
+
+# Results of the (local or HuggingFace) model inferences shared by all the pipelines of the process
+glb_inference_cache = InferenceCache(INFERENCE_CACHE_MAX_ENTRIES)
+# Optional persistent tier shared by the workers and across restarts
+glb_disk_inference_cache = DiskInferenceCache(INFERENCE_DISK_CACHE_PATH, INFERENCE_DISK_CACHE_MAX_BYTES) \
+    if INFERENCE_DISK_CACHE_PATH else None
@@ -1,19 +1,56 @@
 import json
 import logging
-from processor.hf_api import (call_hf_summarizer, call_hf_extreme_summarizer, call_hf_text_classification,
-                              call_hf_zero_shot_classification, pin_hf_models)
+import re
+from functools import lru_cache
+import numpy as np
+from processor.hf_api import (async_call_hf_extreme_summarizer_batch, async_call_hf_summarizer_batch,
+                              async_call_hf_text_classification_batch, async_call_hf_zero_shot_classification_batch,
+                              call_hf_extreme_summarizer, call_hf_summarizer, call_hf_text_classification,
+                              call_hf_zero_shot_classification, pin_hf_models, run_hf_coroutine)
+from processor.backend_router import BackendRouter
+from processor.extractive_summarizer import centroid_scores, select_sentences, textrank_scores
+from processor.inference_cache import cached_inference, cached_inference_batch, get_inference_key
+from processor.local_backends import load_pipeline
+from processor.micro_batcher import MicroBatcher
+from processor.model_loader import get_model, is_model_loaded, register_model
+from processor.nlp_provider import get_nlp, split_sentences, tokenize_texts
 from service.const import *
-from summarizer import Summarizer
-from transformers import pipeline
 
 
-# Load the models all at once
-glb_extract_summarizer = Summarizer()
-glb_summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
-glb_extreme_summarizer = pipeline("summarization", model="google/pegasus-xsum")
-glb_classifier = pipeline("text-classification", model="nlptown/bert-base-multilingual-uncased-sentiment",
-                          return_all_scores=True)
-glb_zero_shot = pipeline("zero-shot-classification", model="typeform/distilbert-base-uncased-mnli")
+# Note: the models (and torch/transformers themselves) are loaded lazily, on first use or by the
+# warm-up at startup, so that the service starts in about a second. The extractive summarizer always
+# runs locally, the other models are only needed when not using the HuggingFace API or with hybrid routing
+def load_extract_summarizer():
+    if EXTRACTIVE_SUMMARIZER_ENGINE in ("textrank", "centroid"):
+        # The vector engines only need the spaCy word vectors
+        get_nlp()
+        return extract_summarize_vectors
+
+    from summarizer import Summarizer
+    return Summarizer()
+
+
+register_model("extract_summarizer", load_extract_summarizer)
+register_model("summarizer", lambda: load_pipeline("summarization", model=HF_SUM_MODEL_ID),
+               required=not USE_HF_API or USE_HYBRID_ROUTING)
+register_model("extreme_summarizer", lambda: load_pipeline("summarization", model=HF_EXT_SUM_MODEL_ID),
+               required=not USE_HF_API or USE_HYBRID_ROUTING)
+register_model("classifier", lambda: load_pipeline("text-classification",
+                                                   model=HF_SENT_CLASS_MODEL_ID,
+                                                   return_all_scores=True),
+               required=not USE_HF_API or USE_HYBRID_ROUTING)
+register_model("zero_shot", lambda: load_pipeline("zero-shot-classification",
+                                                  model=HF_ZERO_SHOT_CLASS_MODEL_ID),
+               required=(not USE_HF_API or USE_HYBRID_ROUTING) and CATEGORY_ENGINE == "zero_shot")
+
+
+def load_summarizer_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(HF_SUM_MODEL_ID)
+
+
+register_model("summarizer_tokenizer", load_summarizer_tokenizer, required=SUMMARIZATION_MODE == "map_reduce")
+
 
 # Note: another classifier that works fairly well is:
 # glb_classifier = pipeline("text-classification", model='bhadresh-savani/distilbert-base-uncased-emotion',
@@ -28,10 +65,10 @@ glb_zero_shot = pipeline("zero-shot-classification", model="typeform/distilbert-
 def pin_hugging_face_models():
     data = json.dumps({
         "pinned_models": [
-            {"model_id": "sshleifer/distilbart-cnn-12-6", "compute_type": "cpu"},
-            {"model_id": "google/pegasus-xsum", "compute_type": "cpu"},
-            {"model_id": "nlptown/bert-base-multilingual-uncased-sentiment", "compute_type": "cpu"},
-            {"model_id": "typeform/distilbert-base-uncased-mnli", "compute_type": "cpu"},
+            {"model_id": HF_SUM_MODEL_ID, "compute_type": "cpu"},
+            {"model_id": HF_EXT_SUM_MODEL_ID, "compute_type": "cpu"},
+            {"model_id": HF_SENT_CLASS_MODEL_ID, "compute_type": "cpu"},
+            {"model_id": HF_ZERO_SHOT_CLASS_MODEL_ID, "compute_type": "cpu"},
 
         ]
     })
@@ -39,28 +76,243 @@ def pin_hugging_face_models():
     logging.info(json.dumps(res.json()))
 
 
-def summarize_extractive_abstractive(text: str, num_sentences: int = 10):
-    text = text.strip()
-    text = glb_extract_summarizer(text, num_sentences=num_sentences)
+def set_num_inference_threads(num_threads: int):
+    """
+    Sets the number of threads used by torch for the local models.
+    Used by forked server workers so that they do not oversubscribe the cores.
+    :param num_threads: number of intra-op threads.
+    """
+    import torch
+    torch.set_num_threads(max(1, num_threads))
+
+
+# Note: the results of the summarization, sentiment and zero-shot models are cached in memory
+# (see processor/inference_cache.py), the sentiment and zero-shot models are uncased so their
+# inputs are lowercased before hashing
+def get_model_version(model_id: str) -> str:
+    # The quantized/ONNX local backends give slightly different results from the fp32 models
+    if USE_HF_API or LOCAL_MODEL_BACKEND == "pytorch":
+        return model_id
+    return f"{model_id}@{LOCAL_MODEL_BACKEND}"
+
+
+def run_model_batch(task: str, model_name: str, hf_batch_func, local_batch_func, input_list: list, *params) -> list:
+    """
+    Runs a batch of inputs on the HuggingFace API or on the local model, as routed by glb_backend_router
+    with hybrid routing.
+    :param task: the task run by the model, e.g., "sentiment".
+    :param model_name: the name of the local model.
+    :param hf_batch_func: the async function calling the HuggingFace model on a list of inputs.
+    :param local_batch_func: the function running the local model on a list of inputs.
+    :param input_list: the model inputs.
+    :param params: the other arguments of the batch functions.
+    :return: the outputs, aligned with input_list
+    """
+    if not USE_HF_API:
+        return local_batch_func(input_list, *params)
+    if not USE_HYBRID_ROUTING:
+        return run_hf_coroutine(hf_batch_func(input_list, *params))
+    return glb_backend_router.run(task, hf_batch_func, local_batch_func, input_list, *params,
+                                  local_available=is_model_loaded(model_name))
+
+
+def run_summarization_batch(text_list: list, model_name: str, hf_batch_func) -> list:
+    """
+    Summarizes the given texts with batched HuggingFace requests or a local model batch, bypassing the cache.
+    :param text_list: the texts to summarize.
+    :param model_name: the name of the local model.
+    :param hf_batch_func: the async function calling the HuggingFace model on a list of texts.
+    :return: the list of [{'summary_text': str}] summaries, aligned with text_list (empty dictionary on error)
+    """
+    sum_list = run_model_batch(model_name, model_name, hf_batch_func,
+                               lambda x: get_model(model_name)(x, batch_size=SUMMARIZER_MICRO_BATCH_MAX_SIZE),
+                               text_list)
+    # Same output as for a single text, failed summaries are left empty so that they are not cached
+    return [[summary] if isinstance(summary, dict) and summary else summary for summary in sum_list]
+
+
+def run_summarizer_batch(text_list: list) -> list:
+    return run_summarization_batch(text_list, "summarizer", async_call_hf_summarizer_batch)
+
+
+def run_extreme_summarizer_batch(text_list: list) -> list:
+    return run_summarization_batch(text_list, "extreme_summarizer", async_call_hf_extreme_summarizer_batch)
+
+
+def get_summarizer_key(text: str) -> tuple:
+    return get_inference_key(get_model_version(HF_SUM_MODEL_ID), "summarization", text)
+
+
+def run_summarizer(text: str):
+    key = get_summarizer_key(text)
+    if USE_MICRO_BATCHING or USE_HYBRID_ROUTING:
+        return cached_inference(key, lambda: get_batch_func("summarizer")([text])[0])
+    if USE_HF_API:
+        return cached_inference(key, call_hf_summarizer, text)
+    return cached_inference(key, lambda: get_model("summarizer")(text))
+
+
+def run_extreme_summarizer(text: str):
+    key = get_inference_key(get_model_version(HF_EXT_SUM_MODEL_ID), "extreme_summarization", text)
+    if USE_MICRO_BATCHING or USE_HYBRID_ROUTING:
+        return cached_inference(key, lambda: get_batch_func("extreme_summarizer")([text])[0])
+    if USE_HF_API:
+        return cached_inference(key, call_hf_extreme_summarizer, text)
+    return cached_inference(key, lambda: get_model("extreme_summarizer")(text))
+
+
+def get_sentiment_key(text: str) -> tuple:
+    return get_inference_key(get_model_version(HF_SENT_CLASS_MODEL_ID), "sentiment", text, lowercase=True)
+
+
+def get_zero_shot_key(text: str, labels: list) -> tuple:
+    # The HuggingFace API scores the labels as mutually exclusive, the local model does not (except with hybrid routing)
+    return get_inference_key(get_model_version(HF_ZERO_SHOT_CLASS_MODEL_ID), "zero_shot", text,
+                             params=(tuple(labels), not USE_HF_API), lowercase=True)
+
+
+def run_sentiment(text: str) -> list:
+    """
+    Classifies the sentiment of the given text.
+    :param text: the text to classify.
+    :return: the list of {'label': 'N star(s)', 'score': float} maps
+    """
+    if USE_MICRO_BATCHING or USE_HYBRID_ROUTING:
+        return cached_inference(get_sentiment_key(text), lambda: get_batch_func("classifier")([text])[0])
     if USE_HF_API:
-        text = call_hf_summarizer(text.strip())
+        return cached_inference(get_sentiment_key(text), lambda: call_hf_text_classification(text)[0])
+    return cached_inference(get_sentiment_key(text), lambda: get_model("classifier")(text)[0])
+
+
+def run_zero_shot(text: str, labels: list) -> dict:
+    """
+    Zero-shot classifies the given text over the candidate labels.
+    :param text: the text to classify.
+    :param labels: the candidate labels.
+    :return: the {'labels': [...], 'scores': [...]} map
+    """
+    if USE_MICRO_BATCHING or USE_HYBRID_ROUTING:
+        return cached_inference(get_zero_shot_key(text, labels),
+                                lambda: get_batch_func("zero_shot")([text], labels)[0])
+    if USE_HF_API:
+        return cached_inference(get_zero_shot_key(text, labels), call_hf_zero_shot_classification, text, labels)
+    return cached_inference(get_zero_shot_key(text, labels),
+                            lambda: get_model("zero_shot")(text, labels, multi_label=True))
+
+
+def get_summary_text(text_sum) -> str:
+    try:
+        summary = text_sum[0]["summary_text"].strip()
+        return summary.replace(' . ', '. ').strip()
+    except:
+        return ""
+
+
+def count_tokens(text: str) -> int:
+    return len(get_model("summarizer_tokenizer")(text, add_special_tokens=False)["input_ids"])
+
+
+def chunk_text(text: str, max_num_tokens: int = SUMMARY_CHUNK_NUM_TOKENS) -> list:
+    """
+    Splits the given text into chunks of whole sentences of at most max_num_tokens tokens
+    of the summarizer (a longer sentence makes a chunk on its own).
+    :param text: the text to split.
+    :param max_num_tokens: max number of tokens per chunk.
+    :return: the list of chunks
+    """
+    sentence_list = [sentence for sentence in re.split(r'(?<=[.!?])\s+', text.strip()) if sentence]
+    if not sentence_list:
+        return list()
+    token_ids_list = get_model("summarizer_tokenizer")(sentence_list, add_special_tokens=False)["input_ids"]
+
+    chunk_list = list()
+    chunk_sentence_list = list()
+    chunk_num_tokens = 0
+    for sentence, token_ids in zip(sentence_list, token_ids_list):
+        if chunk_sentence_list and chunk_num_tokens + len(token_ids) > max_num_tokens:
+            chunk_list.append(' '.join(chunk_sentence_list))
+            chunk_sentence_list = list()
+            chunk_num_tokens = 0
+        chunk_sentence_list.append(sentence)
+        chunk_num_tokens += len(token_ids)
+    chunk_list.append(' '.join(chunk_sentence_list))
+    return chunk_list
+
+
+def summarize_map_reduce(text: str, depth: int = 0) -> str:
+    """
+    Summarizes a long text by summarizing its chunks concurrently (as a local model batch or
+    as parallel HuggingFace requests), then summarizing their joined summaries, recursively
+    while they do not fit in a chunk.
+    :param text: the text to summarize.
+    :param depth: the number of reduce rounds so far.
+    :return: the summary, or empty string on error
+    """
+    chunk_list = chunk_text(text)
+    if len(chunk_list) <= 1:
+        return get_summary_text(run_summarizer(text.strip())) if chunk_list else ""
+    if depth >= SUMMARY_MAP_REDUCE_MAX_DEPTH:
+        return ""
+
+    # Map: summarize all the chunks at once
+    sum_list = cached_inference_batch([get_summarizer_key(chunk) for chunk in chunk_list], get_batch_func("summarizer"),
+                                      chunk_list)
+    partial_summary_list = [get_summary_text(text_sum) for text_sum in sum_list]
+
+    # Reduce: summarize the summaries
+    return summarize_map_reduce(' '.join(summary for summary in partial_summary_list if summary), depth + 1)
+
+
+def extract_summarize_vectors(text: str, num_sentences: int = 10, engine: str = EXTRACTIVE_SUMMARIZER_ENGINE) -> str:
+    """
+    Extractive summarization with the textrank or centroid engine, same contract as the bert one.
+    :param text: the text to summarize.
+    :param num_sentences: the number of sentences to keep.
+    :param engine: "textrank" or "centroid".
+    :return: the kept sentences, in their original order
+    """
+    sentence_list = [sent.text.strip() for sent in split_sentences(text) if sent.text.strip()]
+    # Skip the short sentences, unless there is nothing else
+    sentence_list = [sentence for sentence in sentence_list if len(sentence) >= EXTRACTIVE_MIN_SENTENCE_LENGTH] \
+        or sentence_list
+    if len(sentence_list) <= num_sentences:
+        return " ".join(sentence_list)
+
+    embedding_matrix = embed_texts(sentence_list)
+    if engine == "centroid":
+        score_array = centroid_scores(embedding_matrix)
     else:
-        text = glb_summarizer(text.strip())
+        score_array = textrank_scores(embedding_matrix)
+    return select_sentences(sentence_list, score_array, num_sentences)
+
+
+def summarize_extractive_abstractive(text: str, num_sentences: int = 10):
+    text = text.strip()
+    text = get_model("extract_summarizer")(text, num_sentences=num_sentences)
+    text = run_summarizer(text.strip())
     summary = text[0]["summary_text"].strip()
     summary = summary.replace(' . ', '. ')
     return summary.strip()
 
 
 def summarize_text(text: str, num_sentences: int = 10):
+    if SUMMARIZATION_MODE == "map_reduce":
+        try:
+            summary = summarize_map_reduce(text)
+        except:
+            summary = ""
+
+        # Try again on error
+        if not summary:
+            return summarize_extractive_abstractive(text, num_sentences)
+        return summary
+
     if len(text.split()) > BERT_NUM_TOKEN_LIMIT:
         return summarize_extractive_abstractive(text, num_sentences)
     else:
         text = text.strip()
         try:
-            if USE_HF_API:
-                text_sum = call_hf_summarizer(text.strip())
-            else:
-                text_sum = glb_summarizer(text.strip())
+            text_sum = run_summarizer(text.strip())
 
             summary = text_sum[0]["summary_text"].strip()
             summary = summary.replace(' . ', '. ').strip()
@@ -76,17 +328,21 @@ def summarize_text(text: str, num_sentences: int = 10):
 
 def extreme_summarize_text(text: str, num_sentences: int = 10):
     text = text.strip()
-    if len(text.split()) > BERT_NUM_TOKEN_LIMIT:
-        text = glb_extract_summarizer(text, num_sentences=num_sentences)
-        if USE_HF_API:
-            text = call_hf_extreme_summarizer(text.strip())
-        else:
-            text = glb_extreme_summarizer(text.strip())
+    if SUMMARIZATION_MODE == "map_reduce" and count_tokens(text) > SUMMARY_CHUNK_NUM_TOKENS:
+        try:
+            summary = summarize_map_reduce(text)
+        except:
+            summary = ""
+
+        # Fall back to the extractive summary on error
+        if not summary:
+            summary = get_model("extract_summarizer")(text, num_sentences=num_sentences)
+        text = run_extreme_summarizer(summary.strip())
+    elif len(text.split()) > BERT_NUM_TOKEN_LIMIT:
+        text = get_model("extract_summarizer")(text, num_sentences=num_sentences)
+        text = run_extreme_summarizer(text.strip())
     else:
-        if USE_HF_API:
-            text = call_hf_extreme_summarizer(text.strip())
-        else:
-            text = glb_extreme_summarizer(text.strip())
+        text = run_extreme_summarizer(text.strip())
 
     summary = text[0]["summary_text"].strip()
     summary = summary.replace(' . ', '. ')
@@ -94,45 +350,31 @@ def extreme_summarize_text(text: str, num_sentences: int = 10):
 
 
 def get_title_and_summary_sentiment(title_sum: str, review_sum: str):
-    sentiment_title_prediction = [list()]
-    sentiment_sum_prediction = [list()]
-    if title_sum:
-        if USE_HF_API:
-            sentiment_title_prediction = call_hf_text_classification(title_sum)
-        else:
-            sentiment_title_prediction = glb_classifier(title_sum)
-
-    if review_sum:
-        if USE_HF_API:
-            sentiment_sum_prediction = call_hf_text_classification(review_sum)
-        else:
-            sentiment_sum_prediction = glb_classifier(review_sum)
+    # Classify the title and the summary together, in a single batch
+    text_list = [text for text in (title_sum, review_sum) if text]
+    res_sent_iter = iter(classify_sentiment_batch(text_list))
 
+    sentiment_title_prediction = [next(res_sent_iter) if title_sum else list()]
+    sentiment_sum_prediction = [next(res_sent_iter) if review_sum else list()]
     return sentiment_title_prediction, sentiment_sum_prediction
 
 
-def classify_pro_con(pro_con: str, pos_label: str, neg_label: str, threshold: int = 3) -> str:
+def get_top_sentiment(sent_list: list):
     """
-    Classifies the given pro-con as positive or negative according to
-    its sentiment and given threshold.
-    :param pro_con: the pro-con string
-    :param pos_label: label to produce if the sentiment is positive.
-    :param neg_label: label to produce if the sentiment is negative.
-    :param threshold: value in [1-5] above which the sentiment is considered positive.
-    :return: either pos_label or neg_label. If it cannot decide, return empty string
+    Returns the most likely sentiment among the scores given by the sentiment classifier.
+    :param sent_list: list of {'label': 'N star(s)', 'score': float} maps.
+    :return: a pair (score, label)
     """
-    if USE_HF_API:
-        res_sent = call_hf_text_classification(pro_con)
-    else:
-        res_sent = glb_classifier(pro_con)
-
     label = ''
     score = -1.0
-    for sent in res_sent[0]:
+    for sent in sent_list:
         if sent['score'] > score:
             score = sent['score']
             label = sent['label']
+    return score, label
 
+
+def get_pro_con_label(label: str, pos_label: str, neg_label: str, threshold: int = 3) -> str:
     # Store the score
     label_value = int(label.split()[0].strip())
     if label_value != threshold:
@@ -148,30 +390,215 @@ def classify_pro_con(pro_con: str, pos_label: str, neg_label: str, threshold: in
     return ""
 
 
-def classify_pro_con_category_and_sentiment(attr: str, labels: list = CANDIDATE_PROD_LABELS):
-    # Find the category of the pro-con
-    if USE_HF_API:
-        res_cat = call_hf_zero_shot_classification(attr, labels)
-    else:
-        res_cat = glb_zero_shot(attr, labels, multi_label=True)
+def run_local_sentiment_batch(text_list: list) -> list:
+    res_sent_list = list()
+    for idx in range(0, len(text_list), CLASSIFIER_BATCH_SIZE):
+        text_batch = text_list[idx:idx + CLASSIFIER_BATCH_SIZE]
+        res_sent_list += get_model("classifier")(text_batch, batch_size=CLASSIFIER_BATCH_SIZE)
+    return res_sent_list
+
+
+def run_sentiment_batch(text_list: list) -> list:
+    """
+    Classifies the sentiment of the given texts, HF_MAX_INPUTS_PER_REQUEST texts per HuggingFace
+    request or CLASSIFIER_BATCH_SIZE texts per local model batch, bypassing the cache.
+    :param text_list: the texts to classify.
+    :return: the list of the sentiment scores of each text, aligned with text_list
+    """
+    return run_model_batch("sentiment", "classifier", async_call_hf_text_classification_batch,
+                           run_local_sentiment_batch, text_list)
+
+
+def classify_sentiment_batch(text_list: list) -> list:
+    """
+    Classifies the sentiment of the given texts, only the texts missing from the cache are run.
+    :param text_list: the texts to classify.
+    :return: the list of the sentiment scores of each text, aligned with text_list
+    """
+    return cached_inference_batch([get_sentiment_key(text) for text in text_list], get_batch_func("classifier"),
+                                  text_list)
 
+
+def classify_pro_con(pro_con: str, pos_label: str, neg_label: str, threshold: int = 3) -> str:
+    """
+    Classifies the given pro-con as positive or negative according to
+    its sentiment and given threshold.
+    :param pro_con: the pro-con string
+    :param pos_label: label to produce if the sentiment is positive.
+    :param neg_label: label to produce if the sentiment is negative.
+    :param threshold: value in [1-5] above which the sentiment is considered positive.
+    :return: either pos_label or neg_label. If it cannot decide, return empty string
+    """
+    _, label = get_top_sentiment(run_sentiment(pro_con))
+    return get_pro_con_label(label, pos_label, neg_label, threshold)
+
+
+def classify_pro_con_batch(pro_con_list: list, pos_label: str, neg_label: str, threshold: int = 3) -> list:
+    """
+    Classifies the given pros-cons as positive or negative, as classify_pro_con does,
+    with batched sentiment classification.
+    :param pro_con_list: the pro-con strings.
+    :param pos_label: label to produce if the sentiment is positive.
+    :param neg_label: label to produce if the sentiment is negative.
+    :param threshold: value in [1-5] above which the sentiment is considered positive.
+    :return: the list of labels (pos_label, neg_label or empty string) aligned with pro_con_list
+    """
+    label_list = list()
+    for res_sent in classify_sentiment_batch(pro_con_list):
+        _, label = get_top_sentiment(res_sent)
+        label_list.append(get_pro_con_label(label, pos_label, neg_label, threshold))
+    return label_list
+
+
+def get_top_categories(res_cat: dict) -> list:
     # Store the first category and the second if the delta score is less than 10%
     categories_list = [res_cat['labels'][0]]
     if res_cat['scores'][0] - res_cat['scores'][1] < 0.1:
         categories_list.append(res_cat['labels'][1])
+    return categories_list
 
-    # Find vote and pro-con
-    if USE_HF_API:
-        res_sent = call_hf_text_classification(attr)
+
+def run_local_zero_shot_batch(text_list: list, labels: list) -> list:
+    # With hybrid routing, the labels are scored as mutually exclusive as on HuggingFace
+    res_cat_list = get_model("zero_shot")(text_list, labels, multi_label=not USE_HF_API,
+                                          batch_size=ZERO_SHOT_BATCH_SIZE)
+    # Some versions of the pipeline unwrap single results
+    return [res_cat_list] if isinstance(res_cat_list, dict) else res_cat_list
+
+
+def run_zero_shot_batch(text_list: list, labels: list) -> list:
+    """
+    Zero-shot classifies the given texts over the candidate labels, bypassing the cache.
+    Locally, the (text, label) pairs of all the texts are run as padded batches of
+    ZERO_SHOT_BATCH_SIZE pairs, on HuggingFace HF_MAX_INPUTS_PER_REQUEST texts are sent per request.
+    :param text_list: the texts to classify.
+    :param labels: the candidate labels.
+    :return: the list of {'labels': [...], 'scores': [...]} maps, aligned with text_list
+    """
+    if not text_list:
+        return list()
+    return run_model_batch("zero_shot", "zero_shot", async_call_hf_zero_shot_classification_batch,
+                           run_local_zero_shot_batch, text_list, labels)
+
+
+def embed_texts(text_list: list) -> np.ndarray:
+    """
+    Embeds the given texts as the normalized average of the word vectors of their
+    content words (all their words if none is a content word with a vector).
+    :param text_list: the texts to embed.
+    :return: the matrix of the embeddings, one row per text
+    """
+    embedding_list = list()
+    for doc in tokenize_texts(text_list):
+        vector_list = [token.vector for token in doc if token.has_vector and not token.is_stop and not token.is_punct]
+        embedding_list.append(np.mean(vector_list, axis=0) if vector_list else doc.vector)
+    embedding_matrix = np.array(embedding_list, dtype=np.float32).reshape(len(text_list), -1)
+    norm_list = np.linalg.norm(embedding_matrix, axis=1, keepdims=True)
+    return embedding_matrix / np.where(norm_list > 0, norm_list, 1.0)
+
+
+@lru_cache(maxsize=8)
+def get_label_embeddings(labels: tuple) -> np.ndarray:
+    return embed_texts(list(labels))
+
+
+def classify_category_embedding_batch(text_list: list, labels: list) -> list:
+    """
+    Categorizes the given texts over the candidate labels by cosine similarity
+    of their embeddings with the (precomputed) embeddings of the labels.
+    :param text_list: the texts to classify.
+    :param labels: the candidate labels.
+    :return: the list of {'labels': [...], 'scores': [...]} maps, aligned with text_list,
+    as for zero-shot classification
+    """
+    if not text_list:
+        return list()
+    label_list = list(labels)
+
+    # Similarity of every text with every label in one matrix product
+    similarity_matrix = embed_texts(text_list) @ get_label_embeddings(tuple(label_list)).T
+    rank_matrix = np.argsort(-similarity_matrix, axis=1, kind="stable")
+
+    res_cat_list = list()
+    for similarity_list, rank_list in zip(similarity_matrix, rank_matrix):
+        res_cat_list.append({'labels': [label_list[idx] for idx in rank_list],
+                             'scores': [float(similarity_list[idx]) for idx in rank_list]})
+    return res_cat_list
+
+
+def classify_category_batch(text_list: list, labels: list) -> list:
+    """
+    Categorizes the given texts over the candidate labels with the CATEGORY_ENGINE.
+    Zero-shot classification only runs the texts missing from the cache.
+    :param text_list: the texts to classify.
+    :param labels: the candidate labels.
+    :return: the list of {'labels': [...], 'scores': [...]} maps, aligned with text_list
+    """
+    if CATEGORY_ENGINE == "embedding":
+        return classify_category_embedding_batch(text_list, labels)
+    return cached_inference_batch([get_zero_shot_key(text, labels) for text in text_list],
+                                  get_batch_func("zero_shot"), text_list, labels)
+
+
+def classify_pro_con_category_and_sentiment_batch(attr_list: list, labels: list = CANDIDATE_PROD_LABELS) -> list:
+    """
+    Finds categories and sentiment of the given pro-con attributes,
+    as classify_pro_con_category_and_sentiment does, with batched inference.
+    :param attr_list: the pro-con attributes.
+    :param labels: the candidate categories.
+    :return: the list of (score, label, categories_list) aligned with attr_list
+    """
+    res_cat_list = classify_category_batch(attr_list, labels)
+    res_sent_list = classify_sentiment_batch(attr_list)
+
+    output_list = list()
+    for res_cat, res_sent in zip(res_cat_list, res_sent_list):
+        score, label = get_top_sentiment(res_sent)
+        output_list.append((score, label, get_top_categories(res_cat)))
+    return output_list
+
+
+def classify_pro_con_category_and_sentiment(attr: str, labels: list = CANDIDATE_PROD_LABELS):
+    # Find the category of the pro-con
+    if CATEGORY_ENGINE == "embedding":
+        res_cat = classify_category_embedding_batch([attr], labels)[0]
     else:
-        res_sent = glb_classifier(attr)
+        res_cat = run_zero_shot(attr, labels)
+    categories_list = get_top_categories(res_cat)
+
+    # Find vote and pro-con
+    res_sent = run_sentiment(attr)
 
     # Store the score given by the attribute
-    label = ''
-    score = -1.0
-    for sent in res_sent[0]:
-        if sent['score'] > score:
-            score = sent['score']
-            label = sent['label']
+    score, label = get_top_sentiment(res_sent)
 
     return score, label, categories_list
+
+
+# Router of the model inferences between the HuggingFace API and the local models (with USE_HYBRID_ROUTING)
+glb_backend_router = BackendRouter()
+
+# Micro-batchers of the models by model name. The local models run one batch at a time
+# (each batch uses all the inference threads), the HuggingFace API gets concurrent batches
+glb_micro_batcher_map = {
+    "summarizer": MicroBatcher("summarizer", run_summarizer_batch, max_batch_size=SUMMARIZER_MICRO_BATCH_MAX_SIZE,
+                               num_workers=MAX_CONCURRENT_PIPELINES if USE_HF_API else 1),
+    "extreme_summarizer": MicroBatcher("extreme_summarizer", run_extreme_summarizer_batch,
+                                       max_batch_size=SUMMARIZER_MICRO_BATCH_MAX_SIZE,
+                                       num_workers=MAX_CONCURRENT_PIPELINES if USE_HF_API else 1),
+    "classifier": MicroBatcher("classifier", run_sentiment_batch,
+                               num_workers=MAX_CONCURRENT_PIPELINES if USE_HF_API else 1),
+    "zero_shot": MicroBatcher("zero_shot", run_zero_shot_batch,
+                              num_workers=MAX_CONCURRENT_PIPELINES if USE_HF_API else 1),
+}
+
+
+def get_batch_func(model_name: str):
+    """
+    Returns the function running a batch of inputs through the given model,
+    via its micro-batcher if micro-batching is enabled.
+    :param model_name: the name of the model.
+    :return: the batch function
+    """
+    micro_batcher = glb_micro_batcher_map[model_name]
+    return micro_batcher.submit if USE_MICRO_BATCHING else micro_batcher.batch_func
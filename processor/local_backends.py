@@ -0,0 +1,141 @@
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from service.const import *
+
+# Auto classes of the models by pipeline task
+TASK_MODEL_CLASS_MAP = {
+    "summarization": "AutoModelForSeq2SeqLM",
+    "text-classification": "AutoModelForSequenceClassification",
+    "zero-shot-classification": "AutoModelForSequenceClassification",
+}
+# ONNX Runtime (optimum) classes of the models by pipeline task
+TASK_ORT_MODEL_CLASS_MAP = {
+    "summarization": "ORTModelForSeq2SeqLM",
+    "text-classification": "ORTModelForSequenceClassification",
+    "zero-shot-classification": "ORTModelForSequenceClassification",
+}
+
+
+def get_model_cache_path(model: str, backend: str) -> Path:
+    """
+    Directory of the exported/quantized artifacts of a model.
+    :param model: the id of the model, e.g., "google/pegasus-xsum".
+    :param backend: the local backend.
+    :return: the directory of the artifacts
+    """
+    return Path(LOCAL_MODEL_CACHE_DIR) / backend / model.replace("/", "--")
+
+
+def save_model_artifacts(cache_path: Path, save_func):
+    """
+    Saves the artifacts of a model into a temporary directory, renamed to cache_path once complete,
+    so that the server workers never load partial artifacts, e.g., of a worker killed while saving.
+    If another worker saved them first, its artifacts are kept.
+    :param cache_path: the directory of the artifacts.
+    :param save_func: callable saving the artifacts into the given directory.
+    """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(prefix=f".{cache_path.name}-", dir=cache_path.parent))
+    try:
+        save_func(tmp_path)
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        if not cache_path.exists():
+            raise
+        logging.info(f"{cache_path} already saved by another worker")
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_pytorch_pipeline(task: str, model: str, **kwargs):
+    from transformers import pipeline
+    return pipeline(task, model=model, **kwargs)
+
+
+def load_quantized_pipeline(task: str, model: str, **kwargs):
+    """
+    Loads a pipeline whose linear layers are dynamically quantized to int8,
+    quantizing the model on first use and caching its weights on disk.
+    """
+    import torch
+    import transformers
+    from transformers import AutoConfig, AutoTokenizer, GenerationConfig, pipeline
+
+    model_class = getattr(transformers, TASK_MODEL_CLASS_MAP[task])
+    cache_path = get_model_cache_path(model, "quantized")
+    state_dict_path = cache_path / "quantized_state_dict.pt"
+    if cache_path.exists() and not state_dict_path.exists():
+        # Artifacts of the former format (pickled module), quantize again
+        shutil.rmtree(cache_path, ignore_errors=True)
+    if state_dict_path.exists():
+        # Quantize the (untrained) model built from the config, then load the quantized weights,
+        # only tensors are unpickled
+        quantized_model = torch.quantization.quantize_dynamic(
+            model_class.from_config(AutoConfig.from_pretrained(cache_path)), {torch.nn.Linear}, dtype=torch.qint8)
+        quantized_model.load_state_dict(torch.load(state_dict_path, weights_only=True))
+        quantized_model.eval()
+        if (cache_path / "generation_config.json").exists():
+            quantized_model.generation_config = GenerationConfig.from_pretrained(cache_path)
+        tokenizer = AutoTokenizer.from_pretrained(cache_path)
+    else:
+        logging.info(f"Quantizing {model} to {cache_path}")
+        quantized_model = torch.quantization.quantize_dynamic(model_class.from_pretrained(model), {torch.nn.Linear},
+                                                              dtype=torch.qint8)
+        tokenizer = AutoTokenizer.from_pretrained(model)
+
+        def save_func(path: Path):
+            quantized_model.config.save_pretrained(path)
+            if getattr(quantized_model, "generation_config", None) is not None:
+                quantized_model.generation_config.save_pretrained(path)
+            tokenizer.save_pretrained(path)
+            torch.save(quantized_model.state_dict(), path / state_dict_path.name)
+
+        save_model_artifacts(cache_path, save_func)
+    return pipeline(task, model=quantized_model, tokenizer=tokenizer, **kwargs)
+
+
+def load_onnx_pipeline(task: str, model: str, **kwargs):
+    """
+    Loads a pipeline running on ONNX Runtime, exporting the model to ONNX
+    on first use and caching it on disk. Needs the optional optimum[onnxruntime] package.
+    """
+    try:
+        import optimum.onnxruntime
+    except ImportError:
+        raise RuntimeError('The "onnx" local model backend needs optimum: pip install optimum[onnxruntime]')
+    from transformers import AutoTokenizer, pipeline
+
+    model_class = getattr(optimum.onnxruntime, TASK_ORT_MODEL_CLASS_MAP[task])
+    cache_path = get_model_cache_path(model, "onnx")
+    if cache_path.exists():
+        ort_model = model_class.from_pretrained(cache_path)
+        tokenizer = AutoTokenizer.from_pretrained(cache_path)
+    else:
+        logging.info(f"Exporting {model} to ONNX in {cache_path}")
+        ort_model = model_class.from_pretrained(model, export=True)
+        tokenizer = AutoTokenizer.from_pretrained(model)
+
+        def save_func(path: Path):
+            ort_model.save_pretrained(path)
+            tokenizer.save_pretrained(path)
+
+        save_model_artifacts(cache_path, save_func)
+    return pipeline(task, model=ort_model, tokenizer=tokenizer, **kwargs)
+
+
+def load_pipeline(task: str, model: str, backend: str = LOCAL_MODEL_BACKEND, **kwargs):
+    """
+    Loads a transformers pipeline running locally with the given backend.
+    :param task: the task of the pipeline, e.g., "summarization".
+    :param model: the id of the model.
+    :param backend: "pytorch" (fp32), "quantized" (PyTorch with int8 dynamic quantization) or "onnx" (ONNX Runtime).
+    :return: the pipeline
+    """
+    if backend == "quantized":
+        return load_quantized_pipeline(task, model, **kwargs)
+    if backend == "onnx":
+        return load_onnx_pipeline(task, model, **kwargs)
+    return load_pytorch_pipeline(task, model, **kwargs)
@@ -0,0 +1,112 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from service.const import *
+from service.metrics import MICRO_BATCH_QUEUE_WAIT, MICRO_BATCH_SIZE
+
+
+def get_params_key(params: tuple) -> tuple:
+    # Lists, e.g., candidate labels, are not hashable
+    return tuple(tuple(param) if isinstance(param, list) else param for param in params)
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching of model inferences across concurrent requests.
+    Callers (the pipeline threads) submit their inputs and wait, worker threads collect the
+    inputs of all the callers into batches of up to max_batch_size inputs, waiting at most max_wait
+    sec. for a batch to fill up, run each batch with a single call of batch_func and resolve the callers.
+    A failing batch is bisected, so that an input failing on its own does not fail the other callers.
+    Inputs submitted with different parameters (e.g., candidate labels) are never batched together.
+    """
+
+    def __init__(self, name: str, batch_func, max_batch_size: int = MICRO_BATCH_MAX_SIZE,
+                 max_wait: float = MICRO_BATCH_MAX_WAIT, num_workers: int = 1):
+        self.name = name
+        self.batch_func = batch_func
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.num_workers = num_workers
+        self._queue = queue.Queue()
+        self._workers_pid = None
+        self._lock = threading.Lock()
+
+    def _start_workers(self):
+        # Threads do not survive fork, each server worker starts its own
+        if self._workers_pid == os.getpid():
+            return
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            for idx in range(self.num_workers):
+                threading.Thread(target=self._run_worker, name=f"micro-batcher-{self.name}-{idx}", daemon=True).start()
+            self._workers_pid = os.getpid()
+
+    def submit(self, input_list: list, *params) -> list:
+        """
+        Runs the batch function over the given inputs, batched with the inputs of the other callers.
+        Blocks until all the inputs are processed.
+        :param input_list: the model inputs.
+        :param params: the other arguments of the batch function.
+        :return: the outputs, aligned with input_list
+        """
+        self._start_workers()
+        future_list = list()
+        for model_input in input_list:
+            future = Future()
+            self._queue.put((params, model_input, future, time.perf_counter()))
+            future_list.append(future)
+        return [future.result() for future in future_list]
+
+    def _collect_batch(self) -> list:
+        # Wait for the first input, then for the batch to fill up for at most max_wait sec.
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_worker(self):
+        while True:
+            batch = self._collect_batch()
+            batch_start_time = time.perf_counter()
+
+            # Group the inputs by parameters
+            params_map = dict()
+            for params, model_input, future, submit_time in batch:
+                MICRO_BATCH_QUEUE_WAIT.observe(batch_start_time - submit_time, model=self.name)
+                params_map.setdefault(get_params_key(params), (params, list()))[1].append((model_input, future))
+
+            for params, entry_list in params_map.values():
+                MICRO_BATCH_SIZE.observe(len(entry_list), model=self.name)
+                self._run_batch(entry_list, params)
+
+    def _run_batch(self, entry_list: list, params: tuple):
+        """
+        Runs the batch function over the given entries and resolves their futures.
+        If the batch fails, it is bisected down to the failing inputs, so that
+        only the callers of the inputs failing on their own get the exception.
+        :param entry_list: the list of (model input, future) to run.
+        :param params: the other arguments of the batch function.
+        """
+        try:
+            output_list = self.batch_func([model_input for model_input, _ in entry_list], *params)
+            if len(output_list) != len(entry_list):
+                raise RuntimeError(f"{self.name} returned {len(output_list)} outputs for {len(entry_list)} inputs")
+        except Exception as e:
+            if len(entry_list) == 1:
+                entry_list[0][1].set_exception(e)
+                return
+            half = len(entry_list) // 2
+            self._run_batch(entry_list[:half], params)
+            self._run_batch(entry_list[half:], params)
+            return
+        for (_, future), output in zip(entry_list, output_list):
+            future.set_result(output)
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+
+# Loaders of the models, by model name
+glb_model_loaders = dict()
+# Models loaded so far, by model name
+glb_model_map = dict()
+# Names of the models needed by the configured backend, loaded by the warm-up
+glb_required_model_names = list()
+glb_model_lock_map = dict()
+
+
+def register_model(model_name: str, loader, required: bool = True):
+    """
+    Registers a lazily loaded model.
+    :param model_name: the name of the model.
+    :param loader: callable with no arguments returning the loaded model.
+    :param required: whether the configured backend needs the model, i.e.,
+    whether it is loaded by the warm-up and checked by the readiness probe.
+    """
+    glb_model_loaders[model_name] = loader
+    glb_model_lock_map[model_name] = threading.Lock()
+    if required:
+        glb_required_model_names.append(model_name)
+
+
+def get_model(model_name: str):
+    """
+    Returns the given model, loading it on first use.
+    Concurrent callers wait for a single load.
+    :param model_name: the name of the model.
+    :return: the loaded model
+    """
+    model = glb_model_map.get(model_name)
+    if model is not None:
+        return model
+
+    with glb_model_lock_map[model_name]:
+        if model_name not in glb_model_map:
+            logging.info(f"get_model - loading {model_name}")
+            start_time = time.time()
+            glb_model_map[model_name] = glb_model_loaders[model_name]()
+            logging.info(f"get_model - loaded {model_name} in {time.time() - start_time:.1f}s")
+    return glb_model_map[model_name]
+
+
+def is_model_loaded(model_name: str) -> bool:
+    return model_name in glb_model_map
+
+
+def warm_up_models():
+    """
+    Loads all the models needed by the configured backend.
+    """
+    for model_name in glb_required_model_names:
+        try:
+            get_model(model_name)
+        except Exception as e:
+            logging.exception(e)
+
+
+def start_models_warm_up() -> threading.Thread:
+    """
+    Loads the models needed by the configured backend in a background thread.
+    :return: the warm-up thread
+    """
+    warm_up_thread = threading.Thread(target=warm_up_models, name="models_warm_up", daemon=True)
+    warm_up_thread.start()
+    return warm_up_thread
+
+
+def get_models_status() -> dict:
+    """
+    Returns the loading status of the models needed by the configured backend.
+    :return: a map with the "loaded" and "missing" model names
+    """
+    loaded = [model_name for model_name in glb_required_model_names if model_name in glb_model_map]
+    missing = [model_name for model_name in glb_required_model_names if model_name not in glb_model_map]
+    return {"loaded": loaded, "missing": missing}
+
+
+def models_ready() -> bool:
+    return all(model_name in glb_model_map for model_name in glb_required_model_names)
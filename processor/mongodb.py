@@ -0,0 +1,14 @@
+from functools import lru_cache
+from pymongo import MongoClient
+from service.const import *
+
+
+@lru_cache(maxsize=None)
+def get_mongodb_client() -> MongoClient:
+    """
+    Returns the MongoDB client shared by the processors of this process.
+    Note: MongoClient is thread-safe and keeps its own connection pool, it
+    must only be created after the server workers have been forked.
+    :return: the MongoDB client
+    """
+    return MongoClient(MONGO_DB_URL)
@@ -0,0 +1,59 @@
+from spacy.pipeline import Sentencizer
+from processor.model_loader import get_model, register_model
+from service.const import *
+
+# Components of the shared pipeline disabled by the views only needing the POS tags and the lemmas
+TAG_VIEW_DISABLED_PIPES = ["parser"]
+
+
+def load_nlp():
+    import spacy
+    # NER is never used, the statistical sentence segmenter is disabled by default
+    return spacy.load(SPACY_MODEL_NAME, exclude=["ner", "senter"])
+
+
+# spaCy pipeline shared by all the processor modules, loaded once per process, lazily on first use
+# or by the warm-up at startup
+register_model("nlp", load_nlp)
+# Rule-based sentence boundaries, run on the tokenized docs
+glb_sentencizer = Sentencizer()
+
+
+def get_nlp():
+    return get_model("nlp")
+
+
+def parse_text(text: str):
+    """
+    Tags, lemmatizes and parses the dependencies of the given text.
+    :param text: the text to parse.
+    :return: the spaCy doc
+    """
+    return get_nlp()(text)
+
+
+def tag_text(text: str):
+    """
+    Tags and lemmatizes the given text, without parsing its dependencies.
+    :param text: the text to tag.
+    :return: the spaCy doc
+    """
+    return get_nlp()(text, disable=TAG_VIEW_DISABLED_PIPES)
+
+
+def tokenize_texts(text_list: list):
+    """
+    Tokenizes the given texts, the tokens have the word vectors of the model.
+    :param text_list: the texts to tokenize.
+    :return: the iterator over the spaCy docs
+    """
+    return get_nlp().tokenizer.pipe(text_list)
+
+
+def split_sentences(text: str) -> list:
+    """
+    Splits the given text into sentences with the rule-based sentencizer.
+    :param text: the text to split.
+    :return: the list of the sentences, as spaCy spans
+    """
+    return list(glb_sentencizer(get_nlp().make_doc(text)).sents)
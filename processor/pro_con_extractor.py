@@ -1,278 +1,219 @@
 import openai
-import spacy
+from processor.inference_cache import cached_inference, get_inference_key
+from processor.nlp_provider import parse_text
 from service.const import *
+from service.metrics import track_external_call
 
 openai.api_key = OPEN_AI_KEY
-glb_nlp = spacy.load('en_core_web_md')
-
-
-def apply_extraction(text):
-    doc = glb_nlp(text)
-
-    prod_pronouns = ['it', 'this', 'they', 'these']
-
-    # FIRST RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-    # RULE = M is child of A with a relationshio of amod
-    rule1_pairs = []
-    for token in doc:
-        A = "999999"
-        M = "999999"
-        if token.dep_ == "amod" and not token.is_stop:
-            M = token.text
-            A = token.head.text
-
-            # add adverbial modifier of adjective (e.g. 'most comfortable headphones')
-            M_children = token.children
-            for child_m in M_children:
-                if child_m.dep_ == "advmod":
-                    M_hash = child_m.text
-                    M = M_hash + " " + M
-                    break
-
-            # negation in adjective, the "no" keyword is a 'det' of the noun (e.g. no interesting characters)
-            A_children = token.head.children
-            for child_a in A_children:
-                if child_a.dep_ == "det" and child_a.text == 'no':
-                    neg_prefix = 'not'
-                    M = neg_prefix + " " + M
-                    break
-
-        if A != "999999" and M != "999999":
-            rule1_pairs.append((A, M, 1))
-
-    # SECOND RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-    # Direct Object - A is a child of something with relationship of nsubj, while
-    # M is a child of the same something with relationship of dobj
-    # Assumption - A verb will have only one NSUBJ and DOBJ
-    rule2_pairs = []
-    for token in doc:
-        children = token.children
-        A = "999999"
-        M = "999999"
-        neg_prefix = ''
-        add_neg_pfx = False
-        for child in children:
-            if child.dep_ == "nsubj" and not child.is_stop:
-                A = child.text
-
-            if (child.dep_ == "dobj" and child.pos_ == "ADJ") and not child.is_stop:
-                M = child.text
-
-            if child.dep_ == "neg":
-                neg_prefix = child.text
-                add_neg_pfx = True
-
-        if add_neg_pfx and M != "999999":
-            M = neg_prefix + " " + M
-
-        if A != "999999" and M != "999999":
-            rule2_pairs.append((A, M, 2))
-
-    # THIRD RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-    # Adjectival Complement - A is a child of something with relationship of nsubj, while
-    # M is a child of the same something with relationship of acomp
-    # Assumption - A verb will have only one NSUBJ and DOBJ
-    # "The sound of the speakers would be better. The sound of the speakers could be better" - handled using AUX dependency
-    rule3_pairs = []
-    for token in doc:
-        children = token.children
-        A = "999999"
-        M = "999999"
-        neg_prefix = ''
-        add_neg_pfx = False
-        for child in children:
-            if child.dep_ == "nsubj" and not child.is_stop:
-                A = child.text
-
-            if child.dep_ == "acomp" and not child.is_stop:
-                M = child.text
-
-            # example - 'this could have been better' -> (this, not better)
-            if child.dep_ == "aux" and child.tag_ == "MD":
-                neg_prefix = "not"
-                add_neg_pfx = True
-
-            if child.dep_ == "neg":
-                neg_prefix = child.text
-                add_neg_pfx = True
-
-        if add_neg_pfx and M != "999999":
-            M = neg_prefix + " " + M
-            # check_spelling(child.text)
-
-        if A != "999999" and M != "999999":
-            rule3_pairs.append((A, M, 3))
-
-    # FOURTH RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-
-    # Adverbial modifier to a passive verb - A is a child of something with relationship of nsubjpass, while
-    # M is a child of the same something with relationship of advmod
-
-    # Assumption - A verb will have only one NSUBJ and DOBJ
-    rule4_pairs = []
+openai.api_base = OPEN_AI_API_BASE
+
+
+# Placeholder of a missing aspect or modifier
+MISSING = "999999"
+PROD_PRONOUNS = ['it', 'this', 'they', 'these']
+
+
+def extract_dependency_pairs(doc, verbose=False):
+    """
+    Evaluates the seven aspect/modifier rules and the compound noun rule of the dependency parse
+    in a single traversal of the doc, visiting the children of each token once.
+    M - Sentiment modifier || A - Aspect
+    RULE 1 - M is child of A with a relationship of amod (e.g. 'most comfortable headphones')
+    RULE 2 - Direct Object - A is a child of something with relationship of nsubj, while
+    M is a child of the same something with relationship of dobj
+    RULE 3 - Adjectival Complement - A is a child of something with relationship of nsubj, while
+    M is a child of the same something with relationship of acomp (e.g. 'this could have been better')
+    RULE 4 - Adverbial modifier to a passive verb - A is a child of something with relationship of nsubjpass, while
+    M is a child of the same something with relationship of advmod
+    RULE 5 - Complement of a copular verb - A is a child of M with relationship of nsubj, while
+    M has a child with relationship of cop
+    RULE 6 - Example - "It ok", "ok" is INTJ (interjections like bravo, great etc)
+    RULE 7 - ATTR - link between a verb like 'be/seem/appear' and its complement (e.g. 'this is garbage')
+    Assumption - A verb will have only one NSUBJ and DOBJ
+    :param doc: the parsed text.
+    :param verbose: whether to print the compound nouns, for trying different dependency tree parsing rules.
+    :return: a pair (aspect tuples, in the order of apply_extraction, compound tuples, as get_compound_pairs)
+    """
+    rule_pairs_list = [list() for _ in range(7)]
+    # Rule 1 pairs waiting for the negation of their aspect, which may come later in the doc
+    rule1_candidate_list = list()
+    no_det_idx_set = set()
+    compound_list = list()
+    prev_dep = None
     for token in doc:
-
-        children = token.children
-        A = "999999"
-        M = "999999"
-        neg_prefix = ''
-        add_neg_pfx = False
-        for child in children:
-            if (child.dep_ == "nsubjpass" or child.dep_ == "nsubj") and not child.is_stop:
-                A = child.text
-
-            if child.dep_ == "advmod" and not child.is_stop:
-                M = child.text
-                M_children = child.children
-                for child_m in M_children:
-                    if child_m.dep_ == "advmod":
-                        M_hash = child_m.text
-                        M = M_hash + " " + child.text
-                        break
-
-            if child.dep_ == "neg":
+        dep = token.dep_
+        # Keep the first part of the compound nouns
+        if dep == "compound" and prev_dep != "compound":
+            compound_list.append(token)
+        prev_dep = dep
+
+        # The last matching child wins, as when each rule walked the children on its own
+        subj = MISSING
+        subj_or_pass = MISSING
+        dobj_adj = MISSING
+        acomp = MISSING
+        advmod = MISSING
+        attr = MISSING
+        cop = MISSING
+        neg_prefix = None
+        rule3_neg_prefix = None
+        first_advmod = None
+        for child in token.children:
+            child_dep = child.dep_
+            if child_dep == "nsubj" or child_dep == "nsubjpass":
+                if not child.is_stop:
+                    subj_or_pass = child.text
+                    if child_dep == "nsubj":
+                        subj = child.text
+            elif child_dep == "dobj":
+                if child.pos_ == "ADJ" and not child.is_stop:
+                    dobj_adj = child.text
+            elif child_dep == "acomp":
+                if not child.is_stop:
+                    acomp = child.text
+            elif child_dep == "advmod":
+                if first_advmod is None:
+                    first_advmod = child.text
+                if not child.is_stop:
+                    advmod = child.text
+                    for child_m in child.children:
+                        if child_m.dep_ == "advmod":
+                            advmod = child_m.text + " " + child.text
+                            break
+            elif child_dep == "cop":
+                if not child.is_stop:
+                    cop = child.text
+            elif child_dep == "attr":
+                if not child.is_stop:
+                    attr = child.text
+            elif child_dep == "neg":
                 neg_prefix = child.text
-                add_neg_pfx = True
-
-        if add_neg_pfx and M != "999999":
-            M = neg_prefix + " " + M
-
-        if A != "999999" and M != "999999":
-            rule4_pairs.append((A, M, 4))
-
-    # FIFTH RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-    # Complement of a copular verb - A is a child of M with relationship of nsubj, while
-    # M has a child with relationship of cop
-    # Assumption - A verb will have only one NSUBJ and DOBJ
-    rule5_pairs = []
-    for token in doc:
-        children = token.children
-        A = "999999"
-        buf_var = "999999"
-        for child in children :
-            if child.dep_ == "nsubj" and not child.is_stop:
-                A = child.text
-                # check_spelling(child.text)
+                rule3_neg_prefix = child.text
+            elif child_dep == "aux":
+                # example - 'this could have been better' -> (this, not better)
+                if child.tag_ == "MD":
+                    rule3_neg_prefix = "not"
+            elif child_dep == "det":
+                # negation in adjective, the "no" keyword is a 'det' of the noun (e.g. no interesting characters)
+                if child.text == "no":
+                    no_det_idx_set.add(token.i)
+
+        if dep == "amod" and not token.is_stop:
+            # add adverbial modifier of adjective (e.g. 'most comfortable headphones')
+            M = token.text if first_advmod is None else first_advmod + " " + token.text
+            rule1_candidate_list.append((token.head, M))
 
-            if child.dep_ == "cop" and not child.is_stop:
-                buf_var = child.text
-                # check_spelling(child.text)
+        for rule_idx, A, M, M_neg_prefix in ((1, subj, dobj_adj, neg_prefix), (2, subj, acomp, rule3_neg_prefix),
+                                             (3, subj_or_pass, advmod, neg_prefix), (6, subj, attr, neg_prefix)):
+            if M_neg_prefix is not None and M != MISSING:
+                M = M_neg_prefix + " " + M
+            if A != MISSING and M != MISSING:
+                rule_pairs_list[rule_idx].append((A, M, rule_idx + 1))
 
-        if A != "999999" and buf_var != "999999":
-            rule5_pairs.append((A, token.text, 5))
+        if subj != MISSING and cop != MISSING:
+            rule_pairs_list[4].append((subj, token.text, 5))
 
-    # SIXTH RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-    # Example - "It ok", "ok" is INTJ (interjections like bravo, great etc)
-    rule6_pairs = []
-    for token in doc:
-        children = token.children
-        A = "999999"
-        M = "999999"
-        if token.pos_ == "INTJ" and not token.is_stop:
-            for child in children :
-                if(child.dep_ == "nsubj" and not child.is_stop):
-                    A = child.text
-                    M = token.text
+        if token.pos_ == "INTJ" and not token.is_stop and subj != MISSING and token.text != MISSING:
+            rule_pairs_list[5].append((subj, token.text, 6))
 
-        if A != "999999" and M != "999999":
-            rule6_pairs.append((A, M, 6))
+    for head, M in rule1_candidate_list:
+        if head.i in no_det_idx_set:
+            M = "not " + M
+        if head.text != MISSING and M != MISSING:
+            rule_pairs_list[0].append((head.text, M, 1))
 
-    # SEVENTH RULE OF DEPENDANCY PARSE -
-    # M - Sentiment modifier || A - Aspect
-    # ATTR - link between a verb like 'be/seem/appear' and its complement
-    # Example: 'this is garbage' -> (this, garbage)
-    rule7_pairs = []
-    for token in doc:
-        children = token.children
-        A = "999999"
-        M = "999999"
-        neg_prefix = ''
-        add_neg_pfx = False
-        for child in children :
-            if child.dep_ == "nsubj" and not child.is_stop:
-                A = child.text
-
-            if (child.dep_ == "attr") and not child.is_stop:
-                M = child.text
-
-            if child.dep_ == "neg":
-                neg_prefix = child.text
-                add_neg_pfx = True
+    aspects = [pair for rule_pairs in rule_pairs_list for pair in rule_pairs]
+    # replace all instances of "it", "this" and "they" with "product"
+    aspects = [(A, M, r) if A not in PROD_PRONOUNS else ("product", M, r) for A, M, r in aspects]
+    return aspects, get_compound_noun_pairs(doc, compound_list, verbose)
 
-        if add_neg_pfx and M != "999999":
-            M = neg_prefix + " " + M
 
-        if A != "999999" and M != "999999":
-            rule7_pairs.append((A, M, 7))
+def get_compound_noun_pairs(doc, compound_list: list, verbose=False):
+    """Return tuples of (multi-noun word, adjective or verb) for the given first parts of the compound nouns."""
+    tuple_list = []
+    for tok in compound_list:
+        pair_item_1, pair_item_2 = (False, False) # initialize false variables
+        noun = doc[tok.i: tok.head.i + 1]
+        pair_item_1 = noun
+        # If noun is in the subject, we may be looking for adjective in predicate
+        # In simple cases, this would mean that the noun shares a head with the adjective
+        if noun.root.dep_ == 'nsubj':
+            adj_list = [r for r in noun.root.head.rights if r.pos_ == 'ADJ']
+            if adj_list:
+                pair_item_2 = adj_list[0]
+            if verbose: # For trying different dependency tree parsing rules
+                print("Noun: ", noun)
+                print("Noun root: ", noun.root)
+                print("Noun root head: ", noun.root.head)
+                print("Noun root head rights: ", [r for r in noun.root.head.rights if r.pos_ == 'ADJ'])
+        if noun.root.dep_ == 'dobj':
+            verb_ancestor_list = [a for a in noun.root.ancestors if a.pos_ == 'VERB']
+            if verb_ancestor_list:
+                pair_item_2 = verb_ancestor_list[0]
+            if verbose: # For trying different dependency tree parsing rules
+                print("Noun: ", noun)
+                print("Noun root: ", noun.root)
+                print("Noun root head: ", noun.root.head)
+                print("Noun root head verb ancestors: ", [a for a in noun.root.ancestors if a.pos_ == 'VERB'])
+        if pair_item_1 and pair_item_2:
+            tuple_list.append((pair_item_1.text_with_ws, pair_item_2.text_with_ws, 1))
+    return tuple_list
 
-    aspects = rule1_pairs + rule2_pairs + rule3_pairs + rule4_pairs + rule5_pairs + rule6_pairs + rule7_pairs
 
-    # replace all instances of "it", "this" and "they" with "product"
-    aspects = [(A, M, r) if A not in prod_pronouns else ("product", M, r) for A, M, r in aspects]
-    return aspects
+def apply_extraction(text):
+    doc = parse_text(text)
+    return extract_dependency_pairs(doc)[0]
 
 
 def get_compound_pairs(text, verbose=False):
     """Return tuples of (multi-noun word, adjective or verb) for document."""
-    doc = glb_nlp(text)
-
-    # Get list of compounds in doc
-    compounds = [tok for tok in doc if tok.dep_ == 'compound']
-
-    # Remove middle parts of compound nouns, but avoid index errors
-    compounds = [c for c in compounds if c.i == 0 or doc[c.i - 1].dep_ != 'compound']
-    tuple_list = []
-    if compounds:
-        for tok in compounds:
-            pair_item_1, pair_item_2 = (False, False) # initialize false variables
-            noun = doc[tok.i: tok.head.i + 1]
-            pair_item_1 = noun
-            # If noun is in the subject, we may be looking for adjective in predicate
-            # In simple cases, this would mean that the noun shares a head with the adjective
-            if noun.root.dep_ == 'nsubj':
-                adj_list = [r for r in noun.root.head.rights if r.pos_ == 'ADJ']
-                if adj_list:
-                    pair_item_2 = adj_list[0]
-                if verbose: # For trying different dependency tree parsing rules
-                    print("Noun: ", noun)
-                    print("Noun root: ", noun.root)
-                    print("Noun root head: ", noun.root.head)
-                    print("Noun root head rights: ", [r for r in noun.root.head.rights if r.pos_ == 'ADJ'])
-            if noun.root.dep_ == 'dobj':
-                verb_ancestor_list = [a for a in noun.root.ancestors if a.pos_ == 'VERB']
-                if verb_ancestor_list:
-                    pair_item_2 = verb_ancestor_list[0]
-                if verbose: # For trying different dependency tree parsing rules
-                    print("Noun: ", noun)
-                    print("Noun root: ", noun.root)
-                    print("Noun root head: ", noun.root.head)
-                    print("Noun root head verb ancestors: ", [a for a in noun.root.ancestors if a.pos_ == 'VERB'])
-            if pair_item_1 and pair_item_2:
-                tuple_list.append((pair_item_1.text_with_ws, pair_item_2.text_with_ws, 1))
-    return tuple_list
+    doc = parse_text(text)
+    return extract_dependency_pairs(doc, verbose)[1]
+
+
+def extract_pro_con_pairs(text):
+    """
+    Extracts the aspect/modifier pairs of apply_extraction followed by the compound pairs
+    of get_compound_pairs, parsing the text once.
+    :param text: the text to extract the pros and cons from.
+    :return: the list of (aspect, modifier, rule) tuples
+    """
+    doc = parse_text(text)
+    aspects, compound_pairs = extract_dependency_pairs(doc)
+    return aspects + compound_pairs
+
+
+def get_gpt3_completion(prompt: str, max_tokens: int) -> str:
+    """
+    Completes the given prompt with GPT-3.
+    The completion is deterministic (temperature 0), hence it is cached with the model inferences.
+    :param prompt: the prompt.
+    :param max_tokens: max number of tokens to generate.
+    :return: the completion
+    """
+    def create_completion():
+        with track_external_call(service="openai", endpoint=OPEN_AI_ENGINE):
+            response = openai.Completion.create(
+                engine=OPEN_AI_ENGINE,
+                prompt=prompt,
+                temperature=0,
+                max_tokens=max_tokens,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0,
+                stop=["Review"]
+            )
+        return response['choices'][0]['text']
+
+    key = get_inference_key(OPEN_AI_ENGINE, "completion", prompt, params=(max_tokens,))
+    return cached_inference(key, create_completion)
 
 
 def pro_con_gpt3_extractor(text: str):
     generated_pro_con_list = list()
 
     gpt3_prompt = OPEN_AI_PROMPT + text + OPEN_AI_SUFFIX
-    response = openai.Completion.create(
-        engine=OPEN_AI_ENGINE,
-        prompt=gpt3_prompt,
-        temperature=0,
-        max_tokens=15,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0,
-        stop=["Review"]
-    )
-    gen_pro_con = response['choices'][0]['text']
+    gen_pro_con = get_gpt3_completion(gpt3_prompt, max_tokens=15)
     gen_pro_con_list = gen_pro_con.strip().split('\n')
     for pro_con in gen_pro_con_list:
         pro_con = pro_con.strip()
@@ -289,17 +230,7 @@ def pro_con_restaurant_gpt3_extractor(text: str):
     generated_pro_con_list = list()
 
     gpt3_prompt = OPEN_AI_RESTAURANT_PROMPT + text + OPEN_AI_SUFFIX
-    response = openai.Completion.create(
-        engine=OPEN_AI_ENGINE,
-        prompt=gpt3_prompt,
-        temperature=0,
-        max_tokens=30,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0,
-        stop=["Review"]
-    )
-    gen_pro_con = response['choices'][0]['text']
+    gen_pro_con = get_gpt3_completion(gpt3_prompt, max_tokens=30)
     gen_pro_con_list = gen_pro_con.strip().split('\n')
     for pro_con in gen_pro_con_list:
         pro_con = pro_con.strip()
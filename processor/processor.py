@@ -1,13 +1,14 @@
 import string
 from operator import itemgetter
-from processor.pro_con_extractor import (apply_extraction, get_compound_pairs, pro_con_gpt3_extractor)
-from processor.language_models import (classify_pro_con_category_and_sentiment, classify_pro_con,
+from processor.pro_con_extractor import extract_pro_con_pairs, pro_con_gpt3_extractor
+from processor.language_models import (classify_pro_con_batch, classify_pro_con_category_and_sentiment_batch,
                                        extreme_summarize_text, get_title_and_summary_sentiment, summarize_text)
+from processor.mongodb import get_mongodb_client
 from processor.scraper import spider_scrape
 from processor.utils import (clean_pro_con_attr, clean_pro_con_item, get_product_name_from_url, get_rating_from_string,
-                             switch_label_value)
-from pymongo import MongoClient
+                             notify_stage, switch_label_value)
 from service.const import *
+from service.metrics import STAGE_LATENCY, record_cache_lookup, track_external_call
 
 
 def get_pro_con_from_mongodb(url: str, pc_collection):
@@ -22,7 +23,8 @@ def get_pro_con_from_mongodb(url: str, pc_collection):
     query = {
         'prod': product_name
     }
-    prod_data = pc_collection.find_one(query)
+    with track_external_call(service="mongodb", endpoint="find_one"):
+        prod_data = pc_collection.find_one(query)
     return prod_data
 
 
@@ -121,10 +123,8 @@ def get_pro_con_map(review_data, use_generative_model: bool = True):
 
     title_sum = review_data['title_sum']
     review_sum = ' '.join(review_data['all_titles'])
-    pro_con_list = apply_extraction(text=title_sum)
-    pro_con_list += get_compound_pairs(text=title_sum)
-    pro_con_list += apply_extraction(text=review_sum)
-    pro_con_list += get_compound_pairs(text=review_sum)
+    pro_con_list = extract_pro_con_pairs(text=title_sum)
+    pro_con_list += extract_pro_con_pairs(text=review_sum)
 
     # Store procon in map
     pro_con_map = dict()
@@ -170,8 +170,8 @@ def analyze_gen_pro_con(pro_con_list: list):
     category_pro_con_map = dict()
     category_pro_con_map[pos_label] = list()
     category_pro_con_map[neg_label] = list()
-    for pro_con in pro_con_list:
-        label = classify_pro_con(pro_con, pos_label, neg_label)
+    label_list = classify_pro_con_batch(pro_con_list, pos_label, neg_label)
+    for pro_con, label in zip(pro_con_list, label_list):
         if label:
             category_pro_con_map[label].append(pro_con)
     return category_pro_con_map
@@ -193,33 +193,33 @@ def analyze_pro_con(pro_con_map):
     category_pro_con_map[neg_label] = dict()
     for cat in CANDIDATE_PROD_LABELS:
         category_ctr_map[cat] = {'ctr': 0, 'num_entries': 0}
-    for key, val in pro_con_map.items():
-        for text in val:
-            attr = text + ' ' + key
-
-            # Find the category of the pro-con
-            score, label, categories_list = classify_pro_con_category_and_sentiment(attr)
-
-            # Store the score
-            attr_score[text] = score
-            label_value = int(label.split()[0].strip())
-
-            # Modify incorrect sentiments for price
-            if key in PRICE_CAT and text in PRICE_RANGE:
-                label_value = switch_label_value(label_value)
-
-            # Add voting counter to the category
-            for cat in categories_list:
-                category_ctr_map[cat]['ctr'] += label_value
-                category_ctr_map[cat]['num_entries'] += 1
-            if label_value != 3:
-                if label_value > 3:
-                    label = pos_label
-                else:
-                    label = neg_label
-                if key not in category_pro_con_map[label]:
-                    category_pro_con_map[label][key] = list()
-                category_pro_con_map[label][key].append([text, attr_score[text]])
+    key_text_list = [(key, text) for key, val in pro_con_map.items() for text in val]
+
+    # Find the categories and sentiment of all the pros-cons at once
+    attr_list = [text + ' ' + key for key, text in key_text_list]
+    res_list = classify_pro_con_category_and_sentiment_batch(attr_list=attr_list, labels=CANDIDATE_PROD_LABELS)
+
+    for (key, text), (score, label, categories_list) in zip(key_text_list, res_list):
+        # Store the score
+        attr_score[text] = score
+        label_value = int(label.split()[0].strip())
+
+        # Modify incorrect sentiments for price
+        if key in PRICE_CAT and text in PRICE_RANGE:
+            label_value = switch_label_value(label_value)
+
+        # Add voting counter to the category
+        for cat in categories_list:
+            category_ctr_map[cat]['ctr'] += label_value
+            category_ctr_map[cat]['num_entries'] += 1
+        if label_value != 3:
+            if label_value > 3:
+                label = pos_label
+            else:
+                label = neg_label
+            if key not in category_pro_con_map[label]:
+                category_pro_con_map[label][key] = list()
+            category_pro_con_map[label][key].append([text, attr_score[text]])
 
     # Calculate percentage for scores in categories
     for key, value in category_ctr_map.items():
@@ -242,7 +242,49 @@ def analyze_pro_con(pro_con_map):
     return category_ctr_map, category_pro_con_map
 
 
-def extract_pro_con(url: str) -> dict:
+def get_cached_pro_con(url: str, record_metrics: bool = True):
+    """
+    Fetches the pro-con data of an Amazon product from the MongoDB cache.
+    :param url: a url of an Amazon product.
+    :param record_metrics: if False, do not count the lookup in the cache metrics
+    (e.g., the caller already counted its own lookup of the same data).
+    :return: the dictionary of pro-con MetaData, or None if not cached
+    """
+    pc_metadata = get_mongodb_client().comparison_engine.review_metadata
+    stored_review_data = get_pro_con_from_mongodb(url, pc_metadata)
+    if record_metrics:
+        record_cache_lookup(pipeline="pro_con", hit=stored_review_data is not None)
+    if stored_review_data is not None:
+        # Drop MongoDB _id
+        del stored_review_data["_id"]
+    return stored_review_data
+
+
+def get_cached_pro_con_batch(urls: list) -> dict:
+    """
+    Fetches the pro-con data of many Amazon products from the MongoDB cache
+    with a single query.
+    :param urls: the urls of the Amazon products.
+    :return: a map from product name to its pro-con MetaData, for the cached products only
+    """
+    pc_metadata = get_mongodb_client().comparison_engine.review_metadata
+    product_name_list = list(set(get_product_name_from_url(url) for url in urls))
+
+    with track_external_call(service="mongodb", endpoint="find"):
+        prod_data_list = list(pc_metadata.find({'prod': {'$in': product_name_list}}))
+
+    cached_map = dict()
+    for prod_data in prod_data_list:
+        # Keep the first stored document as find_one would
+        if prod_data['prod'] not in cached_map:
+            del prod_data["_id"]
+            cached_map[prod_data['prod']] = prod_data
+    record_cache_lookup(pipeline="pro_con", hit=True, num_lookups=len(cached_map))
+    record_cache_lookup(pipeline="pro_con", hit=False, num_lookups=len(product_name_list) - len(cached_map))
+    return cached_map
+
+
+def extract_pro_con(url: str, on_stage=None, use_cache: bool = True) -> dict:
     """
     Given the url of an Amazon product page, extracts pro-con
     data for that product.
@@ -251,42 +293,53 @@ def extract_pro_con(url: str) -> dict:
     If the data is not present, it scrapes it from the web,
     caches the results, and returns the data.
     :param url: a url of an Amazon product.
+    :param on_stage: optional callable invoked with the name and output
+    of each pipeline stage as soon as it completes.
+    :param use_cache: if False, skip the MongoDB lookup (e.g., the caller already checked it).
     :return: the dictionary of pro-con MetaData
     """
-    # Connect to MongoDB
-    mongo_db_client = MongoClient(MONGO_DB_URL)
-    pc_db = mongo_db_client.comparison_engine
-    pc_metadata = pc_db.review_metadata
-
-    # Step 0: check if the object has been scraped already
-    stored_review_data = get_pro_con_from_mongodb(url, pc_metadata)
-    if stored_review_data is not None:
-        # Drop MongoDB _id
-        del stored_review_data["_id"]
-        return stored_review_data
+    # Step 0: check if the object has been scraped already, the caller counted its own cache lookup
+    if use_cache:
+        stored_review_data = get_cached_pro_con(url, record_metrics=False)
+        if stored_review_data is not None:
+            notify_stage(on_stage, "cache", stored_review_data)
+            return stored_review_data
 
     # Step 1: scrape the web page to get reviews
-    review_info = spider_scrape(url=url, num_review_pages=NUM_REVIEW_PAGES_TO_SCRAPE)
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="spider_scrape"):
+        review_info = spider_scrape(url=url, num_review_pages=NUM_REVIEW_PAGES_TO_SCRAPE)
+    notify_stage(on_stage, "meta", review_info["meta"])
 
     # Step 2: extract review summary
-    review_data = run_basic_pro_con_analysis(review_info)
-
-    # Step 3: create a pro-con map
-    gen_model = False
-    pro_con_map = get_pro_con_map(review_data, use_generative_model=gen_model)
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="run_basic_pro_con_analysis"):
+        review_data = run_basic_pro_con_analysis(review_info)
+    notify_stage(on_stage, "summary", dict(review_data))
 
-    # Step 3.b: create a pro-con list using a generative model
-    gen_model = True
-    pro_con_list = get_pro_con_map(review_data, use_generative_model=gen_model)
+    # Step 3: get overall sentiment (stages are ordered so that the cheapest outputs are ready first)
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="get_sentiment_map"):
+        sentiment_map = get_sentiment_map(review_data)
+    notify_stage(on_stage, "sentiment_map", sentiment_map)
 
-    # Ste 4: get overall sentiment
-    sentiment_map = get_sentiment_map(review_data)
+    # Step 4: create a pro-con map
+    gen_model = False
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="get_pro_con_map_rule"):
+        pro_con_map = get_pro_con_map(review_data, use_generative_model=gen_model)
 
     # Step 5: process pro-con for product analysis
-    category_ctr_map, category_pro_con_map = analyze_pro_con(pro_con_map)
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="analyze_pro_con"):
+        category_ctr_map, category_pro_con_map = analyze_pro_con(pro_con_map)
+    notify_stage(on_stage, "pro_con_map", category_pro_con_map)
+    notify_stage(on_stage, "category_map", category_ctr_map)
+
+    # Step 4.b: create a pro-con list using a generative model
+    gen_model = True
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="get_pro_con_map_generative"):
+        pro_con_list = get_pro_con_map(review_data, use_generative_model=gen_model)
 
     # Step 5.b: process generated pro-con for product analysis
-    category_gen_pro_con_map = analyze_gen_pro_con(pro_con_list)
+    with STAGE_LATENCY.time(pipeline="pro_con", stage="analyze_gen_pro_con"):
+        category_gen_pro_con_map = analyze_gen_pro_con(pro_con_list)
+    notify_stage(on_stage, "gen_pro_con_map", category_gen_pro_con_map)
 
     # Add sentiment and pro-con analysis to the review data map
     review_data["meta"] = review_info["meta"]
@@ -299,7 +352,9 @@ def extract_pro_con(url: str) -> dict:
     # Before returning, store the data to MongoDB
     product_name = get_product_name_from_url(url)
     review_data['prod'] = product_name
-    pc_metadata.insert_one(review_data)
+    pc_metadata = get_mongodb_client().comparison_engine.review_metadata
+    with track_external_call(service="mongodb", endpoint="insert_one"):
+        pc_metadata.insert_one(review_data)
 
     # Return the full analysis
     if "_id" in review_data:
@@ -1,11 +1,12 @@
 import string
 from operator import itemgetter
-from pymongo import MongoClient
-from processor.language_models import (classify_pro_con_category_and_sentiment, classify_pro_con,
+from processor.language_models import (classify_pro_con_batch, classify_pro_con_category_and_sentiment_batch,
                                        get_title_and_summary_sentiment, summarize_text)
-from processor.pro_con_extractor import (apply_extraction, get_compound_pairs, pro_con_restaurant_gpt3_extractor)
-from processor.utils import (clean_pro_con_attr, clean_pro_con_item, switch_label_value)
+from processor.mongodb import get_mongodb_client
+from processor.pro_con_extractor import extract_pro_con_pairs, pro_con_restaurant_gpt3_extractor
+from processor.utils import (clean_pro_con_attr, clean_pro_con_item, notify_stage, switch_label_value)
 from service.const import *
+from service.metrics import STAGE_LATENCY, record_cache_lookup, track_external_call
 
 
 def get_pro_con_from_mongodb(name: str, city: str, pc_collection):
@@ -20,9 +21,10 @@ def get_pro_con_from_mongodb(name: str, city: str, pc_collection):
         'name': name,
         'city': city
     }
-    res_result = pc_collection.find_one(
-        filter=res_filter
-    )
+    with track_external_call(service="mongodb", endpoint="find_one"):
+        res_result = pc_collection.find_one(
+            filter=res_filter
+        )
     return res_result
 
 
@@ -36,9 +38,10 @@ def get_yelp_metadata(name: str, city: str, mongodb_client):
         'name': name,
         'city': city
     }
-    res_result = res_collection.find_one(
-        filter=res_filter
-    )
+    with track_external_call(service="mongodb", endpoint="find_one"):
+        res_result = res_collection.find_one(
+            filter=res_filter
+        )
     return res_result
 
 
@@ -119,8 +122,7 @@ def get_pro_con_map(review_data, use_generative_model: bool, num_reviews_for_pro
         return pro_con_list
 
     merged_reviews = '. '.join(review_data['reviews_sum'][:num_reviews_for_pro_con])
-    pro_con_list = apply_extraction(text=merged_reviews)
-    pro_con_list += get_compound_pairs(text=merged_reviews)
+    pro_con_list = extract_pro_con_pairs(text=merged_reviews)
 
     # Store procon in map
     pro_con_map = dict()
@@ -165,8 +167,8 @@ def analyze_gen_pro_con(pro_con_list: list):
     category_pro_con_map = dict()
     category_pro_con_map[pos_label] = list()
     category_pro_con_map[neg_label] = list()
-    for pro_con in pro_con_list:
-        label = classify_pro_con(pro_con, pos_label, neg_label)
+    label_list = classify_pro_con_batch(pro_con_list, pos_label, neg_label)
+    for pro_con, label in zip(pro_con_list, label_list):
         if label:
             category_pro_con_map[label].append(pro_con)
     return category_pro_con_map
@@ -188,34 +190,33 @@ def analyze_pro_con(pro_con_map):
     category_pro_con_map[neg_label] = dict()
     for cat in CANDIDATE_RESTAURANT_LABELS:
         category_ctr_map[cat] = {'ctr': 0, 'num_entries': 0}
-    for key, val in pro_con_map.items():
-        for text in val:
-            attr = text + ' ' + key
-
-            # Find the category of the pro-con
-            score, label, categories_list = classify_pro_con_category_and_sentiment(attr=attr,
-                                                                                    labels=CANDIDATE_RESTAURANT_LABELS)
-
-            # Store the score
-            attr_score[text] = score
-            label_value = int(label.split()[0].strip())
-
-            # Modify incorrect sentiments for price
-            if key in PRICE_CAT and text in PRICE_RANGE:
-                label_value = switch_label_value(label_value)
-
-            # Add voting counter to the category
-            for cat in categories_list:
-                category_ctr_map[cat]['ctr'] += label_value
-                category_ctr_map[cat]['num_entries'] += 1
-            if label_value != 3:
-                if label_value > 3:
-                    label = pos_label
-                else:
-                    label = neg_label
-                if key not in category_pro_con_map[label]:
-                    category_pro_con_map[label][key] = list()
-                category_pro_con_map[label][key].append([text, attr_score[text]])
+    key_text_list = [(key, text) for key, val in pro_con_map.items() for text in val]
+
+    # Find the categories and sentiment of all the pros-cons at once
+    attr_list = [text + ' ' + key for key, text in key_text_list]
+    res_list = classify_pro_con_category_and_sentiment_batch(attr_list=attr_list, labels=CANDIDATE_RESTAURANT_LABELS)
+
+    for (key, text), (score, label, categories_list) in zip(key_text_list, res_list):
+        # Store the score
+        attr_score[text] = score
+        label_value = int(label.split()[0].strip())
+
+        # Modify incorrect sentiments for price
+        if key in PRICE_CAT and text in PRICE_RANGE:
+            label_value = switch_label_value(label_value)
+
+        # Add voting counter to the category
+        for cat in categories_list:
+            category_ctr_map[cat]['ctr'] += label_value
+            category_ctr_map[cat]['num_entries'] += 1
+        if label_value != 3:
+            if label_value > 3:
+                label = pos_label
+            else:
+                label = neg_label
+            if key not in category_pro_con_map[label]:
+                category_pro_con_map[label][key] = list()
+            category_pro_con_map[label][key].append([text, attr_score[text]])
 
     # Calculate percentage for scores in categories
     for key, value in category_ctr_map.items():
@@ -238,7 +239,56 @@ def analyze_pro_con(pro_con_map):
     return category_ctr_map, category_pro_con_map
 
 
-def extract_pro_con_restaurant(name: str, city: str, max_num_reviews: int = 10) -> dict:
+def get_cached_pro_con_restaurant(name: str, city: str, record_metrics: bool = True):
+    """
+    Fetches the pro-con data of a restaurant from the MongoDB cache.
+    :param name: the name of the restaurant.
+    :param city: the city of the restaurant.
+    :param record_metrics: if False, do not count the lookup in the cache metrics
+    (e.g., the caller already counted its own lookup of the same data).
+    :return: the dictionary of pro-con MetaData, or None if not cached
+    """
+    pc_metadata = get_mongodb_client().comparison_engine.restaurant_metadata
+    stored_pro_con_data = get_pro_con_from_mongodb(name=name, city=city, pc_collection=pc_metadata)
+    if record_metrics:
+        record_cache_lookup(pipeline="pro_con_restaurant", hit=stored_pro_con_data is not None)
+    if stored_pro_con_data is not None:
+        # Drop MongoDB _id
+        del stored_pro_con_data["_id"]
+    return stored_pro_con_data
+
+
+def get_cached_pro_con_restaurant_batch(name_city_list: list) -> dict:
+    """
+    Fetches the pro-con data of many restaurants from the MongoDB cache
+    with a single query.
+    :param name_city_list: the list of (name, city) pairs of the restaurants.
+    :return: a map from (name, city) to the restaurant pro-con MetaData, for the cached restaurants only
+    """
+    pc_metadata = get_mongodb_client().comparison_engine.restaurant_metadata
+    name_city_set = set((name, city) for name, city in name_city_list)
+    res_filter = {
+        'name': {'$in': list(set(name for name, _ in name_city_set))},
+        'city': {'$in': list(set(city for _, city in name_city_set))}
+    }
+
+    with track_external_call(service="mongodb", endpoint="find"):
+        res_data_list = list(pc_metadata.find(filter=res_filter))
+
+    cached_map = dict()
+    for res_data in res_data_list:
+        # The filter matches the cross product of names and cities, keep the requested pairs only
+        name_city = (res_data['name'], res_data['city'])
+        if name_city in name_city_set and name_city not in cached_map:
+            del res_data["_id"]
+            cached_map[name_city] = res_data
+    record_cache_lookup(pipeline="pro_con_restaurant", hit=True, num_lookups=len(cached_map))
+    record_cache_lookup(pipeline="pro_con_restaurant", hit=False, num_lookups=len(name_city_set) - len(cached_map))
+    return cached_map
+
+
+def extract_pro_con_restaurant(name: str, city: str, max_num_reviews: int = 10, on_stage=None,
+                               use_cache: bool = True) -> dict:
     """
     Given the name and city of a restaurant, extracts pro-con
     data for that restaurant.
@@ -249,44 +299,64 @@ def extract_pro_con_restaurant(name: str, city: str, max_num_reviews: int = 10)
     :param name: the name of the restaurant.
     :param city: the city of the restaurant.
     :param max_num_reviews: maximum number of reviews to consider.
+    :param on_stage: optional callable invoked with the name and output
+    of each pipeline stage as soon as it completes.
+    :param use_cache: if False, skip the MongoDB lookup (e.g., the caller already checked it).
     :return: the dictionary of pro-con MetaData
     """
-    # Connect to MongoDB
-    mongo_db_client = MongoClient(MONGO_DB_URL)
-    pc_db = mongo_db_client.comparison_engine
-    pc_metadata = pc_db.restaurant_metadata
-
-    # Step 0: check if the object has been prepared already
-    stored_pro_con_data = get_pro_con_from_mongodb(name=name, city=city, pc_collection=pc_metadata)
-    if stored_pro_con_data is not None:
-        # Drop MongoDB _id
-        del stored_pro_con_data["_id"]
-        return stored_pro_con_data
+    # Step 0: check if the object has been prepared already, the caller counted its own cache lookup
+    if use_cache:
+        stored_pro_con_data = get_cached_pro_con_restaurant(name=name, city=city, record_metrics=False)
+        if stored_pro_con_data is not None:
+            notify_stage(on_stage, "cache", stored_pro_con_data)
+            return stored_pro_con_data
 
     # Step 1: Yelp MetaData to get reviews
-    review_info = get_yelp_metadata(name=name, city=city, mongodb_client=mongo_db_client)
+    mongo_db_client = get_mongodb_client()
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="get_yelp_metadata"):
+        review_info = get_yelp_metadata(name=name, city=city, mongodb_client=mongo_db_client)
     if review_info is None:
         return {}
 
-    # Step 2: extract review summary
-    review_data = run_basic_pro_con_analysis(review_info, max_num_reviews)
+    # Add restaurant data to avoid fetching it again from Yelp
+    meta_info = dict()
+    restaurant_meta_keys = ["address", "categories", "num_reviews", "price", "rating", "state", "url", "website",
+                            "zip_code"]
+    for key, value in review_info.items():
+        if key in restaurant_meta_keys:
+            meta_info[key] = value
+    notify_stage(on_stage, "meta", meta_info)
 
-    # Step 3: create a pro-con map
-    gen_model = False
-    pro_con_map = get_pro_con_map(review_data, use_generative_model=gen_model, num_reviews_for_pro_con=5)
+    # Step 2: extract review summary
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="run_basic_pro_con_analysis"):
+        review_data = run_basic_pro_con_analysis(review_info, max_num_reviews)
+    notify_stage(on_stage, "summary", dict(review_data))
 
-    # Step 3.b: create a pro-con list using a generative model
-    gen_model = True
-    pro_con_list = get_pro_con_map(review_data, use_generative_model=gen_model)
+    # Step 3: get overall sentiment (stages are ordered so that the cheapest outputs are ready first)
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="get_sentiment_map"):
+        sentiment_map = get_sentiment_map(review_data)
+    notify_stage(on_stage, "sentiment_map", sentiment_map)
 
-    # Ste 4: get overall sentiment
-    sentiment_map = get_sentiment_map(review_data)
+    # Step 4: create a pro-con map
+    gen_model = False
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="get_pro_con_map_rule"):
+        pro_con_map = get_pro_con_map(review_data, use_generative_model=gen_model, num_reviews_for_pro_con=5)
 
     # Step 5: process pro-con for product analysis
-    category_ctr_map, category_pro_con_map = analyze_pro_con(pro_con_map)
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="analyze_pro_con"):
+        category_ctr_map, category_pro_con_map = analyze_pro_con(pro_con_map)
+    notify_stage(on_stage, "pro_con_map", category_pro_con_map)
+    notify_stage(on_stage, "category_map", category_ctr_map)
+
+    # Step 4.b: create a pro-con list using a generative model
+    gen_model = True
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="get_pro_con_map_generative"):
+        pro_con_list = get_pro_con_map(review_data, use_generative_model=gen_model)
 
     # Step 5.b: process generated pro-con for product analysis
-    category_gen_pro_con_map = analyze_gen_pro_con(pro_con_list)
+    with STAGE_LATENCY.time(pipeline="pro_con_restaurant", stage="analyze_gen_pro_con"):
+        category_gen_pro_con_map = analyze_gen_pro_con(pro_con_list)
+    notify_stage(on_stage, "gen_pro_con_map", category_gen_pro_con_map)
 
     # Add sentiment and pro-con analysis to the review data map
     review_data["sentiment_map"] = sentiment_map
@@ -296,14 +366,6 @@ def extract_pro_con_restaurant(name: str, city: str, max_num_reviews: int = 10)
 
     # Delete full reviews since they are all stored in Yelp MongoDB collection anyways
     del review_data["reviews"]
-
-    # Add restaurant data to avoid fetching it again from Yelp
-    meta_info = dict()
-    restaurant_meta_keys = ["address", "categories", "num_reviews", "price", "rating", "state", "url", "website",
-                            "zip_code"]
-    for key, value in review_info.items():
-        if key in restaurant_meta_keys:
-            meta_info[key] = value
     review_data["meta"] = meta_info
 
     # Add name and city for future lookup
@@ -311,7 +373,9 @@ def extract_pro_con_restaurant(name: str, city: str, max_num_reviews: int = 10)
     review_data["city"] = review_info["city"]
 
     # Before returning, store the data to MongoDB
-    pc_metadata.insert_one(review_data)
+    pc_metadata = mongo_db_client.comparison_engine.restaurant_metadata
+    with track_external_call(service="mongodb", endpoint="insert_one"):
+        pc_metadata.insert_one(review_data)
 
     # Return the full analysis
     if "_id" in review_data:
@@ -3,6 +3,7 @@ import requests
 from bs4 import BeautifulSoup
 from processor.utils import get_product_name_from_url
 from service.const import *
+from service.metrics import EXTERNAL_CALL_LATENCY, EXTERNAL_CALLS
 
 
 def send_web_request(url: str):
@@ -12,19 +13,24 @@ def send_web_request(url: str):
     :param url: the url to scrape.
     :return: the scraped page
     """
+    # Count the call by its status code, as for the HuggingFace requests
+    status_code = 0
     try:
-        response = requests.get(
-            url=SCRAPINGBEE_URL,
-            params={
-                'api_key': SCRAPINGBEE_KEY,
-                'url': url,
-            },
-        )
+        with EXTERNAL_CALL_LATENCY.time(service="scrapingbee", endpoint="api"):
+            response = requests.get(
+                url=SCRAPINGBEE_URL,
+                params={
+                    'api_key': SCRAPINGBEE_KEY,
+                    'url': url,
+                },
+            )
+        status_code = response.status_code
     except Exception as e:
         logging.error("Cannot scrape webpage: " + str(e))
         return None
+    finally:
+        EXTERNAL_CALLS.inc(service="scrapingbee", endpoint="api", outcome=str(status_code or "error"))
 
-    status_code = response.status_code
     if status_code < 200 or status_code >= 300:
         logging.error("Invalid status code")
         return None
@@ -1,9 +1,7 @@
 import os.path
-import spacy
+from processor.nlp_provider import tag_text
 from urllib.parse import urlparse
 
-utils_nlp = spacy.load('en_core_web_md')
-
 
 def get_product_name_from_url(url: str):
     """
@@ -38,10 +36,11 @@ def get_rating_from_string(rating: str) -> float:
 def clean_pro_con_item(item: str):
     try:
         item = item.strip()
-        token = utils_nlp(item)[0]
+        # Only the POS tag and the lemma are needed
+        token = tag_text(item)[0]
         if token.is_currency:
             item = "money"
-            token = utils_nlp(item)[0]
+            token = tag_text(item)[0]
         if token.pos_ not in ["SYM", "NOUN", "VERB", "PROPN"]:
             return None
         return token.lemma_
@@ -52,7 +51,7 @@ def clean_pro_con_item(item: str):
 def clean_pro_con_attr(item: str):
     try:
         item = item.strip()
-        token = utils_nlp(item)[0]
+        token = tag_text(item)[0]
         if token.pos_ not in ["ADJ", "NOUN", "VERB"]:
             return None
         return token.lemma_
@@ -60,6 +59,17 @@ def clean_pro_con_attr(item: str):
         return None
 
 
+def notify_stage(on_stage, stage: str, data):
+    """
+    Notifies the (optional) stage callback that a pipeline stage completed.
+    :param on_stage: callable taking the stage name and its output, or None.
+    :param stage: the name of the completed stage.
+    :param data: the output of the stage.
+    """
+    if on_stage is not None:
+        on_stage(stage, data)
+
+
 def switch_label_value(label: int):
     if label == 5:
         return 1
@@ -1,5 +1,9 @@
 import tornado.web
-from api_handler.api_handler import (ProConHandler, ProConRestaurantHandler)
+from api_handler.api_handler import (CompareHandler, HealthHandler, JobStatusHandler, MetricsHandler,
+                                     ProConBatchHandler, ProConHandler, ProConJobHandler, ProConRestaurantBatchHandler,
+                                     ProConRestaurantHandler, ProConRestaurantJobHandler, ProConRestaurantStreamHandler,
+                                     ProConStreamHandler, ReadinessHandler)
+from service.metrics import HTTP_REQUEST_LATENCY, HTTP_REQUESTS
 
 
 class AIAPIWebApp(tornado.web.Application):
@@ -8,5 +12,25 @@ class AIAPIWebApp(tornado.web.Application):
         self.handlers = [
             (r"/pro_con", ProConHandler),
             (r"/pro_con_restaurant", ProConRestaurantHandler),
+            (r"/pro_con/jobs", ProConJobHandler),
+            (r"/pro_con/jobs/([0-9a-f]+)", JobStatusHandler, dict(pipeline="pro_con")),
+            (r"/pro_con_restaurant/jobs", ProConRestaurantJobHandler),
+            (r"/pro_con_restaurant/jobs/([0-9a-f]+)", JobStatusHandler, dict(pipeline="pro_con_restaurant")),
+            (r"/pro_con/stream", ProConStreamHandler),
+            (r"/pro_con_restaurant/stream", ProConRestaurantStreamHandler),
+            (r"/pro_con/batch", ProConBatchHandler),
+            (r"/pro_con_restaurant/batch", ProConRestaurantBatchHandler),
+            (r"/compare", CompareHandler),
+            (r"/metrics", MetricsHandler),
+            (r"/healthz", HealthHandler),
+            (r"/readyz", ReadinessHandler),
         ]
         super(AIAPIWebApp, self).__init__(self.handlers)
+
+    def log_request(self, handler: tornado.web.RequestHandler):
+        super(AIAPIWebApp, self).log_request(handler)
+
+        # Record count and latency of every request
+        handler_name = type(handler).__name__
+        HTTP_REQUESTS.inc(handler=handler_name, method=handler.request.method, status=handler.get_status())
+        HTTP_REQUEST_LATENCY.observe(handler.request.request_time(), handler=handler_name)
@@ -1,15 +1,61 @@
 import asyncio
+import gc
 import logging
+import os
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
+from processor.hf_api import close_hf_client
+from processor.language_models import set_num_inference_threads
+from processor.model_loader import start_models_warm_up, warm_up_models
 from server.server import AIAPIWebApp
 
 
-def run_server(server_port: int):
+def fork_workers(num_processes: int) -> int:
+    """
+    Forks the server workers.
+    The models loaded by the parent process are shared with the workers
+    through copy-on-write, hence they must be loaded before calling this function.
+    :param num_processes: number of workers to fork, 0 forks one worker per CPU core.
+    :return: the id of the worker in [0, num_processes)
+    """
+    if num_processes <= 0:
+        num_processes = tornado.process.cpu_count()
+
+    # Move the loaded objects (models included) to the permanent generation so that
+    # the garbage collector of the workers does not write to, i.e., copy, their pages
+    gc.collect()
+    gc.freeze()
+
+    # Avoid fork-related deadlocks of the HF tokenizers
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    task_id = tornado.process.fork_processes(num_processes)
+
+    # Split the cores among workers
+    set_num_inference_threads(tornado.process.cpu_count() // num_processes)
+    logging.info(f"Started server worker {task_id}/{num_processes}")
+    return task_id
+
+
+def run_server(server_port: int, num_processes: int = 1):
+    # Bind the listening socket before forking so that it is shared by all workers
+    sockets = tornado.netutil.bind_sockets(server_port)
+    if num_processes != 1:
+        # Load the models in the parent so that the workers share them
+        warm_up_models()
+        fork_workers(num_processes)
+    else:
+        # Serve (cached) requests right away while the models load
+        start_models_warm_up()
+
     # Create the event loop spawning up the tornado server
     asyncio.set_event_loop(asyncio.new_event_loop())
 
     server_app = AIAPIWebApp()
-    server_app.listen(server_port)
+    server = tornado.httpserver.HTTPServer(server_app)
+    server.add_sockets(sockets)
 
     # Start the server loop
     try:
@@ -17,3 +63,5 @@ def run_server(server_port: int):
         tornado.ioloop.IOLoop.current().start()
     except Exception as e:
         logging.exception(e)
+    finally:
+        close_hf_client()
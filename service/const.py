@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import yaml
 import warnings
 
@@ -36,9 +37,28 @@ else:
 # Service
 AMAZON_BASE_URL = 'https://www.amazon.com'
 AVAILABLE_SERVICE_KEYS_LIST = ["oogway_test"]
+# Max number of pro-con pipelines running concurrently (off the IOLoop) per process
+MAX_CONCURRENT_PIPELINES = 8
+# Max number of cold pipelines (i.e., not served from MongoDB) waiting for a free slot per process.
+# Beyond that, cold requests are shed with a 503
+MAX_PIPELINE_QUEUE_LENGTH = 16
+# Time (in sec.) clients are asked to wait before retrying a shed request
+PIPELINE_RETRY_AFTER = 30
+# Max number of concurrent MongoDB cache lookups per process
+MAX_CONCURRENT_CACHE_LOOKUPS = 16
+# Max number of queued analysis jobs processed concurrently per process
+MAX_CONCURRENT_JOBS = 4
+# Max number of products/restaurants in a single batch request
+MAX_BATCH_SIZE = 1000
+# Max number of products/restaurants compared side-by-side
+MAX_COMPARE_SIZE = 10
+# Time (in sec.) a finished job is kept around for clients to fetch its result
+JOB_RESULT_TTL = 3600
 
-# Scrapingbee url and key
-SCRAPINGBEE_URL = 'https://app.scrapingbee.com/api/v1/'
+# Scrapingbee url and key.
+# Note: the base urls of the external services can be overridden with environment
+# variables, e.g., to run load tests against local stand-in backends
+SCRAPINGBEE_URL = os.environ.get('SCRAPINGBEE_URL', 'https://app.scrapingbee.com/api/v1/')
 
 # Processor
 # Number of review pages to scrape.
@@ -48,6 +68,54 @@ NUM_REVIEW_PAGES_TO_SCRAPE = 1
 # If greater than the limit, run extractive summarization before
 # running abstract summarization
 BERT_NUM_TOKEN_LIMIT = 800
+# How long texts (over BERT_NUM_TOKEN_LIMIT words) are summarized:
+# "extractive_abstractive" runs the extractive summarizer over the whole text, then the abstractive one,
+# "map_reduce" splits the text into chunks of at most SUMMARY_CHUNK_NUM_TOKENS tokens of the summarizer,
+# summarizes the chunks concurrently, then summarizes their joined summaries (recursively if still too long)
+SUMMARIZATION_MODE = "extractive_abstractive"
+SUMMARY_CHUNK_NUM_TOKENS = 900
+# Max number of reduce rounds of map-reduce summarization
+SUMMARY_MAP_REDUCE_MAX_DEPTH = 3
+# spaCy model shared by the processor modules (see processor/nlp_provider.py)
+SPACY_MODEL_NAME = 'en_core_web_md'
+# Engine of the extractive summarizer: "bert" (bert-extractive-summarizer, clusters the BERT embeddings
+# of the sentences), "textrank" (PageRank over the similarity graph of the sentences) or "centroid"
+# (similarity with the centroid of the text), both over the spaCy word vectors
+EXTRACTIVE_SUMMARIZER_ENGINE = "bert"
+# Min length (in characters) of the sentences kept by the textrank/centroid engines, as the bert engine does
+EXTRACTIVE_MIN_SENTENCE_LENGTH = 40
+# Damping factor and max number of iterations of TextRank
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_MAX_NUM_ITER = 100
+# Max number of texts classified in a single local model batch
+CLASSIFIER_BATCH_SIZE = 32
+# Engine categorizing the pros and cons over the candidate labels:
+# "zero_shot" runs the NLI zero-shot classifier (one pass per candidate label),
+# "embedding" matches the spaCy word vectors of the pros and cons with those of the labels
+CATEGORY_ENGINE = "zero_shot"
+# Max number of (premise, hypothesis) pairs, i.e., (text, candidate label) pairs,
+# per forward pass of the local zero-shot model
+ZERO_SHOT_BATCH_SIZE = 64
+# Whether to batch the model inferences of concurrent requests together (see processor/micro_batcher.py)
+USE_MICRO_BATCHING = True
+# Max number of inputs per micro-batch of the classifiers and of the summarizers
+MICRO_BATCH_MAX_SIZE = 32
+SUMMARIZER_MICRO_BATCH_MAX_SIZE = 8
+# Max time (in sec.) an inference waits for its micro-batch to fill up
+MICRO_BATCH_MAX_WAIT = 0.005
+# Max number of model inference results (summaries, sentiments, categories) kept in memory
+# for reuse across pipelines, least recently used first evicted. 0 disables the cache
+INFERENCE_CACHE_MAX_ENTRIES = 50000
+# Path of the SQLite database persisting the model inference results (and OpenAI completions)
+# across restarts, empty disables the persistent cache
+INFERENCE_DISK_CACHE_PATH = os.environ.get('INFERENCE_DISK_CACHE_PATH', '')
+# Max size (in bytes) of the compressed results in the persistent cache, least recently used first evicted
+INFERENCE_DISK_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# Number of persistent cache hits whose access time is written at once
+INFERENCE_DISK_CACHE_ACCESS_BATCH_SIZE = 100
+# Version of the cached results, bump it when a model changes without changing its id
+# to invalidate the persistent cache
+INFERENCE_CACHE_VERSION = 1
 # Candidate topic labels for product reviews
 CANDIDATE_PROD_LABELS = ['customization', 'quality', 'price', 'features', 'look and feel', 'durability', 'efficiency',
                          'reliability', 'safety']
@@ -109,22 +177,69 @@ OPEN_AI_RESTAURANT_PROMPT = "I am a highly intelligent bot that extracts pros an
 OPEN_AI_SUFFIX = '\nPros and cons:'
 # Engine to use
 OPEN_AI_ENGINE = "curie"
+# OpenAI API base url
+OPEN_AI_API_BASE = os.environ.get('OPEN_AI_API_BASE', 'https://api.openai.com/v1')
 
 # HuggingFace
 # Whether or not to call HuggingFace APIs
 USE_HF_API = True
+# Whether to route the model inferences between the HuggingFace API and the local models by their
+# latency and error rate (only with USE_HF_API), the local models are then loaded too
+USE_HYBRID_ROUTING = False
+# Number of the latest batches per backend and task over which latency and error rate are computed
+ROUTER_WINDOW_SIZE = 50
+# Min number of batches in the window before the circuit can open
+ROUTER_MIN_SAMPLES = 10
+# Error rate of the HuggingFace API above which the circuit of a task opens, i.e., its inferences fail over
+# to the local model until a probe batch to the HuggingFace API succeeds
+ROUTER_ERROR_RATE_THRESHOLD = 0.5
+# Time (in sec.) the circuit stays open before a probe batch
+ROUTER_CIRCUIT_OPEN_TIME = 30
+# Whether to also run the local model when a HuggingFace batch takes longer than its p95 latency,
+# the first successful result is used
+USE_HEDGED_REQUESTS = True
+# Min time (in sec.) before hedging a HuggingFace batch
+ROUTER_HEDGE_MIN_DELAY = 0.5
+# Max number of batches hedged on the local models at once per process, beyond that the batches wait for the API
+ROUTER_MAX_CONCURRENT_HEDGES = 2
 # How many times re-trying calling HuggingFace API
 REQUEST_CTR_LIMIT = 4
 # Sleep time (in sec.) between HuggingFace calls
 REQUEST_SLEEP_TIME = 45
+# Base (in sec.) of the exponential backoff between HuggingFace retries, capped by REQUEST_SLEEP_TIME
+REQUEST_BACKOFF_BASE = 1.0
+# Timeout (in sec.) of a HuggingFace request
+HF_REQUEST_TIMEOUT = 120
+# Max number of pooled keep-alive connections to the HuggingFace API per process
+HF_MAX_CONNECTIONS = 32
+# Time (in sec.) an idle HuggingFace connection is kept open
+HF_KEEPALIVE_TIMEOUT = 30
+# Max number of concurrent HuggingFace requests per model endpoint per process
+HF_MAX_CONCURRENT_REQUESTS_PER_MODEL = 8
+# Max number of inputs sent in a single HuggingFace request to the classifiers and to the summarizers
+HF_MAX_INPUTS_PER_REQUEST = 32
+HF_SUMMARIZER_MAX_INPUTS_PER_REQUEST = 4
+
+# HuggingFace Inference API base url
+HF_API_BASE_URL = os.environ.get('HF_API_BASE_URL', 'https://api-inference.huggingface.co')
+# Backend of the local transformer models (when not using the HuggingFace API):
+# "pytorch" (fp32), "quantized" (PyTorch with int8 dynamic quantization of the linear layers)
+# or "onnx" (ONNX Runtime, needs optimum[onnxruntime])
+LOCAL_MODEL_BACKEND = "pytorch"
+# Directory of the quantized/exported local models, created on first use
+LOCAL_MODEL_CACHE_DIR = os.environ.get('LOCAL_MODEL_CACHE_DIR', str(Path('model_cache').resolve()))
 
 # HuggingFace pinned models usage
-HUGGING_FACE_PINNED_MODELS_URL = "https://api-inference.huggingface.co/usage/pinned_models"
+HUGGING_FACE_PINNED_MODELS_URL = f"{HF_API_BASE_URL}/usage/pinned_models"
 # Summarizer model
-HF_SUM_MODEL_URL = "https://api-inference.huggingface.co/models/sshleifer/distilbart-cnn-12-6"
+HF_SUM_MODEL_ID = "sshleifer/distilbart-cnn-12-6"
+HF_SUM_MODEL_URL = f"{HF_API_BASE_URL}/models/{HF_SUM_MODEL_ID}"
 # Extreme summarizer model
-HF_EXT_SUM_MODEL_URL = "https://api-inference.huggingface.co/models/google/pegasus-xsum"
+HF_EXT_SUM_MODEL_ID = "google/pegasus-xsum"
+HF_EXT_SUM_MODEL_URL = f"{HF_API_BASE_URL}/models/{HF_EXT_SUM_MODEL_ID}"
 # Sentiment classification model
-HF_SENT_CLASS_MODEL_URL = "https://api-inference.huggingface.co/models/nlptown/bert-base-multilingual-uncased-sentiment"
+HF_SENT_CLASS_MODEL_ID = "nlptown/bert-base-multilingual-uncased-sentiment"
+HF_SENT_CLASS_MODEL_URL = f"{HF_API_BASE_URL}/models/{HF_SENT_CLASS_MODEL_ID}"
 # Zero-shot classification model
-HF_ZERO_SHOT_CLASS_MODEL_URL = "https://api-inference.huggingface.co/models/typeform/distilbert-base-uncased-mnli"
+HF_ZERO_SHOT_CLASS_MODEL_ID = "typeform/distilbert-base-uncased-mnli"
+HF_ZERO_SHOT_CLASS_MODEL_URL = f"{HF_API_BASE_URL}/models/{HF_ZERO_SHOT_CLASS_MODEL_ID}"
@@ -0,0 +1,224 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (in sec.), from fast cache hits to cold pipelines taking minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, math.inf)
+
+
+def format_labels(label_names: tuple, label_values: tuple, extra_labels: str = "") -> str:
+    label_list = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra_labels:
+        label_list.append(extra_labels)
+    if not label_list:
+        return ""
+    return "{" + ",".join(label_list) + "}"
+
+
+class Metric:
+    """
+    Base class of the thread-safe metrics, optionally partitioned by labels,
+    exported in the Prometheus text format.
+    """
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = dict()
+        self._lock = threading.Lock()
+        glb_metrics_registry.append(self)
+
+    def _label_values(self, labels: dict) -> tuple:
+        return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+    def collect(self) -> list:
+        with self._lock:
+            return [f"{self.name}{format_labels(self.label_names, label_values)} {value}"
+                    for label_values, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines += self.collect()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonic counter.
+    """
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = self._label_values(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, e.g., the number of in-flight requests.
+    """
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g., latencies, over cumulative buckets.
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            histogram = self._values[key]
+            for idx, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    histogram["buckets"][idx] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def collect(self) -> list:
+        lines = list()
+        with self._lock:
+            for label_values, histogram in self._values.items():
+                for upper_bound, bucket_count in zip(self.buckets, histogram["buckets"]):
+                    le = "+Inf" if upper_bound == math.inf else str(upper_bound)
+                    bucket_labels = format_labels(self.label_names, label_values, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {histogram['sum']}")
+                lines.append(f"{self.name}_count{labels} {histogram['count']}")
+        return lines
+
+
+def render_metrics() -> str:
+    """
+    Renders all the metrics of the service in the Prometheus text format.
+    :return: the metrics exposition
+    """
+    return "\n".join(metric.render() for metric in glb_metrics_registry) + "\n"
+
+
+@contextmanager
+def track_external_call(service: str, endpoint: str):
+    """
+    Counts and times a call to an external service (MongoDB, ScrapingBee, OpenAI, etc.),
+    the call is counted as an error if it raises.
+    :param service: the name of the external service.
+    :param endpoint: the endpoint/model/operation called.
+    """
+    outcome = "error"
+    try:
+        with EXTERNAL_CALL_LATENCY.time(service=service, endpoint=endpoint):
+            yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALLS.inc(service=service, endpoint=endpoint, outcome=outcome)
+
+
+def record_cache_lookup(pipeline: str, hit: bool, num_lookups: int = 1):
+    """
+    Records lookups to the MongoDB cache of pro-con data and updates the hit ratio.
+    :param pipeline: the name of the pipeline.
+    :param hit: whether the lookups hit the cache.
+    :param num_lookups: number of lookups with the same result.
+    """
+    CACHE_LOOKUPS.inc(num_lookups, pipeline=pipeline, result="hit" if hit else "miss")
+    num_hits = CACHE_LOOKUPS.value(pipeline=pipeline, result="hit")
+    num_misses = CACHE_LOOKUPS.value(pipeline=pipeline, result="miss")
+    if num_hits + num_misses > 0:
+        CACHE_HIT_RATIO.set(num_hits / (num_hits + num_misses), pipeline=pipeline)
+
+
+# All the metrics defined by the service
+glb_metrics_registry = list()
+
+# HTTP requests per handler
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by handler and status code',
+                        ('handler', 'method', 'status'))
+HTTP_REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by handler', ('handler',))
+HTTP_REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests currently being served', ('handler',))
+
+# Pro-con pipelines
+STAGE_LATENCY = Histogram('pipeline_stage_duration_seconds', 'Pro-con pipeline latency by stage',
+                          ('pipeline', 'stage'))
+PIPELINES_IN_FLIGHT = Gauge('pipelines_in_flight', 'Pro-con pipelines currently running', ('pipeline',))
+PIPELINE_QUEUE_DEPTH = Gauge('pipeline_queue_depth', 'Cold pro-con pipelines waiting for a free slot')
+ADMISSION_DECISIONS = Counter('admission_decisions_total',
+                              'Pro-con requests by admission decision (cached, joined, admitted, queued, shed)',
+                              ('pipeline', 'decision'))
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'MongoDB pro-con cache lookups by result', ('pipeline', 'result'))
+CACHE_HIT_RATIO = Gauge('cache_hit_ratio', 'Ratio of MongoDB pro-con cache lookups that hit the cache',
+                        ('pipeline',))
+
+# Single-flight coalescing of identical pro-con requests
+SINGLE_FLIGHT_REQUESTS = Counter('single_flight_requests_total',
+                                 'Pro-con requests by single-flight role (leader computes, follower awaits)',
+                                 ('pipeline', 'role'))
+
+# Cache of the model inferences
+INFERENCE_CACHE_LOOKUPS = Counter('inference_cache_lookups_total',
+                                  'Model inference cache lookups by tier (memory, disk), task and result',
+                                  ('tier', 'task', 'result'))
+INFERENCE_CACHE_ENTRIES = Gauge('inference_cache_entries', 'Model inference results in the in-memory cache')
+
+# Micro-batching of the model inferences across requests
+MICRO_BATCH_SIZE = Histogram('micro_batch_size', 'Number of inputs per micro-batch by model', ('model',),
+                             buckets=(1, 2, 4, 8, 16, 32, 64, math.inf))
+MICRO_BATCH_QUEUE_WAIT = Histogram('micro_batch_queue_wait_seconds',
+                                   'Time model inputs wait for their micro-batch to start by model', ('model',))
+
+# Hybrid routing of the model inferences between the HuggingFace API and the local models
+ROUTER_DECISIONS = Counter('router_decisions_total',
+                           'Routing decisions of the model inferences by task and decision', ('task', 'decision'))
+ROUTER_BACKEND_LATENCY = Histogram('router_backend_duration_seconds',
+                                   'Latency of the routed model inference batches by backend and task',
+                                   ('backend', 'task'))
+ROUTER_CIRCUIT_OPEN = Gauge('router_circuit_open', 'Whether the HuggingFace API circuit of a task is open',
+                            ('task',))
+
+# External services (HuggingFace, OpenAI, ScrapingBee, MongoDB)
+EXTERNAL_CALLS = Counter('external_calls_total', 'Calls to external services by outcome',
+                         ('service', 'endpoint', 'outcome'))
+EXTERNAL_CALL_RETRIES = Counter('external_call_retries_total', 'Retried calls to external services',
+                                ('service', 'endpoint'))
+EXTERNAL_CALL_LATENCY = Histogram('external_call_duration_seconds', 'Latency of the calls to external services',
+                                  ('service', 'endpoint'))
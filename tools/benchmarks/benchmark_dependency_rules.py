@@ -0,0 +1,62 @@
+"""
+Micro-benchmark of the dependency-rule pro-con extraction.
+
+Compares the single-pass rule engine of processor/pro_con_extractor.py with the former multi-pass
+rules (one walk of the doc per rule and a second parse for the compound nouns) on a long merged
+review text, checks that both extract the same tuples and reports their speed.
+
+Usage (from the root of the repo):
+    python -m tools.benchmarks.benchmark_dependency_rules --reviews tools/benchmarks/fixtures/reviews.txt --repeat 20
+"""
+import argparse
+import time
+from pathlib import Path
+from processor.nlp_provider import parse_text
+from processor.pro_con_extractor import extract_dependency_pairs, extract_pro_con_pairs
+from tools.benchmarks.reference_extraction import apply_extraction_multi_pass, get_compound_pairs_multi_pass
+
+
+def time_func(func, num_runs: int):
+    # Run once before timing
+    result = func()
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+        func()
+    return result, (time.perf_counter() - start_time) / num_runs
+
+
+def benchmark_dependency_rules(text: str, num_runs: int):
+    doc = parse_text(text)
+
+    # Rules only, over an already parsed doc
+    multi_pass_pairs, multi_pass_rule_time = time_func(
+        lambda: apply_extraction_multi_pass(doc) + get_compound_pairs_multi_pass(doc), num_runs)
+    single_pass_pairs, single_pass_rule_time = time_func(lambda: sum(extract_dependency_pairs(doc), []), num_runs)
+    if single_pass_pairs != multi_pass_pairs:
+        raise AssertionError("The single-pass engine does not extract the same tuples as the multi-pass rules")
+
+    # End to end, as in the pipelines: the multi-pass rules parsed the text twice
+    _, multi_pass_time = time_func(
+        lambda: apply_extraction_multi_pass(parse_text(text)) + get_compound_pairs_multi_pass(parse_text(text)),
+        num_runs)
+    _, single_pass_time = time_func(lambda: extract_pro_con_pairs(text), num_runs)
+
+    print(f"Text: {len(doc)} tokens, {len(single_pass_pairs)} extracted tuples (identical)")
+    print(f"Rules only: multi-pass {1000.0 * multi_pass_rule_time:.2f} ms, "
+          f"single-pass {1000.0 * single_pass_rule_time:.2f} ms "
+          f"({multi_pass_rule_time / single_pass_rule_time:.1f}x)")
+    print(f"With parsing: multi-pass {1000.0 * multi_pass_time:.2f} ms, single-pass {1000.0 * single_pass_time:.2f} ms "
+          f"({multi_pass_time / single_pass_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the single-pass dependency-rule engine")
+    parser.add_argument("--reviews", default=str(Path(__file__).resolve().parent / "fixtures" / "reviews.txt"),
+                        help="file with one review per line, merged into a single text")
+    parser.add_argument("--repeat", type=int, default=20, help="number of times the reviews are repeated in the text")
+    parser.add_argument("--num-runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.reviews) as f:
+        review_list = [line.strip() for line in f if line.strip()]
+    benchmark_dependency_rules(" ".join(review_list * args.repeat), args.num_runs)
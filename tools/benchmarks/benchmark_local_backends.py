@@ -0,0 +1,155 @@
+"""
+Benchmark of the local model backends.
+
+Runs the four local transformer pipelines (summarizer, extreme summarizer, sentiment classifier and
+zero-shot classifier) with the fp32 PyTorch baseline and with the quantized and/or ONNX backends,
+each in a fresh process, and reports load time, latency, RSS and the agreement of the outputs with the baseline.
+The quantized/exported models are cached in LOCAL_MODEL_CACHE_DIR, the first run includes exporting them.
+
+Usage (from the root of the repo):
+    python -m tools.benchmarks.benchmark_local_backends --backends quantized onnx --num-inputs 10
+"""
+import argparse
+import math
+import multiprocessing
+import resource
+import time
+from pathlib import Path
+from service.const import (CANDIDATE_PROD_LABELS, HF_EXT_SUM_MODEL_ID, HF_SENT_CLASS_MODEL_ID, HF_SUM_MODEL_ID,
+                           HF_ZERO_SHOT_CLASS_MODEL_ID)
+
+FIXTURES_PATH = Path(__file__).resolve().parent / "fixtures"
+
+# Task, model id, pipeline arguments and input file by model name
+MODEL_SPEC_MAP = {
+    "summarizer": ("summarization", HF_SUM_MODEL_ID, dict(), "reviews.txt"),
+    "extreme_summarizer": ("summarization", HF_EXT_SUM_MODEL_ID, dict(), "reviews.txt"),
+    "classifier": ("text-classification", HF_SENT_CLASS_MODEL_ID, dict(return_all_scores=True), "attributes.txt"),
+    "zero_shot": ("zero-shot-classification", HF_ZERO_SHOT_CLASS_MODEL_ID, dict(), "attributes.txt"),
+}
+
+
+def get_rss_mb() -> float:
+    """
+    Current resident set size of the process (peak RSS if /proc is not available).
+    :return: the RSS in MB
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_model(model, task: str, text: str):
+    """
+    Runs a pipeline as the service does and returns a comparable output.
+    :return: the summary, the (label, score) list of the sentiment or the (labels, scores) of the zero-shot
+    """
+    if task == "summarization":
+        return model(text)[0]["summary_text"].strip()
+    if task == "text-classification":
+        return [(sent["label"], sent["score"]) for sent in model(text)[0]]
+    res_cat = model(text, CANDIDATE_PROD_LABELS, multi_label=True)
+    return res_cat["labels"], res_cat["scores"]
+
+
+def benchmark_backend(model_name: str, backend: str, text_list: list) -> dict:
+    """
+    Loads a model with the given backend and runs it over the texts, meant to run in a fresh process.
+    :return: load time, latencies, RSS of the loaded model and outputs
+    """
+    from processor.local_backends import load_pipeline
+    task, model_id, kwargs, _ = MODEL_SPEC_MAP[model_name]
+
+    rss_before = get_rss_mb()
+    start_time = time.perf_counter()
+    model = load_pipeline(task, model_id, backend=backend, **kwargs)
+    load_time = time.perf_counter() - start_time
+
+    # Warm up
+    run_model(model, task, text_list[0])
+
+    latency_list = list()
+    output_list = list()
+    for text in text_list:
+        start_time = time.perf_counter()
+        output_list.append(run_model(model, task, text))
+        latency_list.append(time.perf_counter() - start_time)
+    return {"load_time": load_time, "latency_list": latency_list, "rss": get_rss_mb() - rss_before,
+            "output_list": output_list}
+
+
+def token_f1(text: str, ref_text: str) -> float:
+    token_list = text.lower().split()
+    ref_token_list = ref_text.lower().split()
+    num_common = sum(min(token_list.count(token), ref_token_list.count(token)) for token in set(token_list))
+    if num_common == 0:
+        return 0.0
+    precision = num_common / len(token_list)
+    recall = num_common / len(ref_token_list)
+    return 2 * precision * recall / (precision + recall)
+
+
+def get_agreement(task: str, output_list: list, ref_output_list: list) -> str:
+    """
+    Agreement of the outputs of a backend with those of the baseline.
+    :return: a printable summary of the agreement
+    """
+    num_outputs = len(ref_output_list)
+    if task == "summarization":
+        num_exact = sum(output == ref_output for output, ref_output in zip(output_list, ref_output_list))
+        mean_f1 = sum(token_f1(output, ref_output) for output, ref_output in zip(output_list, ref_output_list))
+        return f"exact match {100.0 * num_exact / num_outputs:.0f}%, token F1 {mean_f1 / num_outputs:.3f}"
+    if task == "text-classification":
+        num_top_matches = 0
+        max_score_diff = 0.0
+        for output, ref_output in zip(output_list, ref_output_list):
+            num_top_matches += max(output, key=lambda x: x[1])[0] == max(ref_output, key=lambda x: x[1])[0]
+            max_score_diff = max([max_score_diff] + [abs(s - ref_s) for (_, s), (_, ref_s) in zip(output, ref_output)])
+        return f"top label match {100.0 * num_top_matches / num_outputs:.0f}%, max score diff {max_score_diff:.4f}"
+    num_top_matches = sum(output[0][0] == ref_output[0][0] for output, ref_output in zip(output_list, ref_output_list))
+    return f"top category match {100.0 * num_top_matches / num_outputs:.0f}%"
+
+
+def percentile(value_list: list, perc: float) -> float:
+    sorted_value_list = sorted(value_list)
+    return sorted_value_list[max(0, math.ceil(perc / 100 * len(sorted_value_list)) - 1)]
+
+
+def benchmark_local_backends(model_name_list: list, backend_list: list, num_inputs: int):
+    # Every backend runs in a fresh process so that their RSS does not add up
+    context = multiprocessing.get_context("spawn")
+    for model_name in model_name_list:
+        task, model_id, _, input_file_name = MODEL_SPEC_MAP[model_name]
+        with open(FIXTURES_PATH / input_file_name) as f:
+            text_list = [line.strip() for line in f if line.strip()][:num_inputs]
+
+        print(f"\n{model_name} ({model_id}), {len(text_list)} inputs")
+        ref_result = None
+        for backend in ["pytorch"] + backend_list:
+            with context.Pool(1) as pool:
+                result = pool.apply(benchmark_backend, (model_name, backend, text_list))
+            latency_list = [1000.0 * latency for latency in result["latency_list"]]
+            line = f"  {backend:>10}: load {result['load_time']:.1f} sec., " \
+                   f"latency mean {sum(latency_list) / len(latency_list):.1f} ms " \
+                   f"p50 {percentile(latency_list, 50):.1f} ms p95 {percentile(latency_list, 95):.1f} ms, " \
+                   f"RSS {result['rss']:.0f} MB"
+            if ref_result is None:
+                ref_result = result
+            else:
+                line += f", {get_agreement(task, result['output_list'], ref_result['output_list'])}"
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the local model backends against the fp32 baseline")
+    parser.add_argument("--backends", nargs="+", default=["quantized", "onnx"], choices=["quantized", "onnx"])
+    parser.add_argument("--models", nargs="+", default=list(MODEL_SPEC_MAP), choices=list(MODEL_SPEC_MAP))
+    parser.add_argument("--num-inputs", type=int, default=10, help="max number of inputs per model")
+    args = parser.parse_args()
+
+    benchmark_local_backends(args.models, args.backends, args.num_inputs)
@@ -0,0 +1,59 @@
+"""
+Offline comparison of the category engines.
+
+Categorizes a list of pro-con attributes (one per line) with the zero-shot NLI engine,
+taken as the reference, and with the embedding engine, and reports their agreement and speed.
+
+Usage (from the root of the repo):
+    python -m tools.benchmarks.compare_category_engines --attributes tools/benchmarks/fixtures/attributes.txt
+"""
+import argparse
+import time
+from pathlib import Path
+from processor.language_models import classify_category_embedding_batch, get_top_categories, run_zero_shot_batch
+from service.const import CANDIDATE_PROD_LABELS, CANDIDATE_RESTAURANT_LABELS, USE_HF_API
+
+
+def time_engine(engine_func, attr_list: list, labels: list):
+    # Load the model before timing
+    engine_func(attr_list[:1], labels)
+    start_time = time.perf_counter()
+    res_cat_list = engine_func(attr_list, labels)
+    return res_cat_list, time.perf_counter() - start_time
+
+
+def compare_category_engines(attr_list: list, labels: list):
+    nli_res_list, nli_time = time_engine(run_zero_shot_batch, attr_list, labels)
+    emb_res_list, emb_time = time_engine(classify_category_embedding_batch, attr_list, labels)
+
+    num_top_1_matches = 0
+    num_overlaps = 0
+    jaccard_sum = 0.0
+    for attr, nli_res, emb_res in zip(attr_list, nli_res_list, emb_res_list):
+        nli_categories = get_top_categories(nli_res)
+        emb_categories = get_top_categories(emb_res)
+        num_top_1_matches += nli_categories[0] == emb_categories[0]
+        num_overlaps += bool(set(nli_categories) & set(emb_categories))
+        jaccard_sum += len(set(nli_categories) & set(emb_categories)) / len(set(nli_categories) | set(emb_categories))
+        print(f"{attr!r}: NLI {nli_categories}, embedding {emb_categories}")
+
+    num_attrs = len(attr_list)
+    print(f"\nAttributes: {num_attrs}, labels: {len(labels)}")
+    print(f"Top-1 agreement with NLI: {100.0 * num_top_1_matches / num_attrs:.1f}%")
+    print(f"Any category in common with NLI: {100.0 * num_overlaps / num_attrs:.1f}%")
+    print(f"Mean Jaccard similarity of the categories: {jaccard_sum / num_attrs:.3f}")
+    nli_backend = "HuggingFace API" if USE_HF_API else "local"
+    print(f"NLI ({nli_backend}): {nli_time:.3f} sec. ({1000.0 * nli_time / num_attrs:.2f} ms/attribute)")
+    print(f"Embedding: {emb_time:.3f} sec. ({1000.0 * emb_time / num_attrs:.2f} ms/attribute)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the zero-shot NLI and embedding category engines")
+    parser.add_argument("--attributes", default=str(Path(__file__).resolve().parent / "fixtures" / "attributes.txt"),
+                        help="file with one pro-con attribute per line")
+    parser.add_argument("--restaurant", action="store_true", help="use the restaurant candidate labels")
+    args = parser.parse_args()
+
+    with open(args.attributes) as f:
+        attribute_list = [line.strip() for line in f if line.strip()]
+    compare_category_engines(attribute_list, CANDIDATE_RESTAURANT_LABELS if args.restaurant else CANDIDATE_PROD_LABELS)
@@ -0,0 +1,148 @@
+"""
+Offline comparison of the extractive summarizer engines.
+
+Summarizes review corpora with the bert engine (bert-extractive-summarizer), taken as the reference,
+and with the textrank and centroid engines over the spaCy word vectors, and reports their speed
+and their ROUGE-1/2/L F1 against the bert extracts (and against the reference summaries, if any).
+
+The corpora are either a text file with one review per line, merged into corpora of --reviews-per-corpus
+reviews as the pipelines merge the reviews of a product, or a JSONL file (e.g., exported from MongoDB)
+with one {"reviews": [...]} or {"text": ...} object per line and an optional reference "summary".
+
+Usage (from the root of the repo):
+    python -m tools.benchmarks.compare_extractive_summarizers --corpora tools/benchmarks/fixtures/reviews.txt
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from processor.language_models import extract_summarize_vectors
+from processor.nlp_provider import get_nlp
+
+ENGINE_LIST = ["bert", "textrank", "centroid"]
+
+
+def load_corpora(corpora_path: str, reviews_per_corpus: int) -> list:
+    """
+    Loads the review corpora to summarize.
+    :param corpora_path: text file with one review per line or JSONL file with one corpus per line.
+    :param reviews_per_corpus: number of reviews merged per corpus for text files, 0 merges them all.
+    :return: a list of (text, reference summary or None)
+    """
+    with open(corpora_path) as f:
+        line_list = [line.strip() for line in f if line.strip()]
+    if corpora_path.endswith(".jsonl"):
+        corpus_list = list()
+        for line in line_list:
+            corpus = json.loads(line)
+            text = corpus["text"] if "text" in corpus else " ".join(corpus["reviews"])
+            corpus_list.append((text, corpus.get("summary")))
+        return corpus_list
+
+    reviews_per_corpus = reviews_per_corpus or len(line_list)
+    return [(" ".join(line_list[idx:idx + reviews_per_corpus]), None)
+            for idx in range(0, len(line_list), reviews_per_corpus)]
+
+
+def tokenize(text: str) -> list:
+    return "".join(char.lower() if char.isalnum() else " " for char in text).split()
+
+
+def get_ngrams(token_list: list, n: int) -> Counter:
+    return Counter(tuple(token_list[idx:idx + n]) for idx in range(len(token_list) - n + 1))
+
+
+def get_f1(num_matches: int, num_candidate: int, num_reference: int) -> float:
+    if num_matches == 0:
+        return 0.0
+    precision = num_matches / num_candidate
+    recall = num_matches / num_reference
+    return 2 * precision * recall / (precision + recall)
+
+
+def get_lcs_length(token_list: list, other_token_list: list) -> int:
+    prev_row = [0] * (len(other_token_list) + 1)
+    for token in token_list:
+        row = [0]
+        for idx, other_token in enumerate(other_token_list):
+            row.append(prev_row[idx] + 1 if token == other_token else max(prev_row[idx + 1], row[idx]))
+        prev_row = row
+    return prev_row[-1]
+
+
+def rouge_scores(candidate: str, reference: str) -> dict:
+    """
+    ROUGE-1, ROUGE-2 and ROUGE-L F1 scores of a summary.
+    :param candidate: the summary to score.
+    :param reference: the reference summary.
+    :return: a map rouge_1/rouge_2/rouge_l -> F1 score
+    """
+    candidate_token_list = tokenize(candidate)
+    reference_token_list = tokenize(reference)
+    score_map = dict()
+    for n in (1, 2):
+        candidate_ngrams = get_ngrams(candidate_token_list, n)
+        reference_ngrams = get_ngrams(reference_token_list, n)
+        score_map[f"rouge_{n}"] = get_f1(sum((candidate_ngrams & reference_ngrams).values()),
+                                         sum(candidate_ngrams.values()), sum(reference_ngrams.values()))
+    score_map["rouge_l"] = get_f1(get_lcs_length(candidate_token_list, reference_token_list),
+                                  len(candidate_token_list), len(reference_token_list))
+    return score_map
+
+
+def get_engine_func(engine: str):
+    if engine == "bert":
+        from summarizer import Summarizer
+        return Summarizer()
+    get_nlp()
+    return lambda text, num_sentences: extract_summarize_vectors(text, num_sentences=num_sentences, engine=engine)
+
+
+def print_rouge(title: str, summary_list: list, reference_list: list):
+    score_map_list = [rouge_scores(summary, reference) for summary, reference in zip(summary_list, reference_list)]
+    mean_score_list = [sum(score_map[name] for score_map in score_map_list) / len(score_map_list)
+                       for name in ("rouge_1", "rouge_2", "rouge_l")]
+    print(f"  {title}: ROUGE-1 {mean_score_list[0]:.3f}, ROUGE-2 {mean_score_list[1]:.3f}, "
+          f"ROUGE-L {mean_score_list[2]:.3f}")
+
+
+def compare_extractive_summarizers(corpus_list: list, num_sentences: int, engine_list: list):
+    text_list = [text for text, _ in corpus_list]
+    summary_map = dict()
+    for engine in engine_list:
+        engine_func = get_engine_func(engine)
+        # Warm up before timing
+        engine_func(text_list[0], num_sentences=num_sentences)
+        start_time = time.perf_counter()
+        summary_map[engine] = [engine_func(text, num_sentences=num_sentences) for text in text_list]
+        engine_time = time.perf_counter() - start_time
+        print(f"{engine}: {engine_time:.3f} sec. ({1000.0 * engine_time / len(text_list):.1f} ms/corpus)")
+
+    num_words = sum(len(text.split()) for text in text_list)
+    print(f"\nCorpora: {len(text_list)}, {num_words / len(text_list):.0f} words per corpus, "
+          f"{num_sentences} sentences per summary")
+    # The extracts of the first engine are the reference if bert is not run
+    reference_engine = "bert" if "bert" in engine_list else engine_list[0]
+    for engine in engine_list:
+        print(f"{engine}:")
+        if engine != reference_engine:
+            print_rouge(f"vs. {reference_engine}", summary_map[engine], summary_map[reference_engine])
+        reference_corpus_list = [(summary, reference) for summary, (_, reference) in zip(summary_map[engine],
+                                                                                         corpus_list) if reference]
+        if reference_corpus_list:
+            print_rouge("vs. reference summaries", *zip(*reference_corpus_list))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the bert, textrank and centroid extractive summarizers")
+    parser.add_argument("--corpora", default=str(Path(__file__).resolve().parent / "fixtures" / "reviews.txt"),
+                        help="text file with one review per line or JSONL file with one corpus per line")
+    parser.add_argument("--reviews-per-corpus", type=int, default=0,
+                        help="number of reviews merged per corpus for text files (0 merges them all)")
+    parser.add_argument("--num-sentences", type=int, default=5, help="number of sentences per summary")
+    parser.add_argument("--engines", nargs="+", default=ENGINE_LIST, choices=ENGINE_LIST)
+    args = parser.parse_args()
+
+    compare_extractive_summarizers(load_corpora(args.corpora, args.reviews_per_corpus), args.num_sentences,
+                                   args.engines)
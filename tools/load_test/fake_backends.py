@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import random
+from pathlib import Path
+import tornado.web
+
+FIXTURES_PATH = Path(__file__).resolve().parent / "fixtures"
+
+# Star labels returned by the sentiment model
+SENTIMENT_LABELS = ["1 star", "2 stars", "3 stars", "4 stars", "5 stars"]
+
+
+def text_seed(text: str) -> int:
+    """
+    Deterministic seed for a text, the fake models give the same answer to the same input
+    as the real ones would, but different inputs get different answers.
+    :param text: the input text.
+    :return: the seed
+    """
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def fake_summary(text: str) -> dict:
+    sentence_list = [sentence.strip() for sentence in text.split(".") if sentence.strip()]
+    return {"summary_text": ". ".join(sentence_list[:2]) + "."}
+
+
+def fake_sentiment(text: str) -> list:
+    rnd = random.Random(text_seed(text))
+    score_list = [rnd.random() for _ in SENTIMENT_LABELS]
+    total = sum(score_list)
+    return [{"label": label, "score": score / total} for label, score in zip(SENTIMENT_LABELS, score_list)]
+
+
+def fake_zero_shot(text: str, labels: list) -> dict:
+    rnd = random.Random(text_seed(text))
+    score_list = sorted((rnd.random() for _ in labels), reverse=True)
+    total = sum(score_list)
+    label_list = list(labels)
+    rnd.shuffle(label_list)
+    return {"sequence": text, "labels": label_list, "scores": [score / total for score in score_list]}
+
+
+def fake_completion(prompt: str) -> str:
+    # Take the last review of the prompt and turn its first words into a pro and a con
+    review = prompt.rsplit("Review:", 1)[-1].split("\n")[0]
+    word_list = [word.strip(".,!?") for word in review.split() if word.strip(".,!?")]
+    if len(word_list) < 2:
+        return ""
+    return f"\n1 - {' '.join(word_list[:3]).lower()}\n2 - {' '.join(word_list[-3:]).lower()}"
+
+
+class FakeBackendHandler(tornado.web.RequestHandler):
+    """
+    Base handler of the fake backends, simulating the latency and the error rate of the real service.
+    """
+
+    def initialize(self, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    async def simulate(self) -> bool:
+        """
+        Sleeps for the configured latency (+/- 50% jitter) and draws an error.
+        :return: True if the request should fail, False otherwise
+        """
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        return random.random() < self.error_rate
+
+
+class FakeScrapingBeeHandler(FakeBackendHandler):
+    """
+    ScrapingBee stand-in, serves the canned Amazon product and review pages.
+    """
+
+    async def get(self):
+        if await self.simulate():
+            self.set_status(500)
+            self.finish("Fake ScrapingBee error")
+            return
+        url = self.get_argument("url", "")
+        fixture_name = "review_page.html" if "product-reviews" in url else "product_page.html"
+        self.set_header("Content-Type", "text/html; charset=utf-8")
+        self.finish((FIXTURES_PATH / fixture_name).read_text(encoding="utf-8"))
+
+
+class FakeHuggingFaceHandler(FakeBackendHandler):
+    """
+    HuggingFace Inference API stand-in for the summarization,
+    sentiment and zero-shot classification models.
+    """
+
+    async def post(self, model_id: str):
+        if await self.simulate():
+            # The Inference API answers 503 while a model is loading
+            self.set_status(503)
+            self.finish({"error": f"Model {model_id} is currently loading", "estimated_time": 20.0})
+            return
+        payload = json.loads(self.request.body or b"{}")
+        inputs = payload.get("inputs", "")
+        input_list = inputs if isinstance(inputs, list) else [inputs]
+        if "candidate_labels" in payload.get("parameters", dict()):
+            labels = payload["parameters"]["candidate_labels"]
+            output = [fake_zero_shot(text, labels) for text in input_list]
+            output = output if isinstance(inputs, list) else output[0]
+        elif "sentiment" in model_id:
+            output = [fake_sentiment(text) for text in input_list]
+        else:
+            output = [fake_summary(text) for text in input_list]
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(output))
+
+
+class FakePinnedModelsHandler(FakeBackendHandler):
+
+    def post(self):
+        self.finish({"pinned": True})
+
+
+class FakeOpenAIHandler(FakeBackendHandler):
+    """
+    OpenAI completions stand-in, answers with a numbered list of pros and cons.
+    """
+
+    async def post(self, engine: str):
+        if await self.simulate():
+            self.set_status(503)
+            self.finish({"error": {"message": "Fake OpenAI overloaded", "type": "server_error"}})
+            return
+        payload = json.loads(self.request.body or b"{}")
+        self.set_header("Content-Type", "application/json")
+        self.finish({
+            "id": "cmpl-fake",
+            "object": "text_completion",
+            "model": engine,
+            "choices": [{"text": fake_completion(payload.get("prompt", "")), "index": 0, "logprobs": None,
+                         "finish_reason": "stop"}],
+        })
+
+
+def make_fake_backends_app(latency: float = 0.0, error_rate: float = 0.0) -> tornado.web.Application:
+    """
+    Makes a single Tornado app serving all the fake backends:
+    ScrapingBee on /scrapingbee/api/v1/, HuggingFace on /huggingface and OpenAI on /openai/v1.
+    :param latency: mean latency (in sec.) of each fake call.
+    :param error_rate: probability of a fake call to fail.
+    :return: the Tornado app
+    """
+    settings = dict(latency=latency, error_rate=error_rate)
+    return tornado.web.Application([
+        (r"/scrapingbee/api/v1/?", FakeScrapingBeeHandler, settings),
+        (r"/huggingface/models/(.+)", FakeHuggingFaceHandler, settings),
+        (r"/huggingface/usage/pinned_models", FakePinnedModelsHandler, settings),
+        (r"/openai/v1/engines/([^/]+)/completions", FakeOpenAIHandler, settings),
+    ])
+
+
+def get_fake_backends_env(port: int) -> dict:
+    """
+    Environment variables pointing the service at the fake backends.
+    :param port: the port of the fake backends.
+    :return: the environment variables
+    """
+    base_url = f"http://127.0.0.1:{port}"
+    return {
+        "SCRAPINGBEE_URL": f"{base_url}/scrapingbee/api/v1/",
+        "HF_API_BASE_URL": f"{base_url}/huggingface",
+        "OPEN_AI_API_BASE": f"{base_url}/openai/v1",
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import tornado.ioloop
+
+    parser = argparse.ArgumentParser(description="Fake ScrapingBee, HuggingFace and OpenAI backends")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.1, help="mean latency (in sec.) of each call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a call to fail")
+    args = parser.parse_args()
+
+    make_fake_backends_app(latency=args.latency, error_rate=args.error_rate).listen(args.port)
+    for env_name, env_value in get_fake_backends_env(args.port).items():
+        print(f"export {env_name}={env_value}")
+    tornado.ioloop.IOLoop.current().start()
@@ -0,0 +1,281 @@
+"""
+Load test of the pro-con service.
+
+Replays a JSONL log of requests against the real Tornado server, at a given concurrency and rate,
+while ScrapingBee, HuggingFace and OpenAI are replaced by local fakes with configurable latency
+and error rate. Reports latency percentiles, throughput and the per-stage breakdown of the pipelines.
+
+Usage (from the root of the repo, with a local MongoDB running):
+    python -m tools.load_test.run_load_test --requests tools/load_test/sample_requests.jsonl \
+        --concurrency 16 --rate 20 --backend-latency 0.2 --backend-error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlencode, urlparse, urlunparse
+import tornado.httpclient
+import tornado.httpserver
+import tornado.netutil
+import yaml
+from tools.load_test.fake_backends import get_fake_backends_env, make_fake_backends_app
+
+REPO_PATH = Path(__file__).resolve().parents[2]
+SERVICE_KEY = "oogway_test"
+METRIC_LINE_REGEX = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+def load_requests(requests_path: str, num_requests: int = 0) -> list:
+    """
+    Loads the log of requests to replay, one JSON object per line with
+    "method" (default POST), "path", "body" and (optional) "query".
+    :param requests_path: path of the JSONL log.
+    :param num_requests: number of requests to replay, cycling through the log, 0 replays the log once.
+    :return: the list of requests
+    """
+    with open(requests_path) as f:
+        request_list = [json.loads(line) for line in f if line.strip()]
+    if not request_list:
+        raise ValueError(f"No requests in {requests_path}")
+    if num_requests > 0:
+        request_list = [request_list[idx % len(request_list)] for idx in range(num_requests)]
+    return request_list
+
+
+def make_cold(request: dict, run_id: str, idx: int) -> dict:
+    """
+    Makes the products of a request unique so that it misses the MongoDB cache
+    and is not coalesced with other requests.
+    :param request: the request to replay.
+    :param run_id: the id of the load test run.
+    :param idx: the index of the request in the run.
+    :return: the cold request
+    """
+    def make_cold_url(url: str) -> str:
+        parsed_url = urlparse(url)
+        path_list = parsed_url.path.split("/")
+        if len(path_list) > 1 and path_list[1]:
+            path_list[1] = f"{path_list[1]}-lt{run_id}-{idx}"
+        return urlunparse(parsed_url._replace(path="/".join(path_list)))
+
+    body = dict(request.get("body", dict()))
+    if "url" in body:
+        body["url"] = make_cold_url(body["url"])
+    if "urls" in body:
+        body["urls"] = [make_cold_url(url) for url in body["urls"]]
+    return dict(request, body=body)
+
+
+def percentile(sorted_value_list: list, perc: float) -> float:
+    if not sorted_value_list:
+        return 0.0
+    rank = max(0, math.ceil(perc / 100 * len(sorted_value_list)) - 1)
+    return sorted_value_list[rank]
+
+
+def parse_metrics(metrics_text: str) -> dict:
+    """
+    Parses the Prometheus text exposition of the service.
+    :param metrics_text: the text of the /metrics endpoint.
+    :return: a map (metric name, labels) -> value
+    """
+    metric_map = dict()
+    for line in metrics_text.splitlines():
+        match = METRIC_LINE_REGEX.match(line.strip())
+        if match:
+            metric_map[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return metric_map
+
+
+def get_breakdown(metrics_before: dict, metrics_after: dict, metric_name: str) -> list:
+    """
+    Per-label breakdown of a latency histogram over the load test.
+    :param metrics_before: the metrics before the load test.
+    :param metrics_after: the metrics after the load test.
+    :param metric_name: the name of the histogram.
+    :return: a list of (labels, count, mean latency, total latency) sorted by total latency
+    """
+    breakdown_list = list()
+    for (name, labels), count in metrics_after.items():
+        if name != f"{metric_name}_count":
+            continue
+        num_calls = count - metrics_before.get((name, labels), 0)
+        if num_calls <= 0:
+            continue
+        total_time = metrics_after[(f"{metric_name}_sum", labels)] - \
+            metrics_before.get((f"{metric_name}_sum", labels), 0)
+        breakdown_list.append((labels, int(num_calls), total_time / num_calls, total_time))
+    return sorted(breakdown_list, key=lambda x: x[3], reverse=True)
+
+
+async def fetch_metrics(http_client, server_url: str) -> dict:
+    response = await http_client.fetch(f"{server_url}/metrics", raise_error=False)
+    if response.code != 200:
+        return dict()
+    return parse_metrics(response.body.decode("utf-8"))
+
+
+async def wait_for_server(http_client, server_url: str, path: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await http_client.fetch(f"{server_url}{path}", raise_error=False)
+            if response.code == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server not available on {server_url}{path} after {timeout} sec.")
+
+
+def start_server(server_port: int, backends_port: int, mongo_url: str, num_processes: int, work_dir: str):
+    """
+    Starts the real server in a subprocess, pointed at the fake backends.
+    The service reads its credentials from the working directory, so a throwaway one is written there.
+    :return: the server process
+    """
+    credentials = {
+        "mongodb_credential_url": mongo_url,
+        "scrapingbee_key": "fake",
+        "hugging_face_key": "fake",
+        "open_ai_key": "fake",
+    }
+    with open(os.path.join(work_dir, "credentials.yml"), "w") as f:
+        yaml.safe_dump(credentials, f)
+
+    env = dict(os.environ, **get_fake_backends_env(backends_port))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_PATH), env.get("PYTHONPATH")]))
+    server_code = f"from server.server_runner import run_server; run_server({server_port}, {num_processes})"
+    return subprocess.Popen([sys.executable, "-c", server_code], cwd=work_dir, env=env)
+
+
+async def replay_requests(http_client, server_url: str, request_list: list, concurrency: int, rate: float,
+                          timeout: float) -> list:
+    """
+    Replays the requests, at most concurrency at a time and starting rate requests per sec. (0 for no limit).
+    :return: a list of (path, status code, latency) per request
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    start_time = time.monotonic()
+
+    async def send_request(idx: int, request: dict):
+        # Open-loop arrivals at the given rate
+        if rate > 0:
+            await asyncio.sleep(max(0.0, start_time + idx / rate - time.monotonic()))
+        async with semaphore:
+            query = dict(request.get("query", dict()), key=request.get("query", dict()).get("key", SERVICE_KEY))
+            method = request.get("method", "POST").upper()
+            body = json.dumps(request.get("body", dict())) if method == "POST" else None
+            request_start_time = time.perf_counter()
+            try:
+                response = await http_client.fetch(f"{server_url}{request['path']}?{urlencode(query)}",
+                                                   method=method, body=body, raise_error=False,
+                                                   request_timeout=timeout)
+                status_code = response.code
+            except Exception:
+                status_code = 599
+            return request["path"], status_code, time.perf_counter() - request_start_time
+
+    return await asyncio.gather(*[send_request(idx, request) for idx, request in enumerate(request_list)])
+
+
+def print_report(result_list: list, duration: float, metrics_before: dict, metrics_after: dict):
+    latency_list = sorted(latency for _, _, latency in result_list)
+    print(f"\nRequests: {len(result_list)} in {duration:.1f} sec. ({len(result_list) / duration:.2f} req/sec)")
+    print(f"Latency (sec.): p50={percentile(latency_list, 50):.3f} p95={percentile(latency_list, 95):.3f} "
+          f"p99={percentile(latency_list, 99):.3f} max={latency_list[-1]:.3f}")
+
+    print("\nStatus codes per path:")
+    status_map = defaultdict(Counter)
+    for path, status_code, _ in result_list:
+        status_map[path][status_code] += 1
+    for path, status_counter in sorted(status_map.items()):
+        print(f"  {path}: " + ", ".join(f"{code}={num}" for code, num in sorted(status_counter.items())))
+
+    for title, metric_name in [("Pipeline stages", "pipeline_stage_duration_seconds"),
+                               ("External calls", "external_call_duration_seconds")]:
+        print(f"\n{title} (count, mean sec., total sec.):")
+        for labels, num_calls, mean_time, total_time in get_breakdown(metrics_before, metrics_after, metric_name):
+            print(f"  {labels}: {num_calls}, {mean_time:.3f}, {total_time:.1f}")
+
+
+async def run_load_test(args):
+    http_client = tornado.httpclient.AsyncHTTPClient(max_clients=max(args.concurrency, 10))
+
+    # Start the fake backends in this process
+    backends_socket_list = tornado.netutil.bind_sockets(args.backends_port, "127.0.0.1")
+    backends_port = backends_socket_list[0].getsockname()[1]
+    backends_server = tornado.httpserver.HTTPServer(
+        make_fake_backends_app(latency=args.backend_latency, error_rate=args.backend_error_rate))
+    backends_server.add_sockets(backends_socket_list)
+
+    server_process = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            if args.server_url:
+                server_url = args.server_url.rstrip("/")
+            else:
+                server_url = f"http://127.0.0.1:{args.server_port}"
+                server_process = start_server(args.server_port, backends_port, args.mongo_url, args.num_processes,
+                                              work_dir)
+            await wait_for_server(http_client, server_url, "/healthz", args.startup_timeout)
+            if args.wait_ready:
+                await wait_for_server(http_client, server_url, "/readyz", args.startup_timeout)
+
+            run_id = str(int(time.time()))
+            request_list = load_requests(args.requests, args.num_requests)
+            if args.cold:
+                request_list = [make_cold(request, run_id, idx) for idx, request in enumerate(request_list)]
+
+            metrics_before = await fetch_metrics(http_client, server_url)
+            start_time = time.monotonic()
+            result_list = await replay_requests(http_client, server_url, request_list, args.concurrency, args.rate,
+                                                args.request_timeout)
+            duration = time.monotonic() - start_time
+            metrics_after = await fetch_metrics(http_client, server_url)
+            print_report(result_list, duration, metrics_before, metrics_after)
+        finally:
+            if server_process is not None:
+                server_process.terminate()
+                server_process.wait()
+            backends_server.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test of the pro-con service against fake backends")
+    parser.add_argument("--requests", default=str(Path(__file__).resolve().parent / "sample_requests.jsonl"),
+                        help="JSONL log of the requests to replay")
+    parser.add_argument("--num-requests", type=int, default=0,
+                        help="number of requests to send, cycling through the log (0 replays the log once)")
+    parser.add_argument("--concurrency", type=int, default=8, help="max number of requests in flight")
+    parser.add_argument("--rate", type=float, default=0, help="requests started per sec. (0 for no limit)")
+    parser.add_argument("--cold", action="store_true", help="make every product unique to bypass the caches")
+    parser.add_argument("--backend-latency", type=float, default=0.1,
+                        help="mean latency (in sec.) of the fake ScrapingBee/HuggingFace/OpenAI calls")
+    parser.add_argument("--backend-error-rate", type=float, default=0.0,
+                        help="probability of a fake backend call to fail")
+    parser.add_argument("--backends-port", type=int, default=0,
+                        help="port of the fake backends (0 picks a free one)")
+    parser.add_argument("--server-url", default="",
+                        help="load test an already running server instead of starting one, "
+                             "e.g., started with the environment printed by fake_backends.py")
+    parser.add_argument("--server-port", type=int, default=8011)
+    parser.add_argument("--num-processes", type=int, default=1, help="number of server worker processes")
+    parser.add_argument("--mongo-url", default="mongodb://127.0.0.1:27017", help="MongoDB used by the server")
+    parser.add_argument("--no-wait-ready", dest="wait_ready", action="store_false",
+                        help="start the load before the models are loaded")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--request-timeout", type=float, default=600)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(run_load_test(parse_args()))